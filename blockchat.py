@@ -14,6 +14,9 @@ from cli.view import view
 from cli.balance import balance
 from cli.conversations import conversations
 from cli.start_exp import start_exp
+from cli.proof import proof
+from cli.history import history
+from cli.replay import replay
 
 # parser = argparse.ArgumentParser(description='')
 # parser.add_argument('id', type=int, help='Node id')
@@ -32,6 +35,9 @@ class BlockchatCLI(cmd2.Cmd):
         url = os.environ.get("URL")
         port = os.environ.get("PORT")
         self.address = url + ":" + port
+        self.node_id = node_id
+        self.node_num = os.environ.get("NODE_NUM")
+        self.last_message_id = 0
         super().__init__()
         print_logo()
         if not server_check(self.address):
@@ -76,16 +82,55 @@ class BlockchatCLI(cmd2.Cmd):
 
     def do_view(self, arg):
         """View command"""
-        view(self.address)
+        view(self.address, arg.strip())
+
+    def do_history(self, arg):
+        try:
+            args = arg.split()
+            node_id = int(args[0])
+            role = args[1] if len(args) > 1 else "all"
+            after = args[2] if len(args) > 2 else None
+            history(self.address, node_id, role, after)
+        except:
+            print("Usage:")
+            print("  history <node_id> [sent|received|all] [after]   Committed transactions of a node")
+
+    def do_proof(self, arg):
+        """Check that a transaction is committed"""
+        try:
+            args = arg.split()
+            sender_id = int(args[0])
+            nonce = int(args[1])
+            proof(self.address, sender_id, nonce)
+        except:
+            print("Usage:")
+            print("  proof <sender_id> <nonce>       Check that a transaction is committed")
 
     def do_balance(self, args):
         balance(self.address)
 
     def do_chat(self, args):
-        conversations(self.address)
+        # only the messages since the last chat command, unless "all". "wait" waits for new ones
+        args = args.split()
+        since = 0 if "all" in args else self.last_message_id
+        wait = 30 if "wait" in args else 0
+        last_message_id = conversations(self.address, since, wait)
+        if last_message_id == since and since and "wait" not in args:
+            print("No new messages")
+        self.last_message_id = last_message_id
+
+    def do_replay(self, arg):
+        """Send the messages of an input file in one request"""
+        path = arg.strip() or f"{os.path.dirname(os.path.abspath(__file__))}/input_{self.node_num}/trans{self.node_id}.txt"
+        try:
+            replay(self.address, path)
+        except OSError as e:
+            print(f"Could not read {path}: {e}")
+            print("Usage:")
+            print("  replay [file]       Send the messages of an input file (default input_<NODE_NUM>/trans<id>.txt)")
 
     def do_start_exp(self,args):
-        start_exp(self.address)
+        start_exp(self.address, args)
     
 
 if __name__ == "__main__":
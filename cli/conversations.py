@@ -1,10 +1,18 @@
 from server.utils.send_http_request import send_http_request
-import json
 
 
-def conversations(address):
+def conversations(address, since=0, wait=0):
+    """Prints the messages after the id since, and returns the id to ask from next time"""
+    while True:
+        response = send_http_request(
+            "GET", address, "conversations", {"since": since, "limit": 500, "wait": wait}
+        )
+        if response is None:
+            return since
 
-    conversations = send_http_request("GET", address, "conversations", {})[
-        "conversations"
-    ]
-    print(json.dumps(conversations, indent=4))
+        for message in response["messages"]:
+            print(f"[node{message['peer']}] {message['author']}: {message['message']}")
+        since = response["last_id"]
+        if not response["has_more"]:
+            return since
+        wait = 0
@@ -0,0 +1,25 @@
+from server.utils.send_http_request import send_http_request
+
+
+def history(address, node_id, role="all", after=None):
+    params = {"node_id": node_id, "role": role, "limit": 20}
+    if after:
+        params["after"] = after
+    response = send_http_request("GET", address, "transactions", params)
+    if response is None:
+        return
+
+    for entry in response["transactions"]:
+        transaction = entry["transaction"]
+        if transaction["type"] == "message":
+            content = transaction["message"]
+        else:
+            content = f"{transaction['amount']} BCC"
+        print(
+            f"block {entry['block_index']:>6}  {entry['role']:8s}  {transaction['type']:7s}"
+            f"  nonce {transaction['nonce']:>5}  {content}"
+        )
+    if not response["transactions"]:
+        print(f"No transactions of node {node_id}")
+    if response["next"] is not None:
+        print(f"More: history {node_id} {role} {response['next']}")
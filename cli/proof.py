@@ -0,0 +1,30 @@
+from server.utils.send_http_request import send_http_request
+from server.utils.merkle import header_hash, verify_merkle_proof
+from server.models.transaction import Transaction
+
+
+def proof(address, sender_id, nonce):
+    response = send_http_request(
+        "GET", address, "proof", {"sender_id": sender_id, "nonce": nonce}
+    )
+    if response is None:
+        print(f"Transaction ({sender_id}, {nonce}) is not in any block")
+        return
+
+    block = response["block"]
+    transaction = Transaction.from_dict(response["transaction"])
+
+    # the transaction must lead to the Merkle root, and the root to the hash of the block
+    in_tree = verify_merkle_proof(transaction.digest(), response["proof"], block["merkle_root"])
+    header_matches = (
+        header_hash(block["index"], block["timestamp"], block["merkle_root"], block["validator"])
+        == block["current_hash"]
+    )
+
+    if in_tree and header_matches:
+        print(
+            f"Transaction ({sender_id}, {nonce}) is committed in block {block['index']} "
+            f"with hash {block['current_hash']}"
+        )
+    else:
+        print(f"Invalid proof for transaction ({sender_id}, {nonce})")
@@ -0,0 +1,27 @@
+import re
+
+from server.utils.send_http_request import send_http_request
+
+
+def replay(address, path):
+    # sends the messages of an input file ("id<recipient_id> <message>" lines) in one request
+    items = []
+    with open(path, "r") as file:
+        for line in file:
+            match = re.match(r"id(\d+)\s(.+)", line)
+            if match:
+                items.append(
+                    {"type": "message", "body": match.group(2).strip(), "recipient_id": match.group(1)}
+                )
+    if not items:
+        print(f"No transactions in {path}")
+        return
+
+    response = send_http_request("POST", address, "send_transactions", {"transactions": items})
+    if response is None:
+        return
+
+    print(response["status"])
+    for item, result in zip(items, response["results"]):
+        if result["status"] != "success":
+            print(f"  id{item['recipient_id']} {item['body']}: {result['response']}")
@@ -1,9 +1,12 @@
 from server.utils.send_http_request import send_http_request
 
-def start_exp(address):
+def start_exp(address, args=""):
+    # settings as key=value, e.g. mode=open rate=50 concurrency=8 mix=message:0.8,coins:0.2
+    params = dict(arg.split("=", 1) for arg in args.split() if "=" in arg)
 
     print(f" Starting app test")
 
-    response = send_http_request("GET", address, "exp_signal", {})
-    
-    print(response["status"])
+    response = send_http_request("GET", address, "exp_signal", params)
+
+    if response is not None:
+        print(response["status"])
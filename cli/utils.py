@@ -4,8 +4,12 @@ def show_help():
     print("  t <recipient_id> <amount>        Send 'coins' transaction")
     print("  m <recipient_id> <message>       Send 'message' transaction")
     print("  stake <amount>                   Stake a certain amount")
-    print("  view                             View last block")
+    print("  view [index|hash]                View last block, or any block")
+    print("  history <node_id> [role]         Committed transactions of a node")
     print("  balance                          View wallets info")
+    print("  chat [all] [wait]                New messages (all: from the start, wait: wait for new ones)")
+    print("  proof <sender_id> <nonce>        Check that a transaction is in a block")
+    print("  replay [file]                    Send the messages of an input file in one request")
     print("  quit                             Exit app")
     print("  help                             Usage info")
     print("")
@@ -2,32 +2,34 @@ from server.utils.send_http_request import send_http_request
 import json
 
 
-def view(address):
-
-    block = send_http_request("GET", address, "view", {})["last_block"]
+def shorten(key):
+    return key[:10] + "..." + key[-10:]
+
+
+def view(address, block_id=""):
+    # the last block, or the block with this index or hash
+    if not block_id:
+        block = send_http_request("GET", address, "view", {})["last_block"]
+    else:
+        params = {"index": block_id} if block_id.isdigit() else {"hash": block_id}
+        response = send_http_request("GET", address, "block", params)
+        if response is None:
+            print(f"Block {block_id} not found")
+            return
+        block = response["block"]
 
     for transaction in block["transactions"]:
 
         if transaction["receiver_public_key"] != 0:
-            transaction["receiver_public_key"][0] = (
-                transaction["receiver_public_key"][0][:10]
-                + "..."
-                + transaction["receiver_public_key"][0][-10:]
-            )
-
-        transaction["sender_public_key"][0] = (
-            transaction["sender_public_key"][0][:10]
-            + "..."
-            + transaction["sender_public_key"][0][-10:]
-        )
-
-        transaction["signature"] = (
-            transaction["signature"][:10] + "..." + transaction["signature"][-10:]
-        )
-
-    block["validator"][0] = (
-        block["validator"][0][:10] + "..." + block["validator"][0][-10:]
-    )
+            transaction["receiver_public_key"][0] = shorten(transaction["receiver_public_key"][0])
+
+        transaction["sender_public_key"][0] = shorten(str(transaction["sender_public_key"][0]))
+
+        transaction["signature"] = shorten(transaction["signature"])
+
+    # the genesis block has no validator
+    if isinstance(block["validator"], list):
+        block["validator"][0] = shorten(block["validator"][0])
     print(json.dumps(block, indent=4))
     # for key, value in block.items():
     #     print(key, value)
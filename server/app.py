@@ -1,75 +1,189 @@
 import os
-from flask import Flask
+from flask import Flask, jsonify, request
 from dotenv import load_dotenv
 import argparse
 
-from utils.init_utils import init_bootstrap, init_node
+from utils.init_utils import init_bootstrap, init_node, restore_node, create_node_wallet
+from models.block_store import BlockStore
+from utils.broadcast import configure_broadcast
+from utils.gossip import TransactionGossip
+from utils.crypto import start_verification_pool
+from utils.wire import configure_wire
+from utils.serving import configure_serving, serve
+from utils.sync import configure_sync
+from utils.metrics import instrument_app
 
 from internal.home import home_bp
 from internal.send_transaction import send_transaction_bp
+from internal.send_transactions import send_transactions_bp
 from internal.view import view_bp
 from internal.balance import balance_bp
 from internal.conversations import conversations_bp
+from internal.proof import proof_bp
+from internal.propagation import propagation_bp
 from internal.exp_signal import exp_signal_bp
+from internal.metrics import metrics_bp
+from internal.transactions import transactions_bp
+from internal.block import block_bp
 
 from external.talk_to_bootstrap import talk_to_bootstrap_bp
 from external.receive_init_from_bootstrap import receive_init_from_bootstap_bp
 from external.validate_transaction import validate_transaction_bp
+from external.validate_transactions import validate_transactions_bp
 from external.validate_block import validate_block_bp
+from external.blocks import blocks_bp
+from external.add_peer import add_peer_bp
 from external.run_exp import run_exp_bp
 from external.end_exp import end_exp_bp
 
-app = Flask(__name__)
-
-parser = argparse.ArgumentParser(description='')
-parser.add_argument('id', type=int, help='Node id')
-args = parser.parse_args()
+# the blueprints that answer before the node has its State. The others get a 503, like the
+# requests of peers to a node joining a running cluster, until the bootstrap initialized it
+INIT_BLUEPRINTS = {"home", "receiveInitFromBootstrap", "metrics"}
 
 previous_directory_full_path = os.path.dirname(
     os.path.dirname(os.path.abspath(__file__))
 )
-load_dotenv(f"{previous_directory_full_path}/config/config{args.id}.env")
-
-URL = os.environ.get("URL")
-PORT = os.environ.get("PORT")
-CAPACITY = int(os.environ.get("CAPACITY"))
-app.config["capacity"] = CAPACITY
-app.config["bootstrap_addr"] = os.environ.get("BOOTSTRAP_ADDR")
-app.config["node_num"] = int(os.environ.get("NODE_NUM"))
-app.config["is_bootstrap"] = os.environ.get("IS_BOOTSTRAP")
-app.config["node_count"] = 0
-app.config["start_time"] = None
-app.config["times"] = {}
-
-# Internal Blueprints
-app.register_blueprint(home_bp)
-app.register_blueprint(send_transaction_bp)
-app.register_blueprint(exp_signal_bp)
-
-# app.register_blueprint(stake_bp)
-app.register_blueprint(view_bp)
-app.register_blueprint(balance_bp)
-app.register_blueprint(conversations_bp)
-
-# External Blueprints
-if app.config["is_bootstrap"] == "1":
-    app.register_blueprint(talk_to_bootstrap_bp)
-else:
-    app.register_blueprint(receive_init_from_bootstap_bp)
-app.register_blueprint(validate_transaction_bp)
-app.register_blueprint(validate_block_bp)
-app.register_blueprint(run_exp_bp)
-app.register_blueprint(end_exp_bp)
 
 
-if __name__ == "__main__":
+def create_app(env):
+    """Builds the Flask app of a node from its settings, the variables of its config file"""
+    app = Flask(__name__)
+
+    app.config["url"] = env.get("URL")
+    app.config["port"] = env.get("PORT")
+    app.config["capacity"] = int(env.get("CAPACITY"))
+    app.config["bootstrap_addr"] = env.get("BOOTSTRAP_ADDR")
+    app.config["node_num"] = int(env.get("NODE_NUM"))
+    app.config["is_bootstrap"] = env.get("IS_BOOTSTRAP")
+    app.config["node_count"] = 0
+    # the running load test, set by /exp_signal on the bootstrap
+    app.config["exp"] = None
+    app.config["my_state"] = None
+
+    # optional block store: with DATA_DIR set, blocks and state snapshots are kept on disk
+    DATA_DIR = env.get("DATA_DIR")
+    if DATA_DIR:
+        app.config["block_store"] = BlockStore(
+            os.path.join(previous_directory_full_path, DATA_DIR),
+            fsync_every=int(env.get("FSYNC_EVERY", 16)),
+        )
+    else:
+        app.config["block_store"] = None
+    app.config["snapshot_interval"] = int(env.get("SNAPSHOT_INTERVAL", 100))
+    app.config["conversation_retention"] = int(env.get("CONVERSATION_RETENTION", 1000))
+
+    # these settings are shared by the nodes of one process
+    configure_broadcast(
+        timeout=float(env.get("BROADCAST_TIMEOUT", 0.05)),
+        retries=int(env.get("BROADCAST_RETRIES", 0)),
+        backoff=float(env.get("BROADCAST_BACKOFF", 0.01)),
+        workers=int(env.get("BROADCAST_WORKERS", 16)),
+    )
+    configure_wire(env.get("WIRE_FORMAT", "json"))
+    configure_serving(
+        mode=env.get("SERVER_MODE", "dev"),
+        threads=int(env.get("SERVER_THREADS", 16)),
+        connection_limit=int(env.get("SERVER_CONNECTION_LIMIT", 1000)),
+        keepalive=int(env.get("SERVER_KEEPALIVE", 120)),
+        backlog=int(env.get("SERVER_BACKLOG", 1024)),
+    )
+    configure_sync(
+        batch_size=int(env.get("SYNC_BATCH_SIZE", 200)),
+        timeout=float(env.get("SYNC_TIMEOUT", 2.0)),
+    )
+    # requests with a larger body are rejected with 413
+    app.config["MAX_CONTENT_LENGTH"] = int(env.get("MAX_CONTENT_LENGTH", 64 * 1024 * 1024))
+    app.config["transaction_gossip"] = TransactionGossip(
+        batch_size=int(env.get("GOSSIP_BATCH_SIZE", 1)),
+        batch_window=float(env.get("GOSSIP_BATCH_WINDOW", 0.01)),
+    )
 
+    # Internal Blueprints
+    app.register_blueprint(home_bp)
+    app.register_blueprint(send_transaction_bp)
+    app.register_blueprint(send_transactions_bp)
+    app.register_blueprint(exp_signal_bp)
+
+    # app.register_blueprint(stake_bp)
+    app.register_blueprint(view_bp)
+    app.register_blueprint(balance_bp)
+    app.register_blueprint(conversations_bp)
+    app.register_blueprint(proof_bp)
+    app.register_blueprint(propagation_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(transactions_bp)
+    app.register_blueprint(block_bp)
+
+    # External Blueprints
     if app.config["is_bootstrap"] == "1":
-        my_state = init_bootstrap(URL, PORT, app.config["node_num"], CAPACITY)
+        app.register_blueprint(talk_to_bootstrap_bp)
+    else:
+        app.register_blueprint(receive_init_from_bootstap_bp)
+    app.register_blueprint(validate_transaction_bp)
+    app.register_blueprint(validate_transactions_bp)
+    app.register_blueprint(validate_block_bp)
+    app.register_blueprint(blocks_bp)
+    app.register_blueprint(add_peer_bp)
+    app.register_blueprint(run_exp_bp)
+    app.register_blueprint(end_exp_bp)
+
+    instrument_app(app)
+
+    @app.before_request
+    def wait_for_state():
+        if app.config["my_state"] is None and request.blueprint not in INIT_BLUEPRINTS:
+            response_data = {"status": "failed", "error": "The node is not initialized yet"}
+            return jsonify(response_data), 503
+
+    return app
+
+
+def start_node(app):
+    """
+    Restores the State of the node from its block store, or creates it: the bootstrap creates
+    the genesis block and the other nodes register with the bootstrap, which sends them the
+    State once every node of the genesis registered
+    """
+    URL = app.config["url"]
+    PORT = app.config["port"]
+    CAPACITY = app.config["capacity"]
+
+    restored_state = None
+    if app.config["block_store"] is not None:
+        restored_state = restore_node(app.config["block_store"], CAPACITY)
+
+    if restored_state is not None:
+        restored_state.snapshot_interval = app.config["snapshot_interval"]
+        restored_state.conversations.retention = app.config["conversation_retention"]
+        app.config["my_state"] = restored_state
+        app.config["my_wallet"] = restored_state.my_wallet
+        app.config["node_count"] = len(restored_state.wallets) - 1
+    elif app.config["is_bootstrap"] == "1":
+        my_state = init_bootstrap(
+            URL, PORT, app.config["node_num"], CAPACITY, app.config["block_store"]
+        )
+        my_state.snapshot_interval = app.config["snapshot_interval"]
+        my_state.conversations.retention = app.config["conversation_retention"]
         app.config["my_state"] = my_state
     else:
         app.config["my_state"] = None
-        my_wallet = init_node(URL, PORT, app.config["bootstrap_addr"])
+        # the bootstrap may send the blockchain before /talkToBootstrap returns
+        my_wallet = create_node_wallet(URL, PORT)
         app.config["my_wallet"] = my_wallet
+        init_node(my_wallet, app.config["bootstrap_addr"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='')
+    parser.add_argument('id', type=int, help='Node id')
+    parser.add_argument('--config-dir', default='config', help='Folder of the config files, relative to the project folder')
+    args = parser.parse_args()
+
+    load_dotenv(f"{previous_directory_full_path}/{args.config_dir}/config{args.id}.env")
+
+    app = create_app(os.environ)
+    # forked before start_node creates the threads of the node (propagator, broadcast, gossip)
+    start_verification_pool(int(os.environ.get("VERIFY_WORKERS", os.cpu_count() or 1)))
+    start_node(app)
 
-    app.run(debug=False, host=URL, port=PORT)
+    serve(app, app.config["url"], app.config["port"])
@@ -0,0 +1,106 @@
+# Join time and peak memory of a node initialized by the bootstrap, for growing chains:
+# the single JSON body of /receiveInitFromBootstrap, with every block, versus the NDJSON
+# stream, with the snapshot of the head and the blocks after it. Both receivers keep their
+# blocks in a block store.
+# Run from the server directory: python -m benchmarks.bootstrap
+import io
+import json
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from models.block import Block
+from models.block_store import BlockStore
+from models.blockchain import Blockchain
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+from utils.init_stream import encode_stream, init_lines, iter_lines, receive_init_stream
+
+NODE_NUM = 5
+CAPACITY = 10
+
+
+def build_state(block_count, block_store):
+    public_keys = [[hex(2**2047 + i), hex(65537)] for i in range(NODE_NUM)]
+    wallets = [
+        PublicWallet(i, f"127.0.0.1:{3000 + i}", public_keys[i], 10**9)
+        for i in range(NODE_NUM)
+    ]
+    blockchain = Blockchain([], CAPACITY, block_store)
+    blockchain.add_block(Block(0, time.time(), [], 0, 1))
+    my_wallet = SimpleNamespace(node_id=0, public_key=public_keys[0], node_address="127.0.0.1:3000")
+    state = State(blockchain, wallets, NODE_NUM, my_wallet)
+    nonce = 0
+    for index in range(1, block_count + 1):
+        transactions = []
+        for i in range(CAPACITY):
+            transactions.append(
+                Transaction(
+                    public_keys[i % NODE_NUM],
+                    public_keys[(i + 1) % NODE_NUM],
+                    "message",
+                    0,
+                    f"message {nonce}",
+                    nonce,
+                    hex(2**2047 + nonce),
+                )
+            )
+            nonce += 1
+        last_block = blockchain.block_list[-1]
+        blockchain.add_block(
+            Block(index, time.time(), transactions, public_keys[1], last_block.current_hash)
+        )
+    return state
+
+
+def join_with_body(state, directory):
+    body = json.dumps(
+        {
+            "blockchain": state.blockchain.to_dict(),
+            "wallets": state.wallets_serialization(),
+            "capacity": CAPACITY,
+        }
+    ).encode("utf-8")
+    data = json.loads(body)
+    blockchain = Blockchain.from_dict(data["blockchain"], CAPACITY, BlockStore(directory))
+    wallets = State.wallets_deserialization(data["wallets"])
+    return State(blockchain, wallets, NODE_NUM, SimpleNamespace(node_id=1))
+
+
+def join_with_stream(state, directory):
+    # the sender's chunks are read back as the receiver's request stream
+    class ChunkStream:
+        def __init__(self, chunks):
+            self.chunks = chunks
+
+        def read(self, size):
+            return next(self.chunks, b"")
+
+    stream = ChunkStream(encode_stream(init_lines(state)))
+    return receive_init_stream(
+        iter_lines(stream), NODE_NUM, SimpleNamespace(node_id=1), BlockStore(directory)
+    )
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    for block_count in [100, 1000, 5000]:
+        with tempfile.TemporaryDirectory() as directory:
+            state = build_state(block_count, BlockStore(f"{directory}/bootstrap"))
+            body_time, body_peak = measure(join_with_body, state, f"{directory}/body")
+            stream_time, stream_peak = measure(join_with_stream, state, f"{directory}/node")
+        print(
+            f"blocks={block_count:5d}  body: {body_time:6.2f} s {body_peak / 2**20:7.1f} MB"
+            f"  stream: {stream_time:6.2f} s {stream_peak / 2**20:7.1f} MB"
+        )
@@ -0,0 +1,129 @@
+# Admission throughput and torn reads while blocks are applied and the read endpoints are polled.
+# Run from the server directory: python -m benchmarks.concurrency
+#
+# "live" reads the wallets like /balance used to, without a lock. "locked" makes every read
+# take the state locks, as one global lock would. "view" reads the published StateView.
+# The money of all wallets (amounts plus stakes) is constant, so a read that sees another
+# total (beyond float rounding) saw a block half applied.
+import threading
+import time
+from types import SimpleNamespace
+
+from models.block import Block
+from models.blockchain import Blockchain
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+
+NODE_NUM = 10
+CAPACITY = 10
+WRITERS = 4
+READERS = 4
+DURATION = 2.0
+
+
+def build_state():
+    public_keys = [[hex(2**2047 + i), hex(65537)] for i in range(NODE_NUM)]
+    wallets = [
+        PublicWallet(i, f"127.0.0.1:{3000 + i}", public_keys[i], 10**9)
+        for i in range(NODE_NUM)
+    ]
+    blockchain = Blockchain([Block(0, time.time(), [], 0, 1)], CAPACITY)
+    my_wallet = SimpleNamespace(node_id=0, public_key=public_keys[0])
+    state = State(blockchain, wallets, NODE_NUM, my_wallet)
+    # blocks are applied by apply_blocks below, as if they came from another validator
+    state.waiting_for_block = -1
+    return state, public_keys
+
+
+def total_money(wallets):
+    return sum(wallet["hard_amount"] + wallet["hard_stake"] for wallet in wallets)
+
+
+def run(mode, read_interval):
+    state, public_keys = build_state()
+    expected_total = total_money(state.wallets_serialization())
+    stop = threading.Event()
+    # one counter per thread, summed at the end
+    admitted = [0] * WRITERS
+    reads = [0] * READERS
+    torn = [0] * READERS
+    counts = {"blocks": 0}
+
+    def admit(writer_id):
+        nonce = 0
+        sender_id = writer_id
+        while not stop.is_set():
+            transaction = Transaction(
+                public_keys[sender_id],
+                public_keys[(sender_id + 1 + nonce) % NODE_NUM],
+                "coins",
+                1,
+                "",
+                nonce,
+            )
+            nonce += 1
+            with state.mempool_lock:
+                state.validate_transaction(transaction, check_signature=False)
+            state.finish_admission()
+            admitted[writer_id] += 1
+
+    def apply_blocks():
+        while not stop.is_set():
+            with state.chain_lock:
+                with state.mempool_lock:
+                    transactions = list(state.blockchain.transaction_inbox.values())[:CAPACITY]
+                    if len(transactions) == CAPACITY:
+                        last_block = state.blockchain.block_list[-1]
+                        block = Block(
+                            last_block.index + 1,
+                            time.time(),
+                            transactions,
+                            public_keys[1],
+                            last_block.current_hash,
+                        )
+                        state.add_block(block)
+                        state.update_state(block)
+                        counts["blocks"] += 1
+            time.sleep(0.001)
+
+    def read(reader_id):
+        while not stop.is_set():
+            if mode == "view":
+                wallets = state.view.wallets
+            elif mode == "locked":
+                with state.chain_lock:
+                    with state.mempool_lock:
+                        wallets = state.wallets_serialization()
+            else:
+                wallets = state.wallets_serialization()
+            if abs(total_money(wallets) - expected_total) > 0.01:
+                torn[reader_id] += 1
+            reads[reader_id] += 1
+            if read_interval:
+                time.sleep(read_interval)
+
+    threads = [threading.Thread(target=admit, args=(i,)) for i in range(WRITERS)]
+    threads.append(threading.Thread(target=apply_blocks))
+    threads += [threading.Thread(target=read, args=(i,)) for i in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    counts.update(admitted=sum(admitted), reads=sum(reads), torn=sum(torn))
+    return counts
+
+
+if __name__ == "__main__":
+    # readers polling as fast as they can, then every 0.5 ms
+    for read_interval in [0, 0.0005]:
+        for mode in ["live", "locked", "view"]:
+            counts = run(mode, read_interval)
+            print(
+                f"{mode:6s}  admitted: {counts['admitted'] / DURATION:8.0f}/s"
+                f"  blocks: {counts['blocks'] / DURATION:6.0f}/s"
+                f"  reads: {counts['reads'] / DURATION:8.0f}/s"
+                f"  torn reads: {counts['torn']}"
+            )
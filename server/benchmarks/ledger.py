@@ -0,0 +1,57 @@
+# Cost of applying the transfers of a block to the Ledger, in Python and with NumPy (when
+# installed), and of State.update_state for blocks of 1000 transactions.
+# Run from the server directory: python -m benchmarks.ledger
+import random
+import time
+
+from models import ledger as ledger_module
+from models.ledger import Ledger
+from benchmarks.mempool import build_state
+import benchmarks.mempool as mempool_benchmark
+
+NODE_NUM = 100
+BLOCK_SIZE = 1000
+ROUNDS = 200
+
+
+def random_transfers(count):
+    senders, receivers, totals, fees = Ledger.transfer_columns()
+    for _ in range(count):
+        senders.append(random.randrange(NODE_NUM))
+        receivers.append(random.randrange(NODE_NUM))
+        totals.append(random.randint(1, 100))
+        fees.append(totals[-1] * 0.3)
+    return senders, receivers, totals, fees
+
+
+def time_transfers(transfers, use_numpy):
+    ledger = Ledger(NODE_NUM)
+    saved = ledger_module.NUMPY_MIN_TRANSFERS
+    ledger_module.NUMPY_MIN_TRANSFERS = 0 if use_numpy else float("inf")
+    try:
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            ledger.apply_transfers(*transfers, 0)
+        elapsed = (time.perf_counter() - start) / ROUNDS
+    finally:
+        ledger_module.NUMPY_MIN_TRANSFERS = saved
+    return elapsed, list(ledger.hard_amount)
+
+
+if __name__ == "__main__":
+    random.seed(1)
+    transfers = random_transfers(BLOCK_SIZE)
+    python_time, python_amounts = time_transfers(transfers, use_numpy=False)
+    print(f"apply_transfers, {BLOCK_SIZE} transfers, Python: {python_time * 1e6:.1f} us/block")
+    if ledger_module.numpy is not None:
+        numpy_time, numpy_amounts = time_transfers(transfers, use_numpy=True)
+        print(f"apply_transfers, {BLOCK_SIZE} transfers, NumPy:  {numpy_time * 1e6:.1f} us/block")
+        print(f"same balances: {python_amounts == numpy_amounts}")
+    else:
+        print("NumPy is not installed")
+
+    mempool_benchmark.CAPACITY = BLOCK_SIZE
+    mempool_benchmark.BLOCKS = 5
+    state = build_state(BLOCK_SIZE)
+    mint, update = mempool_benchmark.time_blocks(state)
+    print(f"update_state, {BLOCK_SIZE} transactions: {update * 1000:.3f} ms/block")
@@ -0,0 +1,143 @@
+# Per-block cost of State.mint_block and State.update_state as the transaction inbox grows.
+# Run from the server directory: python -m benchmarks.mempool
+#
+# The wallets start with about as many coins as their transactions cost, so some are rejected
+# on admission. Every FOREIGN_EVERY-th block comes from another validator and holds large
+# transfers this node never saw, which drop pending transactions of their senders and of the
+# receivers that counted on them. After every block the inbox is checked against a replay on
+# the hard amounts.
+import random
+import time
+from types import SimpleNamespace
+
+from models.block import Block
+from models.blockchain import Blockchain
+from models.ledger import round_amount
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+
+NODE_NUM = 10
+CAPACITY = 10
+BLOCKS = 20
+FOREIGN_EVERY = 4
+# share of the transactions kept out of the inbox, for the blocks of the other validator
+FOREIGN_SHARE = 0.05
+
+
+def build_state(inbox_size):
+    generator = random.Random(1)
+    funds = inbox_size + 1000
+    public_keys = [[hex(2**2047 + i), hex(65537)] for i in range(NODE_NUM)]
+    wallets = [
+        PublicWallet(i, f"127.0.0.1:{3000 + i}", public_keys[i], funds)
+        for i in range(NODE_NUM)
+    ]
+    blockchain = Blockchain([Block(0, time.time(), [], 0, 1)], CAPACITY)
+    my_wallet = SimpleNamespace(node_id=0, public_key=public_keys[0])
+    state = State(blockchain, wallets, NODE_NUM, my_wallet)
+    # keep block_val_process out of the measurement
+    state.waiting_for_block = -1
+    state.foreign_transactions = []
+    state.rejected = 0
+
+    nonces = [0] * NODE_NUM
+    for i in range(inbox_size + BLOCKS * CAPACITY):
+        sender_id = generator.randrange(NODE_NUM)
+        receiver_id = (sender_id + generator.randrange(1, NODE_NUM)) % NODE_NUM
+        if generator.random() < 0.5:
+            type, amount, message = "message", 0, f"message {i}"
+        else:
+            type, amount, message = "coins", generator.randint(1, 20), ""
+        foreign = generator.random() < FOREIGN_SHARE
+        if foreign:
+            type, amount, message = "coins", funds // 4, ""
+        transaction = Transaction(
+            public_keys[sender_id], public_keys[receiver_id], type, amount, message, nonces[sender_id]
+        )
+        if foreign:
+            state.foreign_transactions.append(transaction)
+        elif not state.validate_transaction(transaction, check_signature=False)[0]:
+            state.rejected += 1
+            continue
+        nonces[sender_id] += 1
+    return state
+
+
+def foreign_block(state):
+    # the next foreign transactions that fit on the hard amounts, as their validator checked.
+    # block_budget credits the fees to this node, so it signs the block too
+    fits = state.block_budget()
+    transactions = []
+    while state.foreign_transactions and len(transactions) < state.blockchain.capacity:
+        transaction = state.foreign_transactions.pop(0)
+        state.resolve_ids(transaction)
+        if fits(transaction):
+            transactions.append(transaction)
+    last_block = state.blockchain.block_list[-1]
+    return Block(
+        last_block.index + 1, time.time(), transactions, state.my_wallet.public_key, last_block.current_hash
+    )
+
+
+def check_inbox(state):
+    """The hard amounts are not negative, the mempool holds the inbox, and the inbox replayed
+    in arrival order on the hard amounts is valid and gives the soft amounts"""
+    ledger = state.ledger
+    assert min(ledger.hard_amount) >= 0, "negative hard amount"
+    inbox = state.blockchain.transaction_inbox
+    assert set(state.mempool.transactions) == set(inbox), "the mempool does not hold the inbox"
+    for chain in state.mempool.chains.values():
+        assert all(a < b for a, b in zip(chain, list(chain)[1:])), "nonces out of order"
+    amounts = list(ledger.hard_amount)
+    stakes = list(ledger.hard_stake)
+    for (sender_id, _), transaction in inbox.items():
+        total_amount = transaction.total_amount
+        if transaction.type == "stake":
+            assert amounts[sender_id] + stakes[sender_id] > total_amount, "invalid pending stake"
+            amounts[sender_id] = round_amount(amounts[sender_id] + stakes[sender_id] - total_amount)
+            stakes[sender_id] = total_amount
+        else:
+            assert total_amount <= amounts[sender_id], "invalid pending transaction"
+            amounts[sender_id] = round_amount(amounts[sender_id] - total_amount)
+            receiver_id = transaction.receiver_id
+            amounts[receiver_id] = round_amount(amounts[receiver_id] + total_amount - transaction.fees)
+    assert amounts == list(ledger.soft_amount), "soft amounts differ from a replay"
+    assert stakes == list(ledger.soft_stake), "soft stakes differ from a replay"
+
+
+def time_blocks(state, check=False):
+    mint_elapsed = 0
+    update_elapsed = 0
+    # transactions that left the inbox without being committed
+    state.dropped = 0
+    for block_number in range(1, BLOCKS + 1):
+        if block_number % FOREIGN_EVERY == 0 and state.foreign_transactions:
+            block = foreign_block(state)
+        else:
+            start = time.perf_counter()
+            block = state.mint_block()
+            mint_elapsed += time.perf_counter() - start
+        inbox = state.blockchain.transaction_inbox
+        committed = sum(state.transaction_unique_id(transaction) in inbox for transaction in block.transactions)
+        inbox_size = len(inbox)
+        start = time.perf_counter()
+        state.add_block(block)
+        state.update_state(block)
+        update_elapsed += time.perf_counter() - start
+        state.dropped += inbox_size - committed - len(inbox)
+        if check:
+            check_inbox(state)
+    return mint_elapsed / BLOCKS, update_elapsed / BLOCKS
+
+
+if __name__ == "__main__":
+    for inbox_size in [100, 1000, 5000, 20000]:
+        state = build_state(inbox_size)
+        mint, update = time_blocks(state)
+        time_blocks(build_state(inbox_size), check=True)
+        print(
+            f"inbox={inbox_size:6d}  mint_block: {mint * 1000:.3f} ms/block"
+            f"  update_state: {update * 1000:.3f} ms/block"
+            f"  rejected: {state.rejected}  dropped: {state.dropped}  (checked)"
+        )
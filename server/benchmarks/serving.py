@@ -0,0 +1,119 @@
+# Requests per second on the gossip endpoints, Flask's development server versus waitress.
+# Run from the server directory: python -m benchmarks.serving
+#
+# The server runs in its own process with a State of two wallets, and CLIENTS threads post
+# signed transactions to /validateTransaction (one per request) and /validateTransactions
+# (BATCH_SIZE per request), each over a keep-alive requests.Session.
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+
+import requests
+from Crypto.PublicKey import RSA
+from flask import Flask
+
+from models.block import Block
+from models.blockchain import Blockchain
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+from utils.crypto import PrivateKey, sign_digest
+from utils.serving import configure_serving, create_server
+
+HOST = "127.0.0.1"
+PORT = 5999
+CLIENTS = 16
+TRANSACTIONS = 2000
+BATCH_SIZE = 20
+
+
+def run_server(mode, public_keys):
+    from external.validate_transaction import validate_transaction_bp
+    from external.validate_transactions import validate_transactions_bp
+
+    wallets = [
+        PublicWallet(i, f"{HOST}:{PORT + i}", public_key, 10**9)
+        for i, public_key in enumerate(public_keys)
+    ]
+    blockchain = Blockchain([Block(0, time.time(), [], 0, 1)], 10**9)
+    my_wallet = SimpleNamespace(node_id=1, public_key=public_keys[1], node_address=f"{HOST}:{PORT + 1}")
+    state = State(blockchain, wallets, len(wallets), my_wallet)
+    state.waiting_for_block = -1  # no block is ever closed
+
+    app = Flask(__name__)
+    app.config["my_state"] = state
+    app.register_blueprint(validate_transaction_bp)
+    app.register_blueprint(validate_transactions_bp)
+
+    configure_serving(mode=mode)
+    create_server(app, HOST, PORT).run()
+
+
+def build_transactions():
+    # a 1024 bit key keeps the setup short, verification costs about the same
+    keys = [RSA.generate(bits=1024) for _ in range(2)]
+    public_keys = [[hex(key.n), hex(key.e)] for key in keys]
+    private_key = PrivateKey(keys[0].n, keys[0].d, keys[0].p, keys[0].q)
+    transactions = []
+    for nonce in range(TRANSACTIONS):
+        transaction = Transaction(public_keys[0], public_keys[1], "coins", 1, "", nonce)
+        transaction.signature = sign_digest(transaction.digest(), private_key)
+        transactions.append(transaction.to_dict())
+    return public_keys, transactions
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            requests.get(f"http://{HOST}:{PORT}/", timeout=0.1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+
+
+def load(endpoint, payloads):
+    # every client thread posts its share of the payloads
+    def client(client_id):
+        session = requests.Session()
+        for payload in payloads[client_id::CLIENTS]:
+            session.post(f"http://{HOST}:{PORT}/{endpoint}", json=payload)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(payloads) / (time.perf_counter() - start)
+
+
+def run(mode, public_keys, transactions):
+    results = {}
+    for endpoint, payloads in (
+        ("validateTransaction", [{"transaction": transaction} for transaction in transactions]),
+        (
+            "validateTransactions",
+            [
+                {"transactions": transactions[i : i + BATCH_SIZE]}
+                for i in range(0, len(transactions), BATCH_SIZE)
+            ],
+        ),
+    ):
+        server = multiprocessing.Process(target=run_server, args=(mode, public_keys), daemon=True)
+        server.start()
+        wait_for_server()
+        results[endpoint] = load(endpoint, payloads)
+        server.terminate()
+        server.join()
+    return results
+
+
+if __name__ == "__main__":
+    public_keys, transactions = build_transactions()
+    for mode in ["dev", "waitress"]:
+        results = run(mode, public_keys, transactions)
+        print(
+            f"{mode:8s}  /validateTransaction: {results['validateTransaction']:7.0f} req/s"
+            f"  /validateTransactions (x{BATCH_SIZE}): {results['validateTransactions']:7.0f} req/s"
+        )
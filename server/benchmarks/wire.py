@@ -0,0 +1,57 @@
+# Bytes on the wire and decode time of a block, JSON versus the binary wire format.
+# Run from the server directory: python -m benchmarks.wire
+import json
+import time
+
+from models.block import Block
+from models.wallet import PrivateWallet
+from utils.wire import decode_block, encode_block
+
+NODE_NUM = 5
+CAPACITY = 20
+RUNS = 200
+
+
+def build_block():
+    wallets = [PrivateWallet(i, f"127.0.0.1:{3000 + i}") for i in range(NODE_NUM)]
+    transactions = []
+    for i in range(CAPACITY):
+        sender, receiver = wallets[i % NODE_NUM], wallets[(i + 1) % NODE_NUM]
+        if i % 2:
+            transaction = sender.create_transaction(
+                sender.public_key, receiver.public_key, "coins", 10 + i, "", i
+            )
+        else:
+            transaction = sender.create_transaction(
+                sender.public_key, receiver.public_key, "message", 0, f"message {i}", i
+            )
+        transactions.append(transaction)
+    block = Block(1, time.time(), transactions, wallets[0].public_key, "ab" * 32)
+    return block, wallets
+
+
+def time_per_run(function, repeats=5):
+    # the best of a few repeats, the others being slowed down by the rest of the machine
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            function()
+        best = min(best, (time.perf_counter() - start) / RUNS)
+    return best
+
+
+if __name__ == "__main__":
+    block, wallets = build_block()
+    key_to_node_id = {tuple(wallet.public_key): wallet.node_id for wallet in wallets}
+
+    json_bytes = json.dumps({"block": block.to_dict()}).encode("utf-8")
+    binary_bytes = encode_block(block, key_to_node_id)
+    assert decode_block(binary_bytes, wallets).to_dict() == block.to_dict()
+
+    json_decode = time_per_run(lambda: Block.from_dict(json.loads(json_bytes)["block"]))
+    binary_decode = time_per_run(lambda: decode_block(binary_bytes, wallets))
+
+    print(f"block of {CAPACITY} transactions")
+    print(f"json:   {len(json_bytes):7d} bytes  decode {json_decode * 1e6:8.1f} us")
+    print(f"binary: {len(binary_bytes):7d} bytes  decode {binary_decode * 1e6:8.1f} us")
@@ -0,0 +1,183 @@
+# Runs a whole cluster on one machine, and optionally a load test on it (see utils/run_exp.py).
+# Run from the server directory:
+#   python cluster.py 10                                  10 nodes in this process, in-memory transport
+#   python cluster.py 10 --transport http                 one app.py process per node, on loopback ports
+#   python cluster.py 50 --exp "mode=open rate=20 count=200"    with a load test, results in ../runs
+# The config files of the nodes are generated in ../cluster (config{id}.env, with the logs of the
+# node processes), from the options and the --set KEY=VALUE settings.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from app import create_app, start_node, previous_directory_full_path
+from utils.broadcast import get_session
+from utils.crypto import start_verification_pool
+from utils.transport import register_local_node
+
+CLUSTER_DIR = "cluster"  # relative to the project folder
+HOST = "127.0.0.1"
+
+
+def node_settings(node_id, node_num, capacity, base_port, extra=None):
+    settings = {
+        "IS_BOOTSTRAP": "1" if node_id == 0 else "0",
+        "URL": HOST,
+        "PORT": str(base_port + node_id),
+        "BOOTSTRAP_ADDR": f"{HOST}:{base_port}",
+        "NODE_NUM": str(node_num),
+        "CAPACITY": str(capacity),
+    }
+    settings.update(extra or {})
+    return settings
+
+
+def write_configs(node_num, capacity, base_port, extra=None, folder=CLUSTER_DIR):
+    path = os.path.join(previous_directory_full_path, folder)
+    os.makedirs(path, exist_ok=True)
+    for node_id in range(node_num):
+        settings = node_settings(node_id, node_num, capacity, base_port, extra)
+        with open(os.path.join(path, f"config{node_id}.env"), "w") as f:
+            for key, value in settings.items():
+                f.write(f"{key}={value}\n")
+    return path
+
+
+def is_ready(address):
+    # / answers 200 once the node has its State, 503 before
+    try:
+        return get_session(address).get(f"http://{address}/", timeout=1).status_code == 200
+    except Exception:
+        return False
+
+
+def wait_ready(addresses, timeout):
+    deadline = time.time() + timeout
+    pending = list(addresses)
+    while pending:
+        pending = [address for address in pending if not is_ready(address)]
+        if pending and time.time() > deadline:
+            raise TimeoutError(f"Nodes {pending} did not start in {timeout} seconds")
+        time.sleep(0.1)
+
+
+class LocalCluster:
+    """Every node is a Flask app of this process, and they talk over the in-memory transport"""
+
+    def __init__(self, node_num, capacity, base_port, extra=None):
+        self.settings = [
+            node_settings(node_id, node_num, capacity, base_port, extra) for node_id in range(node_num)
+        ]
+        self.addresses = [f"{HOST}:{settings['PORT']}" for settings in self.settings]
+        self.apps = []
+
+    def start(self, timeout):
+        # the workers of the pool are forked before the nodes create their threads and locks
+        start_verification_pool(int(self.settings[0].get("VERIFY_WORKERS", os.cpu_count() or 1)))
+        # all the addresses are known before the nodes register with the bootstrap
+        for settings, address in zip(self.settings, self.addresses):
+            app = create_app(settings)
+            register_local_node(address, app)
+            self.apps.append(app)
+        for app in self.apps:
+            start_node(app)
+        wait_ready(self.addresses, timeout)
+
+    def stop(self):
+        pass
+
+
+class ProcessCluster:
+    """Every node is an app.py process serving on a loopback port"""
+
+    def __init__(self, node_num, capacity, base_port, extra=None):
+        self.node_num = node_num
+        self.folder = write_configs(node_num, capacity, base_port, extra)
+        self.addresses = [f"{HOST}:{base_port + node_id}" for node_id in range(node_num)]
+        self.processes = []
+
+    def spawn(self, node_id):
+        log = open(os.path.join(self.folder, f"node{node_id}.log"), "w")
+        self.processes.append(
+            subprocess.Popen(
+                [sys.executable, "app.py", str(node_id), "--config-dir", CLUSTER_DIR],
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        )
+
+    def start(self, timeout):
+        # the bootstrap serves before the other nodes register with it
+        self.spawn(0)
+        wait_ready(self.addresses[:1], timeout)
+        for node_id in range(1, self.node_num):
+            self.spawn(node_id)
+        wait_ready(self.addresses, timeout)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+
+def run_exp(bootstrap_addr, params, timeout):
+    """Starts a load test from the bootstrap and waits for the .json results it writes"""
+    params = dict(params)
+    params.setdefault("name", f"Cluster-{time.strftime('%Y%m%d-%H%M%S')}")
+    results_path = os.path.join(previous_directory_full_path, "runs", params["name"] + ".json")
+    start = time.time()
+
+    response = get_session(bootstrap_addr).get(f"http://{bootstrap_addr}/exp_signal", params=params)
+    if response.status_code != 200:
+        raise RuntimeError(response.json()["status"])
+
+    deadline = start + timeout
+    while not (os.path.exists(results_path) and os.path.getmtime(results_path) >= start):
+        if time.time() > deadline:
+            raise TimeoutError(f"The load test did not finish in {timeout} seconds")
+        time.sleep(0.2)
+    with open(results_path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a cluster of nodes on this machine")
+    parser.add_argument("node_num", type=int, help="Number of nodes")
+    parser.add_argument("--capacity", type=int, default=5, help="Transactions per block")
+    parser.add_argument("--transport", choices=["local", "http"], default="local")
+    parser.add_argument("--base-port", type=int, default=5000, help="Port of the bootstrap, the next nodes use the next ports")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="Extra config setting of every node")
+    parser.add_argument("--exp", help='Load test settings, as for start_exp, e.g. "mode=open rate=20"')
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds for the start and for the load test")
+    args = parser.parse_args()
+
+    extra = dict(setting.split("=", 1) for setting in args.set)
+    cluster_class = LocalCluster if args.transport == "local" else ProcessCluster
+    cluster = cluster_class(args.node_num, args.capacity, args.base_port, extra)
+
+    start = time.time()
+    try:
+        cluster.start(args.timeout)
+        print(f"{args.node_num} nodes started in {time.time() - start:.1f} seconds")
+
+        if args.exp is not None:
+            params = dict(arg.split("=", 1) for arg in args.exp.split() if "=" in arg)
+            summary = run_exp(cluster.addresses[0], params, args.timeout)
+            latency = summary["commit_latency"]
+            print(
+                f"Committed {summary['committed']} of {summary['submitted']} transactions:"
+                f" {summary['throughput']:.1f} transactions/second (sustained {summary['sustained_tps']:.1f}),"
+                f" commit latency p50 {latency['p50']} s, p99 {latency['p99']} s"
+            )
+            print("Results in ../runs/" + summary["name"] + ".{txt,json,csv}")
+        else:
+            print("Press Ctrl-C to stop the cluster")
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
@@ -0,0 +1,45 @@
+from flask import Blueprint, current_app, request, jsonify
+
+from utils.sync import fetch_peers
+
+add_peer_bp = Blueprint("addPeer", __name__)
+
+
+# the bootstrap announces a node that joined the running cluster
+@add_peer_bp.route("/addPeer", methods=["POST"])
+def add_peer():
+    my_state = current_app.config["my_state"]
+    data = request.json
+
+    if data["node_id"] > len(my_state.wallets):
+        # this node missed the announcement of a node that joined before
+        fetch_peers(my_state)
+    else:
+        my_state.add_peers([data])
+
+    response_data = {"status": "success"}
+    return jsonify(response_data), 200
+
+
+# the nodes that joined after node_id, for the nodes that missed their announcement
+@add_peer_bp.route("/peers", methods=["GET"])
+def peers():
+    my_state = current_app.config["my_state"]
+    try:
+        after = int(request.args.get("after", -1))
+    except ValueError:
+        response_data = {"status": "failed", "error": "after must be a node id"}
+        return jsonify(response_data), 400
+
+    # wallets are only appended, so the list is read without a lock
+    response_data = {
+        "peers": [
+            {
+                "node_id": wallet.node_id,
+                "address": wallet.node_address,
+                "public_key": wallet.public_key,
+            }
+            for wallet in list(my_state.wallets)[after + 1 :]
+        ]
+    }
+    return jsonify(response_data), 200
@@ -0,0 +1,33 @@
+from flask import Blueprint, current_app, request, jsonify, Response
+from utils.wire import CONTENT_TYPE, encode_blocks
+
+blocks_bp = Blueprint("blocks", __name__)
+
+# most blocks served by one request
+MAX_BLOCKS_PER_REQUEST = 500
+
+
+# range of blocks for nodes that fell behind (see utils/sync.py), binary if the Accept header asks for it
+@blocks_bp.route("/blocks", methods=["GET"])
+def blocks():
+    my_state = current_app.config["my_state"]
+    try:
+        from_index = int(request.args["from"])
+        to_index = int(request.args.get("to", from_index + MAX_BLOCKS_PER_REQUEST - 1))
+    except (KeyError, ValueError):
+        response_data = {"status": "failed", "error": "from and to must be block indices"}
+        return jsonify(response_data), 400
+    if from_index < 0 or to_index < from_index:
+        response_data = {"status": "failed", "error": "invalid range"}
+        return jsonify(response_data), 400
+    to_index = min(to_index, from_index + MAX_BLOCKS_PER_REQUEST - 1)
+
+    # read from the view, so a range read from the block store does not hold up update_state
+    block_list = my_state.view.get_blocks_range(from_index, to_index)
+
+    if CONTENT_TYPE in request.headers.get("Accept", ""):
+        data = encode_blocks(block_list, my_state.public_key_to_node_id)
+        return Response(data, status=200, content_type=CONTENT_TYPE)
+
+    response_data = {"blocks": [block.to_dict() for block in block_list]}
+    return jsonify(response_data), 200
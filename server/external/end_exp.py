@@ -1,52 +1,31 @@
 from flask import Blueprint, request, current_app, jsonify
-from utils.broadcast import broadcast
-import time
-import os
+from utils.run_exp import summarize, write_results
 
 end_exp_bp = Blueprint("endExp", __name__)
 
 @end_exp_bp.route("/endExp", methods=["POST"])
 def end_exp():
-    data = request.json
-    node_id = data["node_id"]
-    current_app.config["times"][node_id] = data["time"]
-
-    current_app.config["node_count"] += 1
-    node_count = current_app.config["node_count"]
-    node_num = current_app.config["node_num"]
-    if (node_count) == node_num:
-        times = current_app.config["times"]
-        start_time = current_app.config["start_time"]
-        blockchain_len = len(current_app.config["my_state"].blockchain.block_list)
-        val_count = current_app.config["my_state"].validation_count
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-
-        folder_path = "../runs"
-        test_name = f"NodeNum={node_num}Capacity={current_app.config["capacity"]}Staking=one100.txt"
-        output_file_path = os.path.join(folder_path, test_name)
-
-        with open(output_file_path, 'w') as f:
-            f.write(f"Elapsed time: {elapsed_time} seconds\n")
-            f.write(f"Throughput: {(100*node_num)/elapsed_time} transactions/second\n")
-            f.write(f"Block time: {elapsed_time/blockchain_len} seconds/block\n\n")
-            for node_id, end_time in times.items():
-                f.write(f"Node {node_id} elapsed time: {end_time} seconds\n")
-                f.write(f"Node {node_id} throughput: {100/end_time} transactions/second\n")
-                f.write(f"Node {node_id} validated {val_count[node_id]} blocks\n\n")
-
-        print("Test results saved to:", output_file_path)
-
-
-        # print()
-        # print("Elapsed time:", elapsed_time, "seconds")
-        # print("Throughput:", (100*node_num)/elapsed_time, "transactions/second")
-        # print()
-        # for node_id, end_time in times.items():
-        #     print(f"Node {node_id} elapsed time: {end_time} seconds")
-        #     print(f"Node {node_id} throughput: {100/end_time} transactions/second")
-        #     print()
-
+    exp = current_app.config["exp"]
+    results = exp["results"]
+    with exp["lock"]:
+        results.append(request.json)
+        is_last = len(results) == exp["node_num"]
+
+    if is_last:
+        my_state = current_app.config["my_state"]
+        exp["blocks"] = my_state.blockchain.length() - exp["start_length"]
+        exp["validation_count"] = list(my_state.validation_count)
+
+        summary = summarize(results, exp["config"], exp)
+        output_path = write_results(summary)
+
+        latency = summary["commit_latency"]
+        print(
+            f"Throughput: {summary['throughput']:.1f} transactions/second"
+            f" (sustained {summary['sustained_tps']:.1f}),"
+            f" commit latency p50 {latency['p50']} s, p99 {latency['p99']} s"
+        )
+        print("Test results saved to:", output_path + ".{txt,json,csv}")
 
     response_data = {"status": "logged"}
     response_status = 200
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
+from werkzeug.wsgi import get_input_stream
 
 from models.blockchain import Blockchain
 from models.transaction import Transaction
 from models.state import State
+from utils.init_stream import NDJSON_CONTENT_TYPE, iter_lines, receive_init_stream
 import traceback
 
 receive_init_from_bootstap_bp = Blueprint("receiveInitFromBootstrap", __name__)
@@ -16,19 +18,38 @@ def receive_init_from_bootstap():
 
     try:
 
-        data = request.json
-        capacity = data["capacity"]
-        blockchain = Blockchain.from_dict(data["blockchain"], capacity)
-        wallets = State.wallets_deserialization(data["wallets"])
-        transactions = data["blockchain"]["transactions"]
-        state = State(blockchain, wallets, node_num, my_wallet)
+        if request.mimetype == NDJSON_CONTENT_TYPE:
+            # the stream is applied as it is read. It is as long as the chain, so
+            # MAX_CONTENT_LENGTH does not apply to it
+            stream = get_input_stream(request.environ, max_content_length=None)
+            state = receive_init_stream(
+                iter_lines(stream), node_num, my_wallet, current_app.config["block_store"]
+            )
+            transactions = []
+        else:
+            # a single JSON body, as sent by bootstraps before the stream
+            data = request.json
+            capacity = data["capacity"]
+            blockchain = Blockchain.from_dict(
+                data["blockchain"], capacity, current_app.config["block_store"]
+            )
+            wallets = State.wallets_deserialization(data["wallets"])
+            transactions = [
+                Transaction.from_dict(transaction)
+                for transaction in data["blockchain"]["transactions"]
+            ]
+        if request.mimetype != NDJSON_CONTENT_TYPE:
+            state = State(blockchain, wallets, node_num, my_wallet)
 
-        for transaction in transactions:
-            transaction = Transaction.from_dict(transaction)
-            transaction_key = state.transaction_unique_id(transaction)
-            state.blockchain.transaction_inbox[transaction_key] = transaction
+        state.load_inbox(transactions)
 
+        if my_wallet.node_id is None:
+            # the response of /talkToBootstrap with the id has not arrived yet
+            my_wallet.node_id = state.public_key_to_node_id[tuple(my_wallet.public_key)]
 
+        state.snapshot_interval = current_app.config["snapshot_interval"]
+        state.conversations.retention = current_app.config["conversation_retention"]
+        state.save_snapshot()
         current_app.config["my_state"] = state
 
         response_data = {"status": "success"}
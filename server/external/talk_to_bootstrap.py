@@ -1,15 +1,22 @@
 from flask import Blueprint, request, jsonify, after_this_request, current_app
 import threading
+import time
 import traceback
 
 from models.wallet import PublicWallet
 from models.transaction import Transaction
 
 from utils.broadcast import broadcast
+from utils.init_stream import send_init_stream, post_init_stream
 
 
 talk_to_bootstrap_bp = Blueprint("talkToBootstrap", __name__)
 
+# announcement of a node joining a running cluster on /addPeer
+ANNOUNCE_ATTEMPTS = 5
+ANNOUNCE_TIMEOUT = 1.0
+ANNOUNCE_BACKOFF = 0.1
+
 
 # when a node enters, it must send a request to this url so that the bootstrap sends him his unique node_id
 @talk_to_bootstrap_bp.route("/talkToBootstrap", methods=["POST"])
@@ -21,53 +28,74 @@ def talk_to_bootstrap():
     # is_bootstrap = current_app.config['is_bootstrap']
 
     try:
-        current_app.config["node_count"] += 1
-        node_id = current_app.config["node_count"]
-
         request_data = request.get_json()
         node_public_key = request_data.get("public_key")
         node_address = request_data.get("address")
+        node_num = current_app.config["node_num"]
 
-        new_transaction = my_wallet.create_transaction(
-            my_wallet.public_key,
-            node_public_key,
-            "coins",
-            1000,
-            f"Welcome to Blockchat node {node_id}",
-            my_state.get_my_nonce(),
-        )
-        new_transaction.is_init = 1
-
-        my_state.wallets[0].hard_amount -= 1000
-        my_state.wallets[0].soft_amount -= 1000
-        node_wallet = PublicWallet(node_id, node_address, node_public_key, 1000)
-        my_state.add_wallet(node_wallet)
-
-        transaction_key = my_state.transaction_unique_id(new_transaction)
-        my_state.blockchain.transaction_inbox[transaction_key] = new_transaction
+        with my_state.chain_lock, my_state.mempool_lock:
+            if (
+                current_app.config["node_count"] + 1 >= node_num
+                and my_state.wallets[0].soft_amount < 1000
+            ):
+                # a node joining a running cluster is paid by the bootstrap
+                response_data = {
+                    "status": "failed",
+                    "error": "The bootstrap cannot pay the welcome transaction",
+                }
+                return jsonify(response_data), 400
+
+            current_app.config["node_count"] += 1
+            node_id = current_app.config["node_count"]
+            node_count = node_id
+
+            new_transaction = my_wallet.create_transaction(
+                my_wallet.public_key,
+                node_public_key,
+                "coins",
+                1000,
+                f"Welcome to Blockchat node {node_id}",
+                my_state.get_my_nonce(),
+            )
+            new_transaction.is_init = 1
+
+            if node_id < node_num:
+                # nodes of the genesis are paid right away, and start together below
+                my_state.wallets[0].hard_amount -= 1000
+                my_state.wallets[0].soft_amount -= 1000
+                node_wallet = PublicWallet(node_id, node_address, node_public_key, 1000)
+                my_state.add_wallet(node_wallet)
+
+                transaction_key = my_state.transaction_unique_id(new_transaction)
+                my_state.add_to_inbox(transaction_key, new_transaction)
+            else:
+                # a node joining a running cluster is paid when the block with its welcome
+                # transaction is applied (see State.activate_member)
+                node_wallet = PublicWallet(node_id, node_address, node_public_key, 0)
+                my_state.add_wallet(node_wallet)
+            my_state.publish_view()
 
         response_data = {"status": "success", "id": node_id}
-
-        node_num = current_app.config["node_num"]
-        node_count = current_app.config["node_count"]
         response = jsonify(response_data)
-        if (node_count + 1) == node_num:
-            # the bootstrap node broadcasts to every other node all the ips, ports and public keys of other nodes
+
+        if node_id >= node_num:
             threading.Thread(
-                target=broadcast,
+                target=join_running_cluster,
                 args=(
-                    # endpoint
-                    "receiveInitFromBootstrap",
-                    # payload
-                    {
-                        "blockchain": my_state.blockchain.to_dict(),
-                        "wallets": my_state.wallets_serialization(),
-                        "capacity": current_app.config["capacity"]
-                    },
-                    wallets,
-                    bootstrap_addr,
+                    my_state,
+                    node_wallet,
+                    new_transaction,
+                    current_app.config["transaction_gossip"],
                 ),
             ).start()
+        elif (node_count + 1) == node_num:
+            my_state.save_snapshot()
+            # the bootstrap node streams to every other node the wallets (all the ips, ports
+            # and public keys of other nodes) and the blockchain
+            threading.Thread(
+                target=send_init_stream,
+                args=(my_state,),
+            ).start()
 
         return response, 200
 
@@ -78,3 +106,48 @@ def talk_to_bootstrap():
         response = jsonify(response_data)
 
         return response, 500
+
+
+def announce_peer(my_state, node_wallet):
+    # sent again to the peers that did not answer, until all of them did. A peer that still
+    # missed it fetches the node from /peers when it first sees one of its transactions
+    peers = [wallet for wallet in my_state.wallets if wallet.node_id != node_wallet.node_id]
+    for attempt in range(ANNOUNCE_ATTEMPTS):
+        result = broadcast(
+            "addPeer",
+            {
+                "node_id": node_wallet.node_id,
+                "address": node_wallet.node_address,
+                "public_key": node_wallet.public_key,
+            },
+            peers,
+            my_state.my_wallet.node_address,
+            timeout=ANNOUNCE_TIMEOUT,
+        )
+        failed_nodes = set(result.failed_nodes())
+        peers = [wallet for wallet in peers if wallet.node_id in failed_nodes]
+        if not peers:
+            return
+        time.sleep(ANNOUNCE_BACKOFF * 2**attempt)
+    print(f"Node {node_wallet.node_id} was not announced to nodes {sorted(failed_nodes)}")
+
+
+def join_running_cluster(my_state, node_wallet, welcome_transaction, transaction_gossip):
+    with my_state.mempool_lock:
+        valid, response = my_state.validate_transaction(welcome_transaction, check_signature=False)
+    if valid:
+        my_state.finish_admission()
+    else:
+        # the bootstrap spent its coins since the registration. The node still gets the
+        # chain, without coins and outside the proof of stake lottery
+        print(response)
+
+    # one snapshot transfer, to the new node only. Its peers learn about it once it has its
+    # State: until then it answers them with 503, and the blocks it missed are fetched by
+    # its BlockSync when the next one arrives
+    post_init_stream(my_state, node_wallet)
+
+    # the other nodes learn the address and key of the new node before its welcome transaction
+    announce_peer(my_state, node_wallet)
+    if valid:
+        transaction_gossip.submit(welcome_transaction, my_state)
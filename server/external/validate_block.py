@@ -1,6 +1,7 @@
 from flask import Blueprint, current_app, request, jsonify
 import traceback
 from models.block import Block
+from utils.wire import CONTENT_TYPE, WireError, decode_block
 import threading 
 
 validate_block_bp = Blueprint("validateBlock", __name__)
@@ -9,20 +10,28 @@ validate_block_bp = Blueprint("validateBlock", __name__)
 @validate_block_bp.route("/validateBlock", methods=["POST"])
 def validate_block():
     try:
-        data = request.json
-        incoming_block = Block.from_dict(data["block"])
         my_state = current_app.config["my_state"]
+        if request.mimetype == CONTENT_TYPE:
+            incoming_block = my_state.decode_from_peer(decode_block, request.get_data())
+        else:
+            data = request.json
+            incoming_block = Block.from_dict(data["block"])
         node_id = my_state.my_wallet.node_id
+        my_state.learn_peers(incoming_block.transactions)
+
+        # the signatures of the block's transactions are verified in parallel before taking the lock
+        if not all(my_state.verify_transactions(incoming_block.transactions)):
+            print(
+                f"Rejected block with index {incoming_block.index}: error verifying a transaction signature"
+            )
+            response_data = {"status": "failed", "error": "error verifying a transaction signature"}
+            return jsonify(response_data), 200
 
-        with my_state.lock:
+        with my_state.chain_lock:
             # print(threading.get_native_id())
             block_validated = my_state.validate_block(incoming_block)
             if block_validated:
-                blocks = list(my_state.block_waiting_room.values())
-                my_state.block_waiting_room.clear()
-                for block in blocks:
-                    # print(block.index)
-                    my_state.validate_block(block)
+                my_state.drain_waiting_room()
             
         
         response_data = {}
@@ -47,6 +56,10 @@ def validate_block():
 
         return response, status_code
 
+    except WireError as e:
+        response_data = {"status": "failed", "error": str(e)}
+        return jsonify(response_data), 400
+
     except Exception as e:
         print(f"An error occurred: {e}")
         traceback.print_exc()  # Print the full traceback
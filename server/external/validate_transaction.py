@@ -1,7 +1,7 @@
 from flask import Blueprint, current_app, request, jsonify
 import traceback
 from models.transaction import Transaction
-import threading
+from utils.wire import CONTENT_TYPE, WireError, decode_transactions
 
 validate_transaction_bp = Blueprint("validateTransaction", __name__)
 
@@ -9,25 +9,39 @@ validate_transaction_bp = Blueprint("validateTransaction", __name__)
 @validate_transaction_bp.route("/validateTransaction", methods=["POST"])
 def validate_transaction():
     try:
-        data = request.json
-        incoming_transaction = Transaction.from_dict(data["transaction"])
         my_state = current_app.config["my_state"]
-        node_id = my_state.my_wallet.node_id
+        if request.mimetype == CONTENT_TYPE:
+            transactions = my_state.decode_from_peer(decode_transactions, request.get_data())
+            if len(transactions) != 1:
+                raise WireError(f"Expected one transaction, got {len(transactions)}")
+            incoming_transaction = transactions[0]
+        else:
+            data = request.json
+            incoming_transaction = Transaction.from_dict(data["transaction"])
+        my_state.learn_peers([incoming_transaction])
 
         key = my_state.transaction_unique_id(incoming_transaction)
 
-        # check if transaction has already been sent as part of a minted block
-        if key in my_state.blockchain.blockchain_transactions: 
-            del my_state.blockchain.blockchain_transactions[key]
+        # the signature is verified before taking the lock
+        if not my_state.verify_transactions([incoming_transaction])[0]:
+            response_data = {"status": "failed", "error": "error verifying the signature"}
+            response = jsonify(response_data)
+            status_code = 200
+            return response, status_code
+
+        with my_state.mempool_lock:
+            # check if transaction has already been sent as part of a minted block
+            already_in_blockchain = my_state.is_committed(key)
+            if not already_in_blockchain:
+                _ = my_state.validate_transaction(incoming_transaction, check_signature=False)
+
+        if already_in_blockchain:
             response_data = {"status": "transaction already in blockchain"}
             response = jsonify(response_data)
             status_code = 200
             return response, status_code
 
-        with my_state.lock:
-            # print(threading.get_native_id(), my_state.lock)
-            _ = my_state.validate_transaction(incoming_transaction)
-            
+        my_state.finish_admission()
 
         # print(
         #         f"Node {node_id} received the transaction with (sender_id,nonce) = {key}"
@@ -40,6 +54,10 @@ def validate_transaction():
 
         return response, status_code
 
+    except WireError as e:
+        response_data = {"status": "failed", "error": str(e)}
+        return jsonify(response_data), 400
+
     except Exception as e:
         print(f"An error occurred: {e}")
         traceback.print_exc()  # Print the full traceback
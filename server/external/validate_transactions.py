@@ -0,0 +1,65 @@
+from flask import Blueprint, current_app, request, jsonify
+import traceback
+from models.transaction import Transaction
+from utils.wire import CONTENT_TYPE, WireError, decode_transactions
+
+validate_transactions_bp = Blueprint("validateTransactions", __name__)
+
+
+# batched version of /validateTransaction: the whole batch is admitted under one lock acquisition
+@validate_transactions_bp.route("/validateTransactions", methods=["POST"])
+def validate_transactions():
+    try:
+        my_state = current_app.config["my_state"]
+        if request.mimetype == CONTENT_TYPE:
+            incoming_transactions = my_state.decode_from_peer(decode_transactions, request.get_data())
+        else:
+            data = request.json
+            incoming_transactions = [
+                Transaction.from_dict(transaction) for transaction in data["transactions"]
+            ]
+        my_state.learn_peers(incoming_transactions)
+
+        # the signatures are verified in parallel before taking the lock
+        signatures_verified = my_state.verify_transactions(incoming_transactions)
+
+        results = []
+        with my_state.mempool_lock:
+            for incoming_transaction, signature_verified in zip(
+                incoming_transactions, signatures_verified
+            ):
+                if not signature_verified:
+                    results.append("failed")
+                    continue
+
+                key = my_state.transaction_unique_id(incoming_transaction)
+
+                # check if transaction has already been sent as part of a minted block
+                if my_state.is_committed(key):
+                    results.append("transaction already in blockchain")
+                    continue
+
+                validated, _ = my_state.validate_transaction(
+                    incoming_transaction, check_signature=False
+                )
+                results.append("success" if validated else "failed")
+
+        my_state.finish_admission()
+
+        response_data = {"status": "success", "results": results}
+        status_code = 200
+        response = jsonify(response_data)
+
+        return response, status_code
+
+    except WireError as e:
+        response_data = {"status": "failed", "error": str(e)}
+        return jsonify(response_data), 400
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        traceback.print_exc()  # Print the full traceback
+        response_data = {"status": "failed", "error": str(e)}
+        response = jsonify(response_data)
+
+        return response, 500
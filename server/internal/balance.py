@@ -5,7 +5,8 @@ balance_bp = Blueprint("balance", __name__)
 
 @balance_bp.route("/balance", methods=["GET"])
 def balance():
-    wallets = current_app.config["my_state"].wallets_serialization()
+    # served from the last published view, without taking the state locks
+    wallets = current_app.config["my_state"].view.wallets
 
     response_data = {"wallets": wallets}
     response_status = 200
@@ -0,0 +1,28 @@
+from flask import Blueprint, request, current_app, jsonify
+
+block_bp = Blueprint("block", __name__)
+
+
+# any block of the chain, by index or by hash
+@block_bp.route("/block", methods=["GET"])
+def block():
+    my_state = current_app.config["my_state"]
+    block_hash = request.args.get("hash")
+    try:
+        index = None if block_hash else int(request.args["index"])
+    except (KeyError, ValueError):
+        response_data = {"status": "failed", "error": "index or hash is required"}
+        return jsonify(response_data), 400
+
+    view = my_state.view
+    if block_hash:
+        found_block = view.get_block_by_hash(block_hash)
+    else:
+        found_block = view.get_block(index)
+
+    if found_block is None:
+        response_data = {"status": "failed", "error": "block not found"}
+        return jsonify(response_data), 404
+
+    response_data = {"status": "success", "block": found_block.to_dict()}
+    return jsonify(response_data), 200
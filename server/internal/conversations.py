@@ -2,12 +2,41 @@ from flask import Blueprint, request, current_app, jsonify
 
 conversations_bp = Blueprint("conversations", __name__)
 
+# most messages in one response, and longest long poll in seconds
+MAX_MESSAGES = 500
+MAX_WAIT = 30
 
+
+# messages after the id `since`, in id order. With wait, an empty answer is held until new
+# messages commit or wait seconds pass
 @conversations_bp.route("/conversations", methods=["GET"])
 def conversations():
-    conversations = current_app.config["my_state"].conversations
+    my_state = current_app.config["my_state"]
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", 100)), MAX_MESSAGES)
+        peer = request.args.get("peer")
+        peer = None if peer is None else int(peer)
+        wait = min(float(request.args.get("wait", 0)), MAX_WAIT)
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        response_data = {"status": "failed", "error": "since, limit, peer and wait must be numbers"}
+        return jsonify(response_data), 400
+
+    # served from the last published view, without taking the state locks
+    view = my_state.view
+    messages, has_more = view.get_conversations(since, limit, peer)
+    if not messages and wait > 0 and my_state.conversations.wait_for(since, wait):
+        view = my_state.view
+        messages, has_more = view.get_conversations(since, limit, peer)
 
-    response_data = {"conversations": conversations}
+    response_data = {
+        "messages": messages,
+        # since for the next request
+        "last_id": messages[-1]["id"] if messages else max(since, view.last_message_id),
+        "has_more": has_more,
+    }
     response_status = 200
 
     return jsonify(response_data), response_status
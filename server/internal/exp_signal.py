@@ -1,5 +1,7 @@
 from flask import Blueprint, request, current_app, jsonify
 from utils.broadcast import broadcast
+from utils.run_exp import parse_exp_config
+import threading
 import time
 
 exp_signal_bp = Blueprint("exp_signal", __name__)
@@ -7,16 +9,33 @@ exp_signal_bp = Blueprint("exp_signal", __name__)
 @exp_signal_bp.route("/exp_signal", methods=["GET"])
 def exp_signal():
     my_state = current_app.config["my_state"]
-    wallets = my_state.wallets 
-    my_wallet = my_state.my_wallet
-    current_app.config["start_time"] = time.time()
-    current_app.config["node_count"] = 0
+    wallets = list(my_state.wallets)
+
+    try:
+        config = parse_exp_config(request.args.to_dict())
+    except ValueError as e:
+        return jsonify({"status": f"Test not started: {e}"}), 400
+
+    node_num = current_app.config["node_num"]
+    capacity = current_app.config["capacity"]
+    name = config["name"] or f"NodeNum={node_num}Capacity={capacity}Mode={config['mode']}"
+    current_app.config["exp"] = {
+        "name": name,
+        "config": config,
+        "node_num": len(wallets),
+        "capacity": capacity,
+        "start_time": time.time(),
+        "start_length": my_state.blockchain.length(),
+        "results": [],
+        "lock": threading.Lock(),
+    }
 
     broadcast(
             "/runExp",
-            {},
+            {"config": config},
             wallets,
             None, # trigerring run_exp to node0 as well
+            timeout=5,
         )
 
     response_data = {"status": "Test started. Go to server terminal of Node 0 to see results."}
@@ -3,8 +3,11 @@ from flask import Blueprint, current_app
 home_bp = Blueprint("home", __name__)
 
 
+# also the readiness probe of cluster.py: 503 until the node has its State
 @home_bp.route("/", methods=["GET"])
 def home():
     my_state = current_app.config["my_state"]
+    if my_state is None:
+        return "Server of Blockchat is starting", 503
     node_id = my_state.my_wallet.node_id
     return f"Server of Blockchat Node {node_id} is up and running"
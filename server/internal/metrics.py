@@ -0,0 +1,39 @@
+from flask import Blueprint, current_app, Response
+
+from utils.metrics import Gauge, expose
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# read from the State of the node when /metrics is scraped
+CHAIN_HEIGHT = Gauge("blockchat_chain_height", "Index of the last block of the chain", ["node"])
+MEMPOOL_TRANSACTIONS = Gauge("blockchat_mempool_transactions", "Transactions in the inbox", ["node"])
+MEMPOOL_SENDERS = Gauge("blockchat_mempool_senders", "Senders with transactions in the inbox", ["node"])
+MEMPOOL_LONGEST_CHAIN = Gauge(
+    "blockchat_mempool_longest_chain", "Most transactions of one sender in the inbox", ["node"]
+)
+WAITING_ROOM_BLOCKS = Gauge(
+    "blockchat_waiting_room_blocks", "Blocks received ahead of the chain, waiting for the ones before them", ["node"]
+)
+PROPAGATION_QUEUE_BLOCKS = Gauge(
+    "blockchat_propagation_queue_blocks", "Minted blocks waiting to be broadcast", ["node"]
+)
+WALLETS = Gauge("blockchat_wallets", "Nodes known to the node", ["node"])
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    my_state = current_app.config["my_state"]
+    if my_state is not None:
+        # lengths are read without the locks, a scrape may be off by a transaction
+        node_id = my_state.my_wallet.node_id
+        CHAIN_HEIGHT.set(my_state.blockchain.block_list[-1].index, node_id)
+        MEMPOOL_TRANSACTIONS.set(len(my_state.blockchain.transaction_inbox), node_id)
+        with my_state.mempool_lock:
+            mempool_stats = my_state.mempool.stats()
+        MEMPOOL_SENDERS.set(mempool_stats["senders"], node_id)
+        MEMPOOL_LONGEST_CHAIN.set(mempool_stats["longest_chain"], node_id)
+        WAITING_ROOM_BLOCKS.set(len(my_state.block_waiting_room), node_id)
+        PROPAGATION_QUEUE_BLOCKS.set(my_state.block_propagator.queue.qsize(), node_id)
+        WALLETS.set(len(my_state.wallets), node_id)
+
+    return Response(expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
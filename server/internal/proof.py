@@ -0,0 +1,23 @@
+from flask import Blueprint, request, current_app, jsonify
+
+proof_bp = Blueprint("proof", __name__)
+
+
+@proof_bp.route("/proof", methods=["GET"])
+def proof():
+    my_state = current_app.config["my_state"]
+    try:
+        sender_id = int(request.args["sender_id"])
+        nonce = int(request.args["nonce"])
+    except (KeyError, ValueError):
+        response_data = {"status": "failed", "error": "sender_id and nonce are required"}
+        return jsonify(response_data), 400
+
+    inclusion_proof = my_state.view.transaction_proof(sender_id, nonce)
+
+    if inclusion_proof is None:
+        response_data = {"status": "failed", "error": "transaction not found in any block"}
+        return jsonify(response_data), 404
+
+    response_data = {"status": "success", **inclusion_proof}
+    return jsonify(response_data), 200
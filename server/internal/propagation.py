@@ -0,0 +1,11 @@
+from flask import Blueprint, current_app, jsonify
+
+propagation_bp = Blueprint("propagation", __name__)
+
+
+@propagation_bp.route("/propagation", methods=["GET"])
+def propagation():
+    my_state = current_app.config["my_state"]
+
+    response_data = {"blocks": my_state.block_propagator.get_status()}
+    return jsonify(response_data), 200
@@ -0,0 +1,31 @@
+from flask import Blueprint, request, jsonify, current_app
+
+from utils.submit import submit_transactions
+
+send_transactions_bp = Blueprint("send_transactions", __name__)
+
+# most transactions in one request
+MAX_TRANSACTIONS = 1000
+
+
+# batched version of /send_transaction, with one result per transaction
+@send_transactions_bp.route("/send_transactions", methods=["POST"])
+def send_transactions():
+    my_state = current_app.config["my_state"]
+
+    items = request.json.get("transactions")
+    if not isinstance(items, list) or len(items) > MAX_TRANSACTIONS:
+        response_data = {
+            "status": "failed",
+            "error": f"transactions must be a list of at most {MAX_TRANSACTIONS} items",
+        }
+        return jsonify(response_data), 400
+
+    _, results = submit_transactions(my_state, current_app.config["transaction_gossip"], items)
+
+    admitted = sum(result["status"] == "success" for result in results)
+    response_data = {
+        "status": f"{admitted} of {len(results)} transactions are valid",
+        "results": results,
+    }
+    return jsonify(response_data), 200
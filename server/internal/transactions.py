@@ -0,0 +1,64 @@
+from flask import Blueprint, request, current_app, jsonify
+
+transactions_bp = Blueprint("transactions", __name__)
+
+# most transactions in one page of /transactions
+MAX_PAGE_SIZE = 100
+
+
+def parse_cursor(cursor):
+    # "<block index>:<position>", as returned in "next"
+    block_index, position = cursor.split(":")
+    return int(block_index), int(position)
+
+
+# the committed transactions a node sent and/or received, a page at a time
+@transactions_bp.route("/transactions", methods=["GET"])
+def transactions():
+    my_state = current_app.config["my_state"]
+    try:
+        node_id = int(request.args["node_id"])
+        role = request.args.get("role", "all")
+        limit = min(int(request.args.get("limit", 50)), MAX_PAGE_SIZE)
+        after = request.args.get("after")
+        after = parse_cursor(after) if after else None
+        if role not in ("sent", "received", "all") or limit <= 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        response_data = {
+            "status": "failed",
+            "error": "node_id is required, role must be sent, received or all, after a <block>:<position> cursor",
+        }
+        return jsonify(response_data), 400
+
+    entries, next_cursor = my_state.view.account_transactions(node_id, role, after, limit)
+
+    response_data = {
+        "status": "success",
+        "transactions": entries,
+        "next": None if next_cursor is None else f"{next_cursor[0]}:{next_cursor[1]}",
+    }
+    return jsonify(response_data), 200
+
+
+# the block of a committed transaction
+@transactions_bp.route("/transaction", methods=["GET"])
+def transaction():
+    my_state = current_app.config["my_state"]
+    try:
+        sender_id = int(request.args["sender_id"])
+        nonce = int(request.args["nonce"])
+    except (KeyError, ValueError):
+        response_data = {"status": "failed", "error": "sender_id and nonce are required"}
+        return jsonify(response_data), 400
+
+    view = my_state.view
+    location = view.transaction_location(sender_id, nonce)
+    entries = [] if location is None else view.location_entries([(location, None)])
+
+    if not entries:
+        response_data = {"status": "failed", "error": "transaction not found in any block"}
+        return jsonify(response_data), 404
+
+    response_data = {"status": "success", **entries[0]}
+    return jsonify(response_data), 200
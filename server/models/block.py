@@ -1,7 +1,7 @@
-from hashlib import sha256
 import time
 
 from models.transaction import Transaction
+from utils.merkle import header_hash, merkle_levels, merkle_proof
 
 
 class Block:
@@ -18,6 +18,7 @@ class Block:
         self.timestamp = timestamp  # take current time stamp
         self.transactions = transactions
         self.validator = validator
+        self._merkle_levels = None
         if current_hash:
             self.current_hash = current_hash
         else:
@@ -26,6 +27,32 @@ class Block:
 
     def add_transaction(self, transaction: Transaction):
         self.transactions.append(transaction)
+        self._merkle_levels = None
+
+    # The Merkle tree over the digests of the block's transactions is built once per block
+    def get_merkle_levels(self):
+        if self._merkle_levels is None:
+            self._merkle_levels = merkle_levels(
+                [transaction.digest() for transaction in self.transactions]
+            )
+        return self._merkle_levels
+
+    def get_merkle_root(self):
+        return self.get_merkle_levels()[-1][0].hex()
+
+    def get_merkle_proof(self, position):
+        return merkle_proof(self.get_merkle_levels(), position)
+
+    # Everything needed to recompute the block hash, without the transactions
+    def header_to_dict(self):
+        return {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "validator": self.validator,
+            "merkle_root": self.get_merkle_root(),
+            "current_hash": self.current_hash,
+            "previous_hash": self.previous_hash,
+        }
 
     def to_dict(self):
         return {
@@ -35,6 +62,7 @@ class Block:
                 transaction.to_dict() for transaction in self.transactions
             ],
             "validator": self.validator,
+            "merkle_root": self.get_merkle_root(),
             "current_hash": self.current_hash,
             "previous_hash": self.previous_hash,
         }
@@ -51,20 +79,7 @@ class Block:
         )
 
     # Creates block hash for the new block the be validated and added to the blockchain
+    # The transactions enter the hash through their Merkle root, so hashing a block combines
+    # one cached digest per transaction instead of re-encoding every transaction string
     def create_block_hash(self):
-        transactions_string = ""
-        for transaction in self.transactions:
-            transactions_string += transaction.create_transaction_string()
-
-        block_string = (
-            str(self.index)
-            + str(self.timestamp)
-            + str(transactions_string)
-            + str(self.validator)
-        )
-
-        sha256_hash_object = sha256()
-        sha256_hash_object.update(block_string.encode("utf-8"))
-        block_string_hashed = sha256_hash_object.hexdigest()
-
-        return block_string_hashed
+        return header_hash(self.index, self.timestamp, self.get_merkle_root(), self.validator)
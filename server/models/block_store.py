@@ -0,0 +1,266 @@
+import json
+import os
+import struct
+import threading
+
+from models.block import Block
+
+# Every record of a segment is a fixed header followed by the JSON of the block:
+# payload length, block index and the block hash (the raw bytes of current_hash)
+RECORD_HEADER = struct.Struct(">IQ32s")
+# Every record of the location log is one committed transaction: block index, position in the
+# block, sender id, nonce and receiver id (-1 for none)
+LOCATION_RECORD = struct.Struct(">QIqqq")
+
+
+class BlockStore:
+    """
+    Append-only, disk-backed log of the blocks of the chain, split in segment files of
+    about segment_size bytes. An in-memory index maps block indices and hashes to the
+    location of the block in the log, and is rebuilt on startup by reading only the
+    record headers. Appends are fsynced in batches of fsync_every blocks.
+
+    The directory also keeps the latest snapshot of the State (see State.to_snapshot), written
+    by a thread of its own, and the location log: the transactions of every indexed block,
+    appended by Blockchain.index_transactions and synced with the blocks, so the snapshot does
+    not grow with the chain. The wallet of the node, with its private key, is kept out of the
+    snapshot, in a file only the user running the node may read.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, fsync_every=16):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_every = fsync_every
+        self.lock = threading.Lock()
+
+        self.locations = {}  # block index -> (segment number, offset, length)
+        self.hash_to_index = {}  # for the block indexes of Blockchain.load_indexes
+        # a node that joined a running cluster keeps the blocks from its initialization on
+        self.first_index = None
+        self.last_index = None
+        self.unsynced = 0
+        self.read_fds = {}
+
+        os.makedirs(directory, exist_ok=True)
+        segments = sorted(
+            int(name[len("blocks-") : -len(".log")])
+            for name in os.listdir(directory)
+            if name.startswith("blocks-") and name.endswith(".log")
+        )
+        for segment in segments:
+            self.load_segment(segment)
+        self.segment = segments[-1] if segments else 0
+        self.file = open(self.segment_path(self.segment), "ab")
+        self.locations_file = open(self.locations_path(), "ab")
+        self.locations_unsynced = False
+
+        # the snapshot waiting for the snapshot thread, only the latest one is kept
+        self.snapshot_condition = threading.Condition()
+        self.pending_snapshot = None
+        self.writing_snapshot = False
+        self.snapshot_thread = None
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"blocks-{segment:06d}.log")
+
+    def snapshot_path(self):
+        return os.path.join(self.directory, "snapshot.json")
+
+    def wallet_path(self):
+        return os.path.join(self.directory, "wallet.json")
+
+    def locations_path(self):
+        return os.path.join(self.directory, "locations.log")
+
+    def load_segment(self, segment):
+        path = self.segment_path(segment)
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            offset = 0
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                length, index, block_hash = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if offset + RECORD_HEADER.size + length > size:
+                    break  # record cut short by a crash
+                self.locations[index] = (segment, offset + RECORD_HEADER.size, length)
+                self.hash_to_index[block_hash.hex()] = index
+                if self.first_index is None:
+                    self.first_index = index
+                self.last_index = index
+                offset += RECORD_HEADER.size + length
+        if offset < size:
+            os.truncate(path, offset)
+
+    def append(self, block):
+        payload = json.dumps(block.to_dict()).encode("utf-8")
+        header = RECORD_HEADER.pack(len(payload), block.index, bytes.fromhex(block.current_hash))
+        with self.lock:
+            if self.file.tell() > 0 and self.file.tell() + len(payload) > self.segment_size:
+                self.sync_locked()
+                self.file.close()
+                self.segment += 1
+                self.file = open(self.segment_path(self.segment), "ab")
+            offset = self.file.tell() + RECORD_HEADER.size
+            self.file.write(header + payload)
+            self.file.flush()
+            self.locations[block.index] = (self.segment, offset, len(payload))
+            self.hash_to_index[block.current_hash] = block.index
+            if self.first_index is None:
+                self.first_index = block.index
+            self.last_index = block.index
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self.sync_locked()
+
+    def sync(self):
+        with self.lock:
+            self.sync_locked()
+
+    def sync_locked(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        if self.locations_unsynced:
+            self.locations_file.flush()
+            os.fsync(self.locations_file.fileno())
+            self.locations_unsynced = False
+
+    def append_locations(self, block_index, records):
+        # records of (position, sender_id, nonce, receiver_id), synced with the next blocks
+        payload = b"".join(
+            LOCATION_RECORD.pack(block_index, position, sender_id, nonce, receiver_id)
+            for position, sender_id, nonce, receiver_id in records
+        )
+        with self.lock:
+            self.locations_file.write(payload)
+            self.locations_unsynced = True
+
+    def load_locations(self, until_index):
+        """
+        The records of the location log up to block until_index, as (block_index, position,
+        sender_id, nonce, receiver_id). The records after it are dropped, since the blocks
+        they belong to are indexed again when they are replayed
+        """
+        with self.lock:
+            self.locations_file.flush()
+            with open(self.locations_path(), "rb") as f:
+                data = f.read()
+            records = []
+            end = len(data) - len(data) % LOCATION_RECORD.size
+            for offset in range(0, end, LOCATION_RECORD.size):
+                record = LOCATION_RECORD.unpack_from(data, offset)
+                if record[0] > until_index:
+                    end = offset
+                    break
+                records.append(record)
+            if end < len(data):
+                os.truncate(self.locations_path(), end)
+        return records
+
+    def read_fd(self, segment):
+        fd = self.read_fds.get(segment)
+        if fd is None:
+            fd = os.open(self.segment_path(segment), os.O_RDONLY)
+            self.read_fds[segment] = fd
+        return fd
+
+    def get_block_dict(self, index):
+        with self.lock:
+            location = self.locations.get(index)
+            if location is None:
+                return None
+            segment, offset, length = location
+            fd = self.read_fd(segment)
+        return json.loads(os.pread(fd, length, offset))
+
+    def get_block(self, index):
+        block_dict = self.get_block_dict(index)
+        return Block.from_dict(block_dict) if block_dict is not None else None
+
+    def length(self):
+        return len(self.locations)
+
+    def iter_block_dicts(self, start=None):
+        index = self.first_index if start is None else start
+        while index in self.locations:
+            yield self.get_block_dict(index)
+            index += 1
+
+    def submit_snapshot(self, snapshot):
+        # saved by the snapshot thread, so the caller does not wait for the disk
+        with self.snapshot_condition:
+            self.pending_snapshot = snapshot
+            if self.snapshot_thread is None:
+                self.snapshot_thread = threading.Thread(
+                    target=self.write_snapshots, name="snapshot", daemon=True
+                )
+                self.snapshot_thread.start()
+            self.snapshot_condition.notify_all()
+
+    def write_snapshots(self):
+        while True:
+            with self.snapshot_condition:
+                while self.pending_snapshot is None:
+                    self.snapshot_condition.wait()
+                snapshot = self.pending_snapshot
+                self.pending_snapshot = None
+                self.writing_snapshot = True
+            try:
+                self.save_snapshot(snapshot)
+            except Exception as e:
+                print(f"Snapshot of block {snapshot['block_index']} failed: {e}")
+            finally:
+                with self.snapshot_condition:
+                    self.writing_snapshot = False
+                    self.snapshot_condition.notify_all()
+
+    def wait_for_snapshots(self):
+        # waits until the submitted snapshots are on disk
+        with self.snapshot_condition:
+            while self.pending_snapshot is not None or self.writing_snapshot:
+                self.snapshot_condition.wait()
+
+    def save_snapshot(self, snapshot):
+        # the snapshot refers to blocks of the log, which must reach the disk first
+        self.sync()
+        path = self.snapshot_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_wallet(self, wallet_dict):
+        path = self.wallet_path()
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # a file left by a crash keeps the permissions it was created with
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(wallet_dict, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def load_wallet(self):
+        try:
+            with open(self.wallet_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def close(self):
+        self.wait_for_snapshots()
+        with self.lock:
+            self.sync_locked()
+            self.file.close()
+            self.locations_file.close()
+            for fd in self.read_fds.values():
+                os.close(fd)
+            self.read_fds = {}
@@ -1,20 +1,96 @@
 from models.block import Block
 from models.transaction import Transaction
+from models.nonce_watermarks import NonceWatermarks
 from collections import OrderedDict
 
 
 class Blockchain:
-    def __init__(self, block_list: list[Block], capacity):
+    def __init__(self, block_list: list[Block], capacity, block_store=None, cache_size=100):
+        # with a block store, only the last cache_size blocks are kept in memory
         self.block_list = block_list
+        self.block_store = block_store
+        self.cache_size = cache_size
         # transactions that have not yet "become" a block
         self.transaction_inbox = OrderedDict()
 
-        # transactions that belong to validated blocks
-        self.blockchain_transactions = {}
+        # nonces of the transactions in the chain, per sender, to reject replays
+        self.committed_nonces = NonceWatermarks()
+        # (sender_id, nonce) -> (block index, position in the block), for inclusion proofs
+        self.transaction_locations = {}
+        # node_id -> (block index, position) of the transactions it sent or received, in
+        # chain order, so a page of the history of a node is found by bisection
+        self.sent_locations = {}
+        self.received_locations = {}
+        # block hash -> block index
+        self.block_indices = {}
+        # index of the last block in the indexes above
+        self.indexed_height = -1
         self.capacity = capacity
 
+    def index_transactions(self, block, records):
+        """
+        Indexes the transactions of a block, from (position, sender_id, nonce, receiver_id)
+        records (None for an unknown sender or no receiver). With a block store the records
+        also go to its location log, which a restarted node reads back in load_indexes
+        """
+        self.indexed_height = block.index
+        self.block_indices[block.current_hash] = block.index
+        for position, sender_id, nonce, receiver_id in records:
+            self.add_location(block.index, position, sender_id, nonce, receiver_id)
+            if sender_id is not None:
+                self.committed_nonces.mark(sender_id, nonce)
+        if self.block_store is not None:
+            self.block_store.append_locations(
+                block.index,
+                [
+                    (position, -1 if sender_id is None else sender_id, nonce, -1 if receiver_id is None else receiver_id)
+                    for position, sender_id, nonce, receiver_id in records
+                ],
+            )
+
+    def add_location(self, block_index, position, sender_id, nonce, receiver_id):
+        location = (block_index, position)
+        if sender_id is not None:
+            self.transaction_locations[(sender_id, nonce)] = location
+            self.sent_locations.setdefault(sender_id, []).append(location)
+        if receiver_id is not None:
+            self.received_locations.setdefault(receiver_id, []).append(location)
+
+    def indexes_to_dict(self):
+        # the part of the indexes saved with the snapshot, of a size bounded by the number of
+        # nodes. The locations are in the location log of the block store
+        return {
+            "indexed_height": self.indexed_height,
+            "committed_nonces": self.committed_nonces.to_dict(),
+        }
+
+    def load_indexes(self, indexes):
+        self.indexed_height = indexes["indexed_height"]
+        self.committed_nonces = NonceWatermarks.from_dict(indexes["committed_nonces"])
+        for block_index, position, sender_id, nonce, receiver_id in self.block_store.load_locations(
+            self.indexed_height
+        ):
+            self.add_location(
+                block_index,
+                position,
+                None if sender_id < 0 else sender_id,
+                nonce,
+                None if receiver_id < 0 else receiver_id,
+            )
+        self.block_indices = {
+            block_hash: index
+            for block_hash, index in self.block_store.hash_to_index.items()
+            if index <= self.indexed_height
+        }
+
     def add_block(self, block):
         self.block_list.append(block)
+        if self.block_store is not None:
+            self.block_store.append(block)
+            # trimmed into a new list, not in place, so that get_block can run without
+            # chain_lock (see StateView). Up to twice cache_size blocks are kept in between
+            if len(self.block_list) >= 2 * self.cache_size:
+                self.block_list = self.block_list[-self.cache_size :]
 
     # this method gets called after the current block is validated
     def update_inbox():
@@ -23,20 +99,50 @@ class Blockchain:
     def get_blocks(self):
         return self.block_list
 
+    def length(self):
+        if self.block_store is not None:
+            return self.block_store.length()
+        return len(self.block_list)
+
+    def get_block(self, index):
+        block_list = self.block_list
+        first_cached_index = block_list[0].index
+        if index >= first_cached_index:
+            position = index - first_cached_index
+            return block_list[position] if position < len(block_list) else None
+        if self.block_store is not None:
+            return self.block_store.get_block(index)
+        return None
+
+    def iter_block_dicts(self):
+        if self.block_store is not None:
+            yield from self.block_store.iter_block_dicts()
+        else:
+            for block in self.block_list:
+                yield block.to_dict()
+
     def to_dict(self):
         return {
-            "blocks": [block.to_dict() for block in self.block_list],
+            "blocks": list(self.iter_block_dicts()),
             "transactions": [
                 transaction.to_dict() for transaction in self.transaction_inbox.values()
             ],
         }
 
     @classmethod
-    def from_dict(cls, blockchain_dict, capacity):
-        block_list = [
-            Block.from_dict(block_dict) for block_dict in blockchain_dict["blocks"]
-        ]
-        return cls(block_list, capacity)
+    def from_dict(cls, blockchain_dict, capacity, block_store=None):
+        blockchain = cls([], capacity, block_store)
+        for block_dict in blockchain_dict["blocks"]:
+            blockchain.add_block(Block.from_dict(block_dict))
+        return blockchain
+
+    @classmethod
+    def from_block_store(cls, block_store, capacity, cache_size=100):
+        # loads the last cache_size blocks of the store
+        last_index = block_store.last_index
+        first_index = max(block_store.first_index, last_index - cache_size + 1)
+        block_list = [block_store.get_block(index) for index in range(first_index, last_index + 1)]
+        return cls(block_list, capacity, block_store, cache_size)
 
     def validate_chain(self):
         pass
@@ -0,0 +1,111 @@
+import threading
+import time
+from bisect import bisect_right
+from heapq import merge
+from itertools import islice
+
+
+class ConversationStore:
+    """
+    The messages this node sent or received in committed blocks, per peer, with ids that grow
+    by one with every message. Only the last `retention` messages of each peer are kept.
+
+    update_state appends the messages of a block, and publish_view makes them visible with
+    publish(), so readers only see messages of published blocks. Readers ask for the messages
+    after an id (`since`), and may wait for the next publish with wait_for().
+    """
+
+    def __init__(self, retention=1000):
+        self.retention = retention
+        self.last_id = 0  # id of the last appended message
+        self.published_id = 0  # id of the last message readers may see
+        self.messages = {}  # peer node_id -> messages, in id order
+        self.ids = {}  # peer node_id -> ids of its messages, for bisection
+        self.condition = threading.Condition()
+
+    def append(self, peer, author, message, block_index):
+        with self.condition:
+            self.last_id += 1
+            messages = self.messages.setdefault(peer, [])
+            ids = self.ids.setdefault(peer, [])
+            messages.append(
+                {
+                    "id": self.last_id,
+                    "peer": peer,
+                    "author": author,
+                    "message": message,
+                    "block_index": block_index,
+                }
+            )
+            ids.append(self.last_id)
+            # trimmed in steps of retention, so each append costs O(1) on average
+            if len(ids) >= 2 * self.retention:
+                del messages[: len(messages) - self.retention]
+                del ids[: len(ids) - self.retention]
+
+    def publish(self):
+        with self.condition:
+            if self.published_id != self.last_id:
+                self.published_id = self.last_id
+                self.condition.notify_all()
+        return self.published_id
+
+    def read(self, since=0, limit=100, peer=None, until=None):
+        """
+        Messages with since < id <= until (the published ones by default), of one peer or of all
+        of them, in id order, at most limit. Returns the messages and whether there are more.
+        """
+        with self.condition:
+            if until is None:
+                until = self.published_id
+            peers = [peer] if peer is not None else list(self.messages)
+            pages = []
+            for node_id in peers:
+                ids = self.ids.get(node_id)
+                if not ids:
+                    continue
+                # older than the retention window, even if not trimmed yet
+                first = max(bisect_right(ids, since), len(ids) - self.retention)
+                last = min(bisect_right(ids, until), first + limit + 1)
+                pages.append(self.messages[node_id][first:last])
+        found = list(islice(merge(*pages, key=lambda message: message["id"]), limit + 1))
+        return found[:limit], len(found) > limit
+
+    def wait_for(self, since, timeout):
+        """Waits until a message after `since` is published, for at most timeout seconds"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.published_id <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def to_dict(self):
+        with self.condition:
+            return {
+                "retention": self.retention,
+                "last_id": self.last_id,
+                "messages": {
+                    str(peer): messages[-self.retention :] for peer, messages in self.messages.items()
+                },
+            }
+
+    @classmethod
+    def from_dict(cls, store_dict):
+        if "last_id" not in store_dict:
+            # snapshot from before the store: {peer: [[author, message], ...]}
+            store = cls()
+            for peer, messages in store_dict.items():
+                for author, message in messages:
+                    store.append(int(peer), author, message, None)
+            store.publish()
+            return store
+
+        store = cls(store_dict["retention"])
+        store.last_id = store.published_id = store_dict["last_id"]
+        for peer, messages in store_dict["messages"].items():
+            store.messages[int(peer)] = list(messages)
+            store.ids[int(peer)] = [message["id"] for message in messages]
+        return store
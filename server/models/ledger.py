@@ -0,0 +1,116 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# blocks with fewer transfers are applied in Python, faster than setting up the NumPy arrays.
+# Both ways add the same floats in the same order, so the balances do not depend on it
+NUMPY_MIN_TRANSFERS = 64
+
+# amounts are rounded to AMOUNT_DECIMALS after every change. Coins and fees are in tenths of
+# a coin, so this only drops the float error, which depends on the order of the additions:
+# without it a soft amount recheck_inbox updates by a delta could differ from a replay of the
+# inbox in the last digit, and a transaction at the limit of a balance pass on one and not
+# on the other
+AMOUNT_DECIMALS = 6
+
+
+def round_amount(amount):
+    return round(amount, AMOUNT_DECIMALS)
+
+
+class Ledger:
+    """
+    The balances and stakes of the nodes, one column per field indexed by node id: amounts
+    in array("d"), stakes in array("q") since the proof of stake draws integers. The wallets
+    of a State read and write their row (see LedgerField).
+    """
+
+    COLUMNS = ("hard_amount", "soft_amount", "hard_stake", "soft_stake")
+
+    def __init__(self, size=0):
+        self.hard_amount = array("d")
+        self.soft_amount = array("d")
+        self.hard_stake = array("q")
+        self.soft_stake = array("q")
+        self.grow(size)
+
+    def __len__(self):
+        return len(self.hard_amount)
+
+    def grow(self, size):
+        missing = size - len(self)
+        if missing > 0:
+            for name in self.COLUMNS:
+                getattr(self, name).extend([0] * missing)
+
+    def bind(self, wallet):
+        # moves the balances of a wallet into its row
+        values = {name: getattr(wallet, name) for name in self.COLUMNS}
+        self.grow(wallet.node_id + 1)
+        wallet.ledger = self
+        for name, value in values.items():
+            setattr(wallet, name, value)
+
+    @staticmethod
+    def transfer_columns():
+        # senders, receivers, totals and fees of the transfers of a block, for apply_transfers
+        return array("q"), array("q"), array("d"), array("d")
+
+    def apply_transfers(self, senders, receivers, totals, fees, validator_id):
+        """
+        Applies the coins and message transactions of a block to the hard amounts: senders
+        pay totals, receivers get totals - fees and the validator the fees. The debits and
+        credits of every node are summed first, as bincount does
+        """
+        if not senders:
+            return
+        size = len(self)
+        if numpy is not None and len(senders) >= NUMPY_MIN_TRANSFERS:
+            # the columns of transfer_columns() are read without a copy
+            totals = numpy.asarray(totals, dtype=numpy.float64)
+            net = totals - numpy.asarray(fees, dtype=numpy.float64)
+            senders = numpy.asarray(senders, dtype=numpy.int64)
+            receivers = numpy.asarray(receivers, dtype=numpy.int64)
+            debits = numpy.bincount(senders, weights=totals, minlength=size)
+            credits = numpy.bincount(receivers, weights=net, minlength=size)
+            hard_amount = numpy.frombuffer(self.hard_amount, dtype=numpy.float64)
+            hard_amount += credits - debits
+            # the view must go before the array can grow again
+            del hard_amount
+            touched = numpy.union1d(senders, receivers).tolist()
+        else:
+            debits = {}
+            credits = {}
+            for sender_id, receiver_id, total, fee in zip(senders, receivers, totals, fees):
+                debits[sender_id] = debits.get(sender_id, 0.0) + total
+                credits[receiver_id] = credits.get(receiver_id, 0.0) + (total - fee)
+            touched = debits.keys() | credits.keys()
+            for node_id in touched:
+                self.hard_amount[node_id] += credits.get(node_id, 0.0) - debits.get(node_id, 0.0)
+        hard_amount = self.hard_amount
+        for node_id in touched:
+            hard_amount[node_id] = round_amount(hard_amount[node_id])
+        hard_amount[validator_id] = round_amount(hard_amount[validator_id] + sum(fees))
+
+
+class LedgerField:
+    """A balance of a wallet: its row of the Ledger once bound, an attribute until then"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, wallet, owner=None):
+        if wallet is None:
+            return self
+        if wallet.ledger is None:
+            return wallet.unbound[self.name]
+        return getattr(wallet.ledger, self.name)[wallet.node_id]
+
+    def __set__(self, wallet, value):
+        if wallet.ledger is None:
+            wallet.unbound[self.name] = value
+        else:
+            getattr(wallet.ledger, self.name)[wallet.node_id] = value
@@ -0,0 +1,129 @@
+from bisect import bisect_left
+from collections import deque
+from heapq import heapify, heappop, heappush
+
+
+def priority(transaction):
+    # welcome transactions first, then by fees, which are per transaction since a block
+    # holds capacity transactions whatever their size
+    if transaction.is_init == 1:
+        return float("-inf")
+    return -transaction.fees
+
+
+class Mempool:
+    """
+    Orders the transactions of the inbox for mint_block: by fees, and for each sender by nonce.
+
+    Each sender has a chain of its pending nonces in order, and a heap holds the head of every
+    chain keyed by (priority, arrival seq). select() takes the best head, and the next
+    transaction of a chain becomes a candidate once the one before it is taken, so a block of
+    capacity transactions costs O(capacity log senders). The heap entries of removed heads are
+    dropped lazily.
+
+    Chains are deques: nonces mostly arrive in order and leave from the head when a block
+    commits them, both O(1). Only a nonce inserted or dropped in the middle of its chain
+    costs O(chain).
+
+    Called with mempool_lock held, like the inbox it indexes.
+    """
+
+    def __init__(self):
+        self.transactions = {}  # (sender_id, nonce) -> (transaction, arrival seq)
+        self.chains = {}  # sender_id -> deque of pending nonces, in order
+        self.heap = []  # (priority, seq, sender_id, nonce) of chain heads, and stale ones
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def entry(self, transaction_key):
+        transaction, seq = self.transactions[transaction_key]
+        return (priority(transaction), seq) + transaction_key
+
+    def add(self, transaction_key, transaction, seq):
+        sender_id, nonce = transaction_key
+        self.transactions[transaction_key] = (transaction, seq)
+        chain = self.chains.get(sender_id)
+        if chain is None:
+            chain = self.chains[sender_id] = deque()
+        if not chain or nonce > chain[-1]:
+            chain.append(nonce)
+        elif nonce < chain[0]:
+            chain.appendleft(nonce)
+        else:
+            chain.insert(bisect_left(chain, nonce), nonce)
+        if chain[0] == nonce:
+            heappush(self.heap, self.entry(transaction_key))
+
+    def remove(self, transaction_key):
+        if self.transactions.pop(transaction_key, None) is None:
+            return
+        sender_id, nonce = transaction_key
+        chain = self.chains[sender_id]
+        if chain[0] == nonce:
+            chain.popleft()
+            if chain:
+                heappush(self.heap, self.entry((sender_id, chain[0])))
+        elif chain[-1] == nonce:
+            chain.pop()
+        else:
+            chain.remove(nonce)
+        if not chain:
+            del self.chains[sender_id]
+        if len(self.heap) > 2 * len(self.chains) + 64:
+            self.compact()
+
+    def compact(self):
+        self.heap = [self.entry((sender_id, chain[0])) for sender_id, chain in self.chains.items()]
+        heapify(self.heap)
+
+    def is_head(self, entry):
+        chain = self.chains.get(entry[2])
+        return chain is not None and chain[0] == entry[3]
+
+    def select(self, capacity, fits):
+        """
+        At most capacity transactions, best first, each after the earlier nonces of its sender.
+        fits(transaction) tells whether a transaction can follow the ones selected so far; when
+        it cannot, the rest of its chain waits for a later block.
+        """
+        selected = []
+        popped = []  # valid heads taken off the heap, pushed back at the end
+        seen = set()
+        # (priority, seq, sender_id, nonce, iterator over the rest of the chain) of later
+        # nonces. seq is unique, so the iterators are never compared
+        candidates = []
+
+        while len(selected) < capacity:
+            while self.heap and (not self.is_head(self.heap[0]) or self.heap[0][2] in seen):
+                heappop(self.heap)  # stale, or a second entry of the same head
+            if candidates and (not self.heap or candidates[0][:4] < self.heap[0]):
+                _, _, sender_id, nonce, rest = heappop(candidates)
+            elif self.heap:
+                head = heappop(self.heap)
+                popped.append(head)
+                sender_id, nonce = head[2], head[3]
+                rest = iter(self.chains[sender_id])
+                next(rest)
+                seen.add(sender_id)
+            else:
+                break
+
+            transaction = self.transactions[(sender_id, nonce)][0]
+            if not fits(transaction):
+                continue
+            selected.append(transaction)
+            next_nonce = next(rest, None)
+            if next_nonce is not None:
+                heappush(candidates, self.entry((sender_id, next_nonce)) + (rest,))
+
+        for head in popped:
+            heappush(self.heap, head)
+        return selected
+
+    def stats(self):
+        return {
+            "depth": len(self.transactions),
+            "senders": len(self.chains),
+            "longest_chain": max(map(len, self.chains.values()), default=0),
+        }
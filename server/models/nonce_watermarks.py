@@ -0,0 +1,52 @@
+class NonceWatermarks:
+    """
+    The nonces of the committed transactions of every sender, in O(window) bits per sender.
+
+    Each sender has a watermark, the highest nonce up to which every nonce is committed, and a
+    bitmap of the committed nonces above it (bit i for nonce watermark + 1 + i). A nonce more
+    than `window` above the watermark slides the watermark up, so the nonces it skips, such as
+    those of transactions that were never admitted, count as used from then on.
+
+    Nonces are marked by index_block, with chain_lock held. The (watermark, bitmap) pair of a
+    sender is replaced as one tuple, so contains() needs no lock.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.senders = {}  # sender node_id -> (watermark, bitmap)
+
+    def contains(self, sender_id, nonce):
+        watermark, bitmap = self.senders.get(sender_id, (-1, 0))
+        if nonce <= watermark:
+            return True
+        return (bitmap >> (nonce - watermark - 1)) & 1 == 1
+
+    def mark(self, sender_id, nonce):
+        """Marks a nonce as committed. Returns False if it already was"""
+        watermark, bitmap = self.senders.get(sender_id, (-1, 0))
+        offset = nonce - watermark - 1
+        if offset < 0 or (bitmap >> offset) & 1:
+            return False
+        if offset >= self.window:
+            shift = offset - self.window + 1
+            watermark += shift
+            bitmap >>= shift
+            offset -= shift
+        bitmap |= 1 << offset
+        # the watermark moves over the committed nonces right above it
+        contiguous = (~bitmap & (bitmap + 1)).bit_length() - 1
+        self.senders[sender_id] = (watermark + contiguous, bitmap >> contiguous)
+        return True
+
+    def to_dict(self):
+        return {
+            "window": self.window,
+            "senders": [[sender_id, watermark, bitmap] for sender_id, (watermark, bitmap) in self.senders.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        watermarks = cls(data["window"])
+        for sender_id, watermark, bitmap in data["senders"]:
+            watermarks.senders[sender_id] = (watermark, bitmap)
+        return watermarks
@@ -1,13 +1,33 @@
 from models.wallet import PublicWallet, PrivateWallet
 from models.blockchain import Blockchain
 from models.block import Block
+from models.state_view import StateView
+from models.conversation_store import ConversationStore
+from models.mempool import Mempool
+from models.ledger import Ledger, round_amount
 from utils.broadcast import broadcast
-from utils.proof_of_stake import proof_of_stake
-from utils.crypto import verify_signature
+from utils.proof_of_stake import StakeIndex
+from utils.crypto import verify_digest, verify_signatures
 from utils.send_http_request import send_http_request
+from utils.wire import use_binary, binary_request, encode_block, UnknownNodeError
+from utils.propagation import BlockPropagator
+from utils.sync import BlockSync, fetch_peers
+from utils.metrics import Histogram, TimedLock
 import time
 import threading
-from threading import RLock
+from collections import OrderedDict
+from heapq import heappush, heappop
+from itertools import islice
+
+UPDATE_STATE_SECONDS = Histogram(
+    "blockchat_update_state_seconds", "Time to apply a block to the state"
+)
+SIGNATURE_SECONDS = Histogram(
+    "blockchat_signature_verification_seconds",
+    "Time to verify the signature of one transaction, or of a batch",
+    ["mode"],
+)
+
 
 class State:
     def __init__(
@@ -19,24 +39,196 @@ class State:
     ):
         self.blockchain = blockchain
         self.wallets = wallets
-        self.stakes = [0] * node_num
+        # the balances and stakes of the wallets, in columns indexed by node id
+        self.ledger = Ledger(node_num)
+        for wallet in wallets:
+            self.ledger.bind(wallet)
+        self.stake_index = StakeIndex(self.stakes)
         self.current_fees = 0  # total fees corresponding to transactions of one block
         self.test = "state"
         self.my_wallet = my_wallet
-        self.conversations = {i: [] for i in range(node_num)}
+        # messages of this node committed in blocks, per peer
+        self.conversations = ConversationStore()
 
         self.public_key_to_node_id = {
             tuple(wallet.public_key): wallet.node_id for wallet in wallets
         }
         self.my_nonce = 0
-        self.block_waiting_room = {}
+        self.nonce_lock = threading.Lock()
+        # blocks that arrived ahead of the chain, in a min-heap of (index, block)
+        self.block_waiting_room = []
+        self.waiting_room_indices = set()
         self.waiting_for_block = None
-        self.lock = RLock()
+        # chain_lock guards block application: the blockchain, hard amounts, stakes and
+        # conversations. mempool_lock guards admission: the inbox and soft amounts. Block
+        # application needs both and always takes chain_lock first, so admission must
+        # release mempool_lock before closing a block (see finish_admission)
+        self.chain_lock = TimedLock("chain")
+        self.mempool_lock = TimedLock("mempool")
         self.validation_count = [0] * node_num
 
+        # keys of the inbox transactions each wallet takes part in (as sender or
+        # receiver), mapped to their arrival seq. Used to re-check only the wallets a block touches
+        self.pending_by_wallet = {i: OrderedDict() for i in range(node_num)}
+        self.inbox_seq = 0
+        # the inbox ordered by fees and per sender by nonce, for mint_block
+        self.mempool = Mempool()
+        # initial transactions from bootstrap are dropped from the inbox once the
+        # first block is applied
+        self.init_transactions_pending = True
+        # with a block store, a snapshot of the state is saved every snapshot_interval blocks
+        self.snapshot_interval = 100
+        self.wallet_saved = False
+        # minted blocks are broadcast from its thread, outside the lock
+        self.block_propagator = BlockPropagator()
+
+        # fetches the blocks missing before a block of the waiting room
+        self.block_sync = BlockSync()
+
+        # told about every applied block while a load test runs (see utils/run_exp.py)
+        self.commit_tracker = None
+
+        # what the read endpoints serve, replaced after every block and admission
+        self.view = None
+        # node ids whose soft amounts admission changed since the last view
+        self.changed_wallets = set()
+        self.publish_view()
+
+    def chain_snapshot(self):
+        # the part of the snapshot every node shares, also sent by the bootstrap to the nodes
+        # it initializes (see utils/init_stream.py)
+        last_block = self.blockchain.block_list[-1]
+        return {
+            "block_index": last_block.index,
+            "head_hash": last_block.current_hash,
+            "capacity": self.blockchain.capacity,
+            "wallets": self.wallets_serialization(),
+            "stakes": list(self.stakes),
+            "lottery_members": list(self.stake_index.node_ids),
+            "validation_count": list(self.validation_count),
+            "indexes": self.blockchain.indexes_to_dict(),
+        }
+
+    def to_snapshot(self):
+        snapshot = self.chain_snapshot()
+        snapshot["conversations"] = self.conversations.to_dict()
+        snapshot["my_nonce"] = self.my_nonce
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot, blockchain, my_wallet):
+        wallets = State.wallets_deserialization(snapshot["wallets"])
+        state = cls(blockchain, wallets, len(snapshot["stakes"]), my_wallet)
+        state.set_stakes(snapshot["stakes"], snapshot.get("lottery_members"))
+        state.validation_count = snapshot["validation_count"]
+        state.conversations = ConversationStore.from_dict(snapshot["conversations"])
+        state.my_nonce = snapshot["my_nonce"]
+        state.init_transactions_pending = False
+        if "indexes" in snapshot:
+            blockchain.load_indexes(snapshot["indexes"])
+        state.publish_view()
+        return state
+
+    @property
+    def stakes(self):
+        return self.ledger.hard_stake
+
+    def set_stakes(self, stakes, lottery_members=None):
+        if lottery_members is None:
+            lottery_members = range(len(stakes))
+        self.ledger.grow(len(stakes))
+        for node_id, stake in enumerate(stakes):
+            self.ledger.hard_stake[node_id] = stake
+        self.stake_index = StakeIndex(
+            [stakes[node_id] for node_id in lottery_members], lottery_members
+        )
+
+    def save_snapshot(self):
+        # the snapshot is a copy of the state, serialized and written by the thread of the
+        # block store, so update_state does not hold the locks while it reaches the disk
+        block_store = self.blockchain.block_store
+        if block_store is not None:
+            if not self.wallet_saved:
+                # once, in its own file: the snapshot does not hold the private key
+                block_store.save_wallet(self.my_wallet.to_dict())
+                self.wallet_saved = True
+            block_store.submit_snapshot(self.to_snapshot())
+
+    def replay_block(self, block):
+        # applies a block of the block store on restart
+        self.update_state(block)
+        validator_id = self.public_key_to_node_id[tuple(block.validator)]
+        self.validation_count[validator_id] += 1
+        for transaction in block.transactions:
+            if transaction.sender_public_key == self.my_wallet.public_key:
+                self.my_nonce = max(self.my_nonce, transaction.nonce + 1)
+
+    def publish_view(self, block_applied=True):
+        # called with the locks of the parts that changed held
+        last_view = self.view
+        if block_applied or last_view is None or len(last_view.wallets) != len(self.wallets):
+            wallets = self.wallets_serialization()
+        else:
+            # after an admission only the wallets it touched are serialized again, into a
+            # copy of the list of the last view
+            wallets = last_view.wallets
+            if self.changed_wallets:
+                wallets = list(wallets)
+                for node_id in self.changed_wallets:
+                    wallets[node_id] = self.wallets[node_id].to_dict()
+        self.changed_wallets.clear()
+
+        if block_applied or last_view is None:
+            last_block = self.blockchain.block_list[-1]
+            last_block_dict = last_block.to_dict()
+            # the genesis block has no validator wallet
+            validator = last_block.validator
+            last_block_dict["validator_id"] = (
+                self.public_key_to_node_id.get(tuple(validator))
+                if isinstance(validator, list)
+                else None
+            )
+            last_message_id = self.conversations.last_id
+            block_index = last_block.index
+        else:
+            last_block_dict = last_view.last_block
+            last_message_id = last_view.last_message_id
+            block_index = last_view.block_index
+
+        self.view = StateView(
+            block_index,
+            last_block_dict,
+            wallets,
+            self.conversations,
+            last_message_id,
+            self.blockchain,
+        )
+        if block_applied:
+            # wakes up the /conversations long polls once the view has the new messages
+            self.conversations.publish()
+
+    def finish_admission(self):
+        """
+        Called by the admission paths after validating transactions under mempool_lock, once
+        they released it: publishes the new soft amounts and closes a block if the inbox is full
+        """
+        with self.mempool_lock:
+            self.publish_view(block_applied=False)
+        if self.waiting_for_block or len(self.blockchain.transaction_inbox) < self.blockchain.capacity:
+            return
+        with self.chain_lock:
+            if not self.waiting_for_block:
+                self.block_val_process()
+
     def get_my_nonce(self):
-        nonce = self.my_nonce
-        self.my_nonce += 1
+        return self.reserve_nonces(1)
+
+    def reserve_nonces(self, count):
+        # transactions of this node are created from several request threads. Returns the
+        # first of count consecutive nonces
+        with self.nonce_lock:
+            nonce = self.my_nonce
+            self.my_nonce += count
         return nonce
 
     def wallets_serialization(self):
@@ -51,32 +243,66 @@ class State:
             wallets.append(PublicWallet.from_dict(wallet_data))
         return wallets
 
+    # Mempool admission, called with mempool_lock held. The caller then calls finish_admission
     def validate_transaction(self, transaction, verbose=False, check_signature=True):
 
         transaction_key = self.transaction_unique_id(transaction)
-        sender_public_key = transaction.sender_public_key
-        sender_wallet = self.find_wallet_from_public_key(sender_public_key)
+        sender_wallet = self.wallets[transaction.sender_id]
 
         if check_signature:
-            signature_verified = verify_signature(
-                transaction.signature,
-                transaction.sender_public_key,
-                transaction.create_transaction_string(),
-            )
+            with SIGNATURE_SECONDS.time("single"):
+                signature_verified = verify_digest(
+                    transaction.signature,
+                    transaction.sender_public_key,
+                    transaction.digest(),
+                )
             if not signature_verified:
                 response = f"Validation of transaction {transaction_key} of type {transaction.type} failed: error verifying the signature"
                 if verbose:
                     print(response)
                 return False, response
 
+        if self.is_committed(transaction_key) or transaction_key in self.blockchain.transaction_inbox:
+            # a gossip copy of a transaction already in a block, or sent again
+            response = f"Validation of transaction {transaction_key} failed: nonce already used"
+            if verbose:
+                print(response)
+            return False, response
+
+        if transaction.is_init == 1:
+            # welcome transaction of a node joining after the genesis, paid by the bootstrap
+            # when its block is applied (see activate_member)
+            receiver_id = transaction.receiver_id
+            if (
+                sender_wallet.node_id != 0
+                or receiver_id is None
+                or self.is_lottery_member(receiver_id)
+            ):
+                response = f"Validation of welcome transaction {transaction_key} failed"
+                if verbose:
+                    print(response)
+                return False, response
+            if not self.has_enough_amount(transaction, sender_wallet.node_id):
+                response = f"Validation of welcome transaction {transaction_key} failed: the bootstrap cannot pay it"
+                if verbose:
+                    print(response)
+                return False, response
+            self.add_to_inbox(transaction_key, transaction)
+            self.apply_soft_debit(transaction, sender_wallet.node_id)
+            self.apply_soft_credit(transaction, receiver_id)
+            return True, f"Welcome transaction {transaction_key} is valid"
+
         total_amount = transaction.total_amount
 
         valid_amount = True
 
         if transaction.type == "stake":
-            valid_amount = total_amount >= 0
+            # stakes are whole coins, they are drawn from in the proof of stake
+            valid_amount = total_amount >= 0 and total_amount == int(total_amount)
         elif transaction.type == "coins":
             valid_amount = total_amount > 0
+        if transaction.type != "stake" and transaction.receiver_id is None:
+            valid_amount = False
 
         if not valid_amount:
             response = f"Validation of transaction {transaction_key} of type {transaction.type} failed: Amount not valid"
@@ -84,17 +310,7 @@ class State:
                 print(response)
             return False, response
 
-        enough_amount = False
-
-        if transaction.type == "stake":
-            enough_amount = (
-                sender_wallet.soft_amount + sender_wallet.soft_stake
-            ) > total_amount
-        else:
-            if total_amount > sender_wallet.soft_amount:
-                enough_amount = False
-            else:
-                enough_amount = True
+        enough_amount = self.has_enough_amount(transaction, sender_wallet.node_id)
 
         if not enough_amount:
             response = f"Validation of transaction {transaction_key} of type {transaction.type} failed: Not enough BCC to perform transaction"
@@ -103,33 +319,204 @@ class State:
             return False, response
 
         # Transaction is valid
-        self.blockchain.transaction_inbox[transaction_key] = transaction
-
-        fees = transaction.fees
-        total_amount = transaction.total_amount
-
-        if transaction.type == "stake":
-            sender_wallet.soft_amount += sender_wallet.soft_stake - total_amount
-            sender_wallet.soft_stake = total_amount
-        else:
-            sender_wallet.soft_amount -= total_amount
+        self.add_to_inbox(transaction_key, transaction)
 
+        self.apply_soft_debit(transaction, sender_wallet.node_id)
         if transaction.type != "stake":  # coins and message transactions
-            receiver_public_key = transaction.receiver_public_key
-            receiver_wallet = self.find_wallet_from_public_key(receiver_public_key)
-            receiver_wallet.soft_amount += total_amount - fees
+            self.apply_soft_credit(transaction, transaction.receiver_id)
 
-        if self.waiting_for_block:
-            pass
-        else:
-            self.block_val_process()
-        
         return (
             True,
             f"Transaction {transaction_key} of type {transaction.type} is valid",
         )
 
+    def load_inbox(self, transactions):
+        """
+        Admits the inbox the bootstrap sent to a node it initializes, in arrival order. The
+        soft amounts are computed again from the hard ones as the transactions are validated,
+        as they were on the bootstrap. The bootstrap validated the signatures
+        """
+        ledger = self.ledger
+        ledger.soft_amount[:] = ledger.hard_amount
+        ledger.soft_stake[:] = ledger.hard_stake
+        with self.mempool_lock:
+            for transaction in transactions:
+                if transaction.is_init == 1 and self.welcome_amount(transaction) == 0:
+                    # welcome transactions of the genesis nodes, already paid on registration
+                    self.add_to_inbox(self.transaction_unique_id(transaction), transaction)
+                else:
+                    self.validate_transaction(transaction, verbose=True, check_signature=False)
+
+    def verify_transactions(self, transactions):
+        """
+        Verifies the signatures of a list of transactions on the verification process pool.
+        Called before taking the lock, so that only transactions with a valid signature enter
+        validate_transaction (with check_signature=False)
+        """
+        with SIGNATURE_SECONDS.time("batch"):
+            return verify_signatures(
+                [
+                    (
+                        transaction.signature,
+                        transaction.sender_public_key,
+                        transaction.digest(),
+                    )
+                    for transaction in transactions
+                ]
+            )
+
+    def welcome_amount(self, transaction):
+        # the coins a welcome transaction moves when its block is applied: none for the nodes
+        # of the genesis, paid on registration
+        if self.is_lottery_member(self.receiver_id(transaction)):
+            return 0
+        return transaction.amount
+
+    def has_enough_amount(self, transaction, sender_id):
+        if transaction.is_init == 1:
+            return self.welcome_amount(transaction) <= self.ledger.soft_amount[sender_id]
+        total_amount = transaction.total_amount
+        if transaction.type == "stake":
+            return (self.ledger.soft_amount[sender_id] + self.ledger.soft_stake[sender_id]) > total_amount
+        return total_amount <= self.ledger.soft_amount[sender_id]
+
+    def apply_soft_debit(self, transaction, sender_id):
+        self.changed_wallets.add(sender_id)
+        ledger = self.ledger
+        total_amount = transaction.total_amount
+        if transaction.is_init == 1:
+            soft_amount = ledger.soft_amount[sender_id] - self.welcome_amount(transaction)
+        elif transaction.type == "stake":
+            soft_amount = ledger.soft_amount[sender_id] + ledger.soft_stake[sender_id] - total_amount
+            ledger.soft_stake[sender_id] = int(total_amount)
+        else:
+            soft_amount = ledger.soft_amount[sender_id] - total_amount
+        ledger.soft_amount[sender_id] = round_amount(soft_amount)
+
+    def apply_soft_credit(self, transaction, receiver_id):
+        self.changed_wallets.add(receiver_id)
+        if transaction.is_init == 1:
+            credit = self.welcome_amount(transaction)
+        else:
+            credit = transaction.total_amount - transaction.fees
+        self.ledger.soft_amount[receiver_id] = round_amount(self.ledger.soft_amount[receiver_id] + credit)
+
+    def add_to_inbox(self, transaction_key, transaction):
+        self.inbox_seq += 1
+        self.blockchain.transaction_inbox[transaction_key] = transaction
+        self.mempool.add(transaction_key, transaction, self.inbox_seq)
+        self.pending_by_wallet[transaction_key[0]][transaction_key] = self.inbox_seq
+        receiver_id = self.receiver_id(transaction)
+        if receiver_id is not None:
+            self.pending_by_wallet[receiver_id][transaction_key] = self.inbox_seq
+
+    def remove_from_inbox(self, transaction_key):
+        transaction = self.blockchain.transaction_inbox.pop(transaction_key)
+        self.mempool.remove(transaction_key)
+        self.pending_by_wallet[transaction_key[0]].pop(transaction_key, None)
+        if transaction.type != "stake":
+            receiver_id = self.resolve_ids(transaction).receiver_id
+            if receiver_id is not None:
+                self.pending_by_wallet[receiver_id].pop(transaction_key, None)
+        return transaction
+
+    def receiver_id(self, transaction):
+        if transaction.type == "stake":
+            return None
+        receiver_id = self.resolve_ids(transaction).receiver_id
+        if receiver_id is None:
+            raise KeyError(f"Unknown receiver of transaction {transaction.nonce}")
+        return receiver_id
+
+    def recheck_inbox(self, recheck_until, soft_deltas):
+        """
+        Re-validates the inbox after a block, replaying in arrival order only the pending
+        transactions of the wallets whose soft balance may have dropped.
+
+        recheck_until maps a node_id to the arrival seq up to which its transactions must
+        be re-checked (None for all of them). Past that point the soft balance history of
+        the wallet is the same as before the block, so its final soft balance is the old
+        one plus soft_deltas. When a transaction is dropped, the sender and the receiver
+        are re-checked from that point on, since the receiver loses a pending credit.
+        """
+        inbox = self.blockchain.transaction_inbox
+        limits = {}  # node_id -> seq (None for no limit) up to which the wallet is replayed
+        old_soft = {}
+        queued = set()
+        heap = []
+
+        ledger = self.ledger
+
+        def start_recheck(node_id, from_seq, until_seq):
+            pending = self.pending_by_wallet[node_id]
+            if node_id in limits and (limits[node_id] is None or from_seq < limits[node_id]):
+                # the wallet is already replayed up to from_seq
+                start_seq = limits[node_id]
+                if start_seq is None:
+                    return
+            else:
+                # soft balance right before from_seq. Earlier transactions are unaffected
+                old_soft.setdefault(node_id, (ledger.soft_amount[node_id], ledger.soft_stake[node_id]))
+                ledger.soft_amount[node_id] = ledger.hard_amount[node_id]
+                ledger.soft_stake[node_id] = ledger.hard_stake[node_id]
+                for transaction_key, seq in pending.items():
+                    if seq >= from_seq:
+                        break
+                    self.apply_pending(transaction_key, inbox[transaction_key], node_id)
+                start_seq = from_seq
+            limits[node_id] = until_seq
+            for transaction_key, seq in pending.items():
+                if until_seq is not None and seq >= until_seq:
+                    break
+                if seq >= start_seq and transaction_key not in queued:
+                    queued.add(transaction_key)
+                    heappush(heap, (seq, transaction_key))
+
+        def is_replayed(node_id, seq):
+            return node_id in limits and (limits[node_id] is None or seq < limits[node_id])
+
+        for node_id, until_seq in recheck_until.items():
+            start_recheck(node_id, -1, until_seq)
+
+        while heap:
+            seq, transaction_key = heappop(heap)
+            if transaction_key not in inbox:
+                continue
+            transaction = inbox[transaction_key]
+            sender_id = transaction_key[0]
+            receiver_id = self.receiver_id(transaction)
+
+            if is_replayed(sender_id, seq):
+                if not self.has_enough_amount(transaction, sender_id):
+                    self.remove_from_inbox(transaction_key)
+                    start_recheck(sender_id, seq, None)
+                    if receiver_id is not None and receiver_id != sender_id:
+                        start_recheck(receiver_id, seq, None)
+                    continue
+                self.apply_soft_debit(transaction, sender_id)
+            if receiver_id is not None and is_replayed(receiver_id, seq):
+                self.apply_soft_credit(transaction, receiver_id)
+
+        for node_id in limits.keys() | soft_deltas.keys():
+            if node_id in limits and limits[node_id] is None:
+                continue
+            if node_id in old_soft:
+                ledger.soft_amount[node_id], ledger.soft_stake[node_id] = old_soft[node_id]
+            ledger.soft_amount[node_id] = round_amount(ledger.soft_amount[node_id] + soft_deltas.get(node_id, 0))
+
+    def apply_pending(self, transaction_key, transaction, node_id):
+        # applies a pending transaction to the soft balance of a wallet taking part in it
+        if transaction_key[0] == node_id:
+            self.apply_soft_debit(transaction, node_id)
+        if self.receiver_id(transaction) == node_id:
+            self.apply_soft_credit(transaction, node_id)
+
     def block_val_process(self):
+        # called with chain_lock held
+        with self.mempool_lock:
+            self.close_block()
+
+    def close_block(self):
         # if capacity is full, a new block must be created
         if len(self.blockchain.transaction_inbox) >= self.blockchain.capacity:
             new_block_index = self.blockchain.block_list[-1].index + 1
@@ -138,7 +525,7 @@ class State:
             )
             seed = self.blockchain.block_list[-1].current_hash
             seed = int(("0x" + str(seed)), 16)
-            validator_id = proof_of_stake(self.stakes, seed)
+            validator_id = self.stake_index.select(seed)
             print(f"Proof of stake ended with validator node_id {validator_id}")
             self.validation_count[validator_id] += 1
 
@@ -148,28 +535,23 @@ class State:
                 print(
                     f"Broadcasting block with index {minted_block.index} to all nodes"
                 )
-                # success is true if the validation of the block from every node is correct
+                # queued before update_state, which may mint the next block, to keep the order
                 self.add_block(minted_block)
+                self.block_propagator.submit(minted_block, self)
                 self.update_state(minted_block)
-                success = self.broadcast_block(minted_block)
-
-                # if success:
-
-                #     # print(
-                #     #     f"Block with index {minted_block.index} succesfully broadcasted to all nodes"
-                #     # )
-                # else:
-                #     print(f"Broadcast of block with index {minted_block.index} failed")
             else:
                 self.waiting_for_block = new_block_index
 
                 
 
     def mint_block(self):
-        transactions_list = list(self.blockchain.transaction_inbox.values())[:self.blockchain.capacity]
-        keys = list(self.blockchain.transaction_inbox.keys())[:self.blockchain.capacity]
-        for key in keys:
-            del self.blockchain.transaction_inbox[key]
+        # the transactions stay in the inbox until update_state applies the block
+        transactions_list = self.mempool.select(self.blockchain.capacity, self.block_budget())
+        if not transactions_list:
+            # nothing fits on the hard amounts: arrival order, as the inbox was validated
+            transactions_list = list(
+                islice(self.blockchain.transaction_inbox.values(), self.blockchain.capacity)
+            )
 
         validator_public_key = self.my_wallet.public_key
         new_block = Block(
@@ -181,7 +563,61 @@ class State:
         )
         return new_block
 
+    def block_budget(self):
+        """
+        fits() for Mempool.select: whether a transaction can be applied on the hard amounts
+        after the ones selected so far, as update_state will. Transactions taken out of arrival
+        order may depend on credits of transactions that are not in the block
+        """
+        amounts = {}
+        stakes = {}
+        hard_amount = self.ledger.hard_amount
+        validator_id = self.my_wallet.node_id
+
+        def fits(transaction):
+            sender_id = transaction.sender_id
+            amount = amounts.get(sender_id, hard_amount[sender_id])
+            stake = stakes.get(sender_id, self.ledger.hard_stake[sender_id])
+            total_amount = transaction.total_amount
+            if transaction.is_init == 1:
+                # paid by the bootstrap, see activate_member
+                welcome_amount = self.welcome_amount(transaction)
+                if welcome_amount > amount:
+                    return False
+                receiver_id = self.receiver_id(transaction)
+                amounts[sender_id] = round_amount(amount - welcome_amount)
+                amounts[receiver_id] = round_amount(
+                    amounts.get(receiver_id, hard_amount[receiver_id]) + welcome_amount
+                )
+            elif transaction.type == "stake":
+                if amount + stake <= total_amount:
+                    return False
+                amounts[sender_id] = round_amount(amount + stake - total_amount)
+                stakes[sender_id] = total_amount
+            else:
+                if total_amount > amount:
+                    return False
+                amounts[sender_id] = round_amount(amount - total_amount)
+                receiver_id = self.receiver_id(transaction)
+                amounts[receiver_id] = round_amount(
+                    amounts.get(receiver_id, hard_amount[receiver_id]) + total_amount - transaction.fees
+                )
+                amounts[validator_id] = round_amount(
+                    amounts.get(validator_id, hard_amount[validator_id]) + transaction.fees
+                )
+            return True
+
+        return fits
+
     def broadcast_block(self, block):
+        if use_binary():
+            return broadcast(
+                "/validateBlock",
+                None,
+                self.wallets,
+                self.my_wallet.node_address,
+                **binary_request(encode_block(block, self.public_key_to_node_id)),
+            )
         return broadcast(
             "/validateBlock",
             {"block": block.to_dict()},
@@ -191,8 +627,76 @@ class State:
 
 
     def add_wallet(self, wallet):
+        # the per-node arrays are sized for the nodes of the genesis, and grow for the ones
+        # joining after it
         self.wallets.append(wallet)
         self.public_key_to_node_id[tuple(wallet.public_key)] = wallet.node_id
+        if wallet.node_id >= len(self.validation_count):
+            self.validation_count.append(0)
+        self.ledger.bind(wallet)
+        self.pending_by_wallet.setdefault(wallet.node_id, OrderedDict())
+
+    def add_peers(self, peers):
+        # nodes that joined after the genesis, from /addPeer or /peers. Wallets are indexed by
+        # node id, so they are added in order and a gap stops at the first missing node
+        with self.chain_lock, self.mempool_lock:
+            for peer in sorted(peers, key=lambda peer: peer["node_id"]):
+                node_id = peer["node_id"]
+                if node_id != len(self.wallets):
+                    continue
+                self.add_wallet(PublicWallet(node_id, peer["address"], peer["public_key"], 0))
+                print(f"Node {node_id} at {peer['address']} joined the cluster")
+            self.publish_view()
+
+    def knows_keys(self, transactions):
+        # whether the senders and receivers of every transaction are wallets of this node
+        for transaction in transactions:
+            self.resolve_ids(transaction)
+            if transaction.sender_id is None:
+                return False
+            if transaction.type != "stake" and transaction.receiver_id is None:
+                return False
+        return True
+
+    def decode_from_peer(self, decode, data):
+        # binary payloads refer to public keys by node id, so the nodes this node missed are
+        # fetched before it gives up on one. Called before taking the locks
+        try:
+            return decode(data, self.wallets)
+        except UnknownNodeError:
+            fetch_peers(self)
+            return decode(data, self.wallets)
+
+    def learn_peers(self, transactions):
+        # called before taking the locks, for transactions or blocks from the peers
+        if not self.knows_keys(transactions):
+            fetch_peers(self)
+
+    def is_lottery_member(self, node_id):
+        return node_id in self.stake_index.positions
+
+    def activate_member(self, transaction, recheck_until):
+        """
+        Applies the welcome transaction of a node that joined after the genesis: the bootstrap
+        pays it its initial coins and it enters the proof of stake lottery. This happens when
+        the block with the transaction is applied, so at the same point of the chain on every node.
+        """
+        receiver_id = self.receiver_id(transaction)
+        if self.is_lottery_member(receiver_id):
+            return  # nodes of the genesis, paid by the bootstrap on registration
+        sender_id = self.resolve_ids(transaction).sender_id
+        hard_amount = self.ledger.hard_amount
+        # the pending soft amounts of both are re-checked, whether the transaction pays or not
+        recheck_until[sender_id] = None
+        recheck_until[receiver_id] = None
+        if hard_amount[sender_id] < transaction.amount:
+            # mint_block does not select it (see block_budget), but a block may still hold it
+            print(f"Welcome transaction of node {receiver_id} rejected: the bootstrap cannot pay it")
+            return
+        hard_amount[sender_id] = round_amount(hard_amount[sender_id] - transaction.amount)
+        hard_amount[receiver_id] = round_amount(hard_amount[receiver_id] + transaction.amount)
+        self.stake_index.append(receiver_id, self.stakes[receiver_id])
+        print(f"Node {receiver_id} joined the proof of stake lottery")
 
     def add_block(self, block):
         self.blockchain.add_block(block)
@@ -201,28 +705,37 @@ class State:
         wallet = self.wallets[self.public_key_to_node_id[tuple(public_key)]]
         return wallet
 
-    def validate_block(self, block):
+    # Block application, called with chain_lock held
+    def validate_block(self, block, from_sync=False):
         new_block_index = self.blockchain.block_list[-1].index + 1
         incoming_validator_public_key = block.validator
         incoming_validator_id = self.find_wallet_from_public_key(
             incoming_validator_public_key
         ).node_id
-        if new_block_index != block.index:
-            self.block_waiting_room[block.index] = block
+        if block.index < new_block_index:
+            print(
+                f"Block with index {block.index} from node {incoming_validator_id} is already in the blockchain"
+            )
+            return False
+        elif block.index > new_block_index:
+            if block.index not in self.waiting_room_indices:
+                self.waiting_room_indices.add(block.index)
+                heappush(self.block_waiting_room, (block.index, block))
 
             print(
                 f"Block with index {block.index} from node {incoming_validator_id} is out of line"
             )
+            # the blocks in between are fetched from the peers
+            if not from_sync:
+                self.block_sync.request(self, block.index - 1)
             return False
         else:
             self.waiting_for_block = None
 
-
-
         current_seed = self.blockchain.block_list[-1].current_hash
         current_seed = int(("0x" + str(current_seed)), 16)
         # current_seed = block.index
-        current_validator_id = proof_of_stake(self.stakes, current_seed)
+        current_validator_id = self.stake_index.select(current_seed)
         current_validator_public_key = self.wallets[current_validator_id].public_key
 
         is_correct_validator = (
@@ -234,10 +747,18 @@ class State:
             current_hash_of_previous_block == block.previous_hash
         )
 
+        if not self.knows_keys(block.transactions):
+            # update_state could not apply it (see learn_peers)
+            print(
+                f"Failed to validate block with index {block.index} from node {incoming_validator_id}: unknown public key"
+            )
+            return False
+
         if is_correct_validator and is_correct_current_hash_of_previous_block:
             print(f"Validated block with index {block.index}. Adding to blockchain")
-            self.add_block(block)
-            self.update_state(block)
+            with self.mempool_lock:
+                self.add_block(block)
+                self.update_state(block)
             return True
         else:
             print(
@@ -245,75 +766,153 @@ class State:
             )
             return False
 
-    def transaction_unique_id(self, transaction):
-        sender_public_key = tuple(transaction.sender_public_key)
-        node_id = self.public_key_to_node_id[tuple(sender_public_key)]
-        nonce = transaction.nonce
-        key = (node_id, nonce)
-        return key
+    def drain_waiting_room(self):
+        # applies the blocks of the waiting room that are next in line, called with chain_lock held
+        while self.block_waiting_room:
+            index, block = self.block_waiting_room[0]
+            if index > self.blockchain.block_list[-1].index + 1:
+                break
+            heappop(self.block_waiting_room)
+            self.waiting_room_indices.discard(index)
+            if index == self.blockchain.block_list[-1].index + 1:
+                self.validate_block(block)
+
+    def is_committed(self, transaction_key):
+        return self.blockchain.committed_nonces.contains(*transaction_key)
+
+    def resolve_ids(self, transaction):
+        # the public keys of a transaction are looked up once, its ids are kept on it
+        if transaction.sender_id is None:
+            transaction.sender_id = self.public_key_to_node_id.get(tuple(transaction.sender_public_key))
+        if transaction.receiver_id is None and transaction.type != "stake":
+            transaction.receiver_id = self.public_key_to_node_id.get(
+                tuple(transaction.receiver_public_key)
+            )
+        return transaction
 
+    def transaction_unique_id(self, transaction):
+        node_id = self.resolve_ids(transaction).sender_id
+        if node_id is None:
+            raise KeyError(f"Unknown sender of transaction {transaction.nonce}")
+        return (node_id, transaction.nonce)
+
+    def index_block(self, block):
+        # called for every block in chain order, once
+        if block.index <= self.blockchain.indexed_height:
+            return
+        records = []
+        for position, transaction in enumerate(block.transactions):
+            sender_id = self.resolve_ids(transaction).sender_id
+            receiver_id = transaction.receiver_id if transaction.type != "stake" else None
+            records.append((position, sender_id, transaction.nonce, receiver_id))
+        self.blockchain.index_transactions(block, records)
+
+    # called with chain_lock and mempool_lock held
     def update_state(self, block):
+        start = time.perf_counter()
         validator_id = self.public_key_to_node_id[tuple(block.validator)]
+        self.index_block(block)
+        inbox = self.blockchain.transaction_inbox
+
+        # node_id -> arrival seq up to which the pending transactions of the wallet must be
+        # re-checked (None for all of them), and changes to the final soft amounts of the rest
+        recheck_until = {}
+        soft_deltas = {}
+
+        # the coins and message transactions of the block, applied to the hard amounts
+        # together by the ledger after the loop
+        ledger = self.ledger
+        senders, receivers, totals, fees_list = ledger.transfer_columns()
+        my_id = self.my_wallet.node_id
 
-        # update hard amounts based on the transactions in the new block
         for transaction in block.transactions:
             if transaction.is_init == 0:
                 key = self.transaction_unique_id(transaction)
-
-                sender_public_key = transaction.sender_public_key
-                sender_wallet = self.find_wallet_from_public_key(sender_public_key)
+                sender_id = key[0]
+                is_pending = key in inbox
 
                 total_amount = transaction.total_amount
 
                 if transaction.type == "stake":
-                    sender_id = sender_wallet.node_id
-                    old_stake = self.stakes[sender_id]
-                    sender_wallet.hard_amount += old_stake - total_amount
-                    self.stakes[sender_id] = total_amount
-                    sender_wallet.hard_stake = total_amount
-                    sender_wallet.soft_stake = total_amount
+                    total_amount = int(total_amount)
+                    ledger.hard_amount[sender_id] = round_amount(
+                        ledger.hard_amount[sender_id] + ledger.hard_stake[sender_id] - total_amount
+                    )
+                    ledger.hard_stake[sender_id] = total_amount
+                    ledger.soft_stake[sender_id] = total_amount
+                    self.stake_index.set(sender_id, total_amount)
+                    recheck_until[sender_id] = None
                 else:  # for coins and message transactions
-                    sender_wallet.hard_amount -= total_amount
                     fees = transaction.fees
-                    self.wallets[validator_id].hard_amount += fees
-                    receiver_public_key = transaction.receiver_public_key
-                    receiver_wallet = self.find_wallet_from_public_key(
-                        receiver_public_key
-                    )
-                    receiver_wallet.hard_amount += total_amount - fees
+                    receiver_id = self.receiver_id(transaction)
+                    senders.append(sender_id)
+                    receivers.append(receiver_id)
+                    totals.append(total_amount)
+                    fees_list.append(fees)
+                    soft_deltas[validator_id] = soft_deltas.get(validator_id, 0) + fees
+
+                    if is_pending:
+                        # the debit moves from the inbox to the hard amount, so only the
+                        # soft balance history before this transaction is lower
+                        seq = self.pending_by_wallet[sender_id][key]
+                        if sender_id not in recheck_until:
+                            recheck_until[sender_id] = seq
+                        elif recheck_until[sender_id] is not None:
+                            recheck_until[sender_id] = max(recheck_until[sender_id], seq)
+                    else:
+                        recheck_until[sender_id] = None
+                        soft_deltas[receiver_id] = (
+                            soft_deltas.get(receiver_id, 0) + total_amount - fees
+                        )
 
                     if transaction.type == "message":
 
-                        if self.my_wallet.node_id == sender_wallet.node_id:
-                            self.conversations[receiver_wallet.node_id].append(
-                                [
-                                    "me"
-                                    # + str(key[1])
-                                    ,
-                                    transaction.message,
-                                ]
+                        if my_id == sender_id:
+                            self.conversations.append(
+                                receiver_id, "me", transaction.message, block.index
                             )
-                        elif self.my_wallet.node_id == receiver_wallet.node_id:
-                            self.conversations[sender_wallet.node_id].append(
-                                [
-                                    "node" + str(sender_wallet.node_id)
-                                    # + str(key[1])
-                                    ,
-                                    transaction.message,
-                                ]
+                        elif my_id == receiver_id:
+                            self.conversations.append(
+                                sender_id,
+                                "node" + str(sender_id),
+                                transaction.message,
+                                block.index,
                             )
-                if key in self.blockchain.transaction_inbox:
-                    del self.blockchain.transaction_inbox[key]
-                else:
-                    self.blockchain.blockchain_transactions[key] = transaction
+                if is_pending:
+                    self.remove_from_inbox(key)
+            else:
+                key = self.transaction_unique_id(transaction)
+                self.activate_member(transaction, recheck_until)
+                if key in inbox:
+                    self.remove_from_inbox(key)
 
-        # update soft amounts to much the updated hard amounts
-        for wallet in self.wallets:
-            wallet.soft_amount = wallet.hard_amount
-        # re-validate the remaining transactions
-        remaining_transactions = list(self.blockchain.transaction_inbox.values())
-        self.blockchain.transaction_inbox.clear()
-        for transaction in remaining_transactions:
-            if transaction.is_init != 1:
-                self.validate_transaction(transaction, check_signature=False)
+        ledger.apply_transfers(senders, receivers, totals, fees_list, validator_id)
+
+        if self.init_transactions_pending:
+            self.init_transactions_pending = False
+            # the welcome transactions of the genesis nodes, already paid on registration
+            init_keys = [
+                key
+                for key, transaction in inbox.items()
+                if transaction.is_init == 1
+                and self.is_lottery_member(self.receiver_id(transaction))
+            ]
+            for key in init_keys:
+                self.remove_from_inbox(key)
+
+        # re-validate the remaining transactions of the wallets the block touched
+        self.recheck_inbox(recheck_until, soft_deltas)
 
+        self.publish_view()
+
+        if self.commit_tracker is not None:
+            self.commit_tracker.on_block(block)
+
+        if block.index % self.snapshot_interval == 0:
+            self.save_snapshot()
+
+        # the next block this node may close is timed on its own
+        UPDATE_STATE_SECONDS.observe(time.perf_counter() - start)
+
+        if not self.waiting_for_block:
+            self.block_val_process()
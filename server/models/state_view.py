@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from heapq import merge
+from itertools import islice, repeat
+
+# tags of the locations of /transactions, sent first so that a transaction a node sent to
+# itself is listed once, as sent
+SENT = 0
+RECEIVED = 1
+ROLES = ("sent", "received")
+
+
+class StateView:
+    """
+    Read-only copy of the parts of the State served by /balance, /view and /conversations.
+    State.publish_view builds a new one after every block and every admission (serializing
+    again only the wallets an admission changed), and replaces the reference in one
+    assignment, so readers see a consistent state without any lock.
+    Messages only get appended to the conversation store, so the view keeps the id of its last
+    message instead of a copy.
+
+    The blocks and the indexes of the committed transactions (see State.index_block) are also
+    only appended to, so /block, /blocks, /transactions and /proof read them through the view,
+    up to its block.
+    """
+
+    def __init__(self, block_index, last_block, wallets, conversations, last_message_id, blockchain):
+        self.block_index = block_index
+        self.last_block = last_block
+        self.wallets = wallets
+        self.conversations = conversations
+        self.last_message_id = last_message_id
+        self.blockchain = blockchain
+
+    def get_conversations(self, since=0, limit=100, peer=None):
+        return self.conversations.read(since, limit, peer, until=self.last_message_id)
+
+    def get_block(self, index):
+        if index < 0 or index > self.block_index:
+            return None
+        return self.blockchain.get_block(index)
+
+    def get_blocks_range(self, from_index, to_index):
+        # blocks from_index..to_index (inclusive) of the view, in order
+        blocks = []
+        for index in range(from_index, min(to_index, self.block_index) + 1):
+            block = self.blockchain.get_block(index)
+            if block is None:
+                break
+            blocks.append(block)
+        return blocks
+
+    def get_block_by_hash(self, block_hash):
+        index = self.blockchain.block_indices.get(block_hash)
+        return None if index is None else self.get_block(index)
+
+    def transaction_location(self, sender_id, nonce):
+        location = self.blockchain.transaction_locations.get((sender_id, nonce))
+        if location is None or location[0] > self.block_index:
+            return None
+        return location
+
+    def account_transactions(self, node_id, role="all", after=None, limit=50):
+        """
+        A page of the transactions node_id sent, received or both (role), in chain order, after
+        the (block index, position) cursor. Returns the entries and the cursor of the next page,
+        None on the last one.
+        """
+        lists = []
+        if role in ("sent", "all"):
+            lists.append((self.blockchain.sent_locations.get(node_id, []), SENT))
+        if role in ("received", "all"):
+            lists.append((self.blockchain.received_locations.get(node_id, []), RECEIVED))
+        tagged = []
+        for locations, tag in lists:
+            start = 0 if after is None else bisect_right(locations, after)
+            tagged.append(zip(islice(locations, start, None), repeat(tag)))
+
+        page = []
+        for location, tag in merge(*tagged):
+            if location[0] > self.block_index:
+                break  # indexed after this view
+            if page and page[-1][0] == location:
+                continue  # sent to itself, in both lists
+            if len(page) == limit:
+                return self.location_entries(page), page[-1][0]
+            page.append((location, tag))
+        return self.location_entries(page), None
+
+    def location_entries(self, tagged_locations):
+        # (location, tag) pairs, with a None tag for an entry without a role
+        entries = []
+        block = None
+        for (block_index, position), tag in tagged_locations:
+            if block is None or block.index != block_index:
+                block = self.blockchain.get_block(block_index)
+            entry = {
+                "block_index": block_index,
+                "position": position,
+                "transaction": block.transactions[position].to_dict(),
+            }
+            if tag is not None:
+                entry["role"] = ROLES[tag]
+            entries.append(entry)
+        return entries
+
+    def transaction_proof(self, sender_id, nonce):
+        """
+        Inclusion proof of the transaction (sender_id, nonce): the block header, the transaction,
+        and the Merkle path from its digest to the root of the header. None if it is not in a block.
+        """
+        location = self.transaction_location(sender_id, nonce)
+        if location is None:
+            return None
+        block_index, position = location
+        block = self.blockchain.get_block(block_index)
+        return {
+            "block": block.header_to_dict(),
+            "transaction": block.transactions[position].to_dict(),
+            "position": position,
+            "proof": block.get_merkle_proof(position),
+        }
@@ -1,4 +1,5 @@
 from math import ceil
+from hashlib import sha256
 
 
 class Transaction:
@@ -25,8 +26,30 @@ class Transaction:
         self.is_init = is_init
         self.fees, self.total_amount = self.compute_fees()
 
+        # The fields above are not changed after construction (signature and is_init are not
+        # part of the transaction string), so the string and its digest are computed once
+        self._transaction_string = None
+        self._digest = None
+        # node ids of the sender and the receiver, resolved by State.resolve_ids
+        self.sender_id = None
+        self.receiver_id = None
+
     # Return the concatenation of every field of a transaction
     def create_transaction_string(self):
+        if self._transaction_string is None:
+            self._transaction_string = self.build_transaction_string()
+        return self._transaction_string
+
+    def canonical_bytes(self):
+        return self.create_transaction_string().encode("utf-8")
+
+    # sha256 digest of the transaction string: what gets signed, and the leaf of the block's Merkle tree
+    def digest(self):
+        if self._digest is None:
+            self._digest = sha256(self.canonical_bytes()).digest()
+        return self._digest
+
+    def build_transaction_string(self):
         str_nonce = str(self.nonce)
         str_sender_public_key = str(self.sender_public_key[0]) + str(
             self.sender_public_key[1]
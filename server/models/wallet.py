@@ -1,12 +1,33 @@
-from utils.crypto import generate_key_pairs, sign_message, verify_signature
+from utils.crypto import PrivateKey, generate_key_pairs, sign_digest, sign_digests, verify_digest
 from models.transaction import Transaction
+from models.ledger import LedgerField
 
 
 class PrivateWallet:
-    def __init__(self, node_id, node_address):
+    def __init__(self, node_id, node_address, public_key=None, private_key=None):
         self.node_id = node_id
         self.node_address = node_address
-        self.public_key, self.private_key = generate_key_pairs()
+        if public_key is None:
+            self.public_key, self.private_key = generate_key_pairs()
+        else:
+            self.public_key, self.private_key = public_key, private_key
+
+    def to_dict(self):
+        return {
+            "node_id": self.node_id,
+            "node_address": self.node_address,
+            "public_key": self.public_key,
+            "private_key": self.private_key.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, wallet_dict):
+        return cls(
+            wallet_dict["node_id"],
+            wallet_dict["node_address"],
+            wallet_dict["public_key"],
+            PrivateKey.from_dict(wallet_dict["private_key"]),
+        )
 
     def create_transaction(
         self,
@@ -29,31 +50,50 @@ class PrivateWallet:
         )
 
         def sign_transaction(transaction):
-            message_to_sign = transaction.create_transaction_string()
-            signature = sign_message(message_to_sign, self.private_key)
-            return signature
+            return sign_digest(transaction.digest(), self.private_key)
 
         signature = sign_transaction(new_transaction)
         new_transaction.signature = signature
         return new_transaction
 
+    def create_transactions(self, fields):
+        """Transactions from (receiver_public_key, type, amount, message, nonce) tuples, signed as a batch"""
+        transactions = [
+            Transaction(self.public_key, receiver_public_key, type, amount, message, nonce)
+            for receiver_public_key, type, amount, message, nonce in fields
+        ]
+        signatures = sign_digests(
+            [transaction.digest() for transaction in transactions], self.private_key
+        )
+        for transaction, signature in zip(transactions, signatures):
+            transaction.signature = signature
+        return transactions
+
     # TODO validation includes checking if amount of sender is enough
     def validate_transaction(transaction):
         def verify_transaction_signature():
-            return verify_signature(
+            return verify_digest(
                 transaction.get_signature,
                 transaction.get_sender_public_key(),
-                transaction.create_transaction_string(),
+                transaction.digest(),
             )
 
         return verify_transaction_signature()
 
 
 class PublicWallet:
+    # the balances live in the Ledger of the State once the wallet is added to it
+    hard_amount = LedgerField()
+    soft_amount = LedgerField()
+    hard_stake = LedgerField()
+    soft_stake = LedgerField()
+
     def __init__(self, node_id, node_address, public_key, amount, stake=0):
         self.node_id = node_id
         self.node_address = node_address
         self.public_key = public_key
+        self.ledger = None
+        self.unbound = {}
         self.soft_amount = amount
         self.hard_amount = amount
         self.soft_stake = stake
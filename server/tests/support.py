@@ -0,0 +1,65 @@
+# Builds States without a network, for the tests. Signatures are not checked, so the public
+# keys are made up
+import time
+from types import SimpleNamespace
+
+from models.block import Block
+from models.blockchain import Blockchain
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+
+
+def make_keys(count):
+    return [[hex(2**2047 + i), hex(65537)] for i in range(count)]
+
+
+def build_state(amounts, capacity, block_store=None, my_id=1, my_wallet=None):
+    public_keys = make_keys(len(amounts) + 2)
+    wallets = [
+        PublicWallet(i, f"127.0.0.1:{3000 + i}", public_keys[i], amount)
+        for i, amount in enumerate(amounts)
+    ]
+    blockchain = Blockchain([], capacity, block_store)
+    blockchain.add_block(Block(0, time.time(), [], 0, 1))
+    if my_wallet is None:
+        my_wallet = SimpleNamespace(
+            node_id=my_id, public_key=public_keys[my_id], node_address=f"127.0.0.1:{3000 + my_id}"
+        )
+    state = State(blockchain, wallets, len(amounts), my_wallet)
+    state.init_transactions_pending = False
+    # blocks are minted by the tests
+    state.waiting_for_block = -1
+    state.index_block(blockchain.block_list[0])
+    return state, public_keys
+
+
+def transaction(public_keys, sender_id, receiver_id, nonce, amount=0, type="message", message="hi"):
+    if type == "message":
+        return Transaction(public_keys[sender_id], public_keys[receiver_id], type, 0, message, nonce)
+    if type == "stake":
+        return Transaction(public_keys[sender_id], 0, type, amount, "", nonce)
+    return Transaction(public_keys[sender_id], public_keys[receiver_id], type, amount, "", nonce)
+
+
+def admit(state, transaction):
+    with state.mempool_lock:
+        valid = state.validate_transaction(transaction, check_signature=False)[0]
+    if valid:
+        state.finish_admission()
+    return valid
+
+
+def apply_block(state, transactions, validator_id=1):
+    last_block = state.blockchain.block_list[-1]
+    block = Block(
+        last_block.index + 1,
+        time.time(),
+        transactions,
+        state.wallets[validator_id].public_key,
+        last_block.current_hash,
+    )
+    with state.chain_lock, state.mempool_lock:
+        state.add_block(block)
+        state.update_state(block)
+    return block
@@ -0,0 +1,179 @@
+# Paging of the messages of a node by id, in ConversationStore and on /conversations, also
+# while blocks with new messages are committed.
+# Run from the server directory: python -m unittest discover tests
+import threading
+import time
+import unittest
+
+from app import create_app
+from cluster import node_settings
+from models.conversation_store import ConversationStore
+
+from support import apply_block, build_state, transaction
+
+NODE_NUM = 3
+CAPACITY = 5
+
+
+def filled_store(count, retention=1000):
+    # messages 1..count, alternately with peers 0 and 2
+    store = ConversationStore(retention)
+    for number in range(count):
+        store.append(2 * (number % 2), "me", f"m{number + 1}", number)
+    store.publish()
+    return store
+
+
+def ids(messages):
+    return [message["id"] for message in messages]
+
+
+def page(store, *args, **kwargs):
+    messages, has_more = store.read(*args, **kwargs)
+    return ids(messages), has_more
+
+
+class ConversationStoreTest(unittest.TestCase):
+    def test_page_boundaries(self):
+        store = filled_store(5)
+        self.assertEqual(page(store, 0, 2), ([1, 2], True))
+        self.assertEqual(page(store, 2, 2), ([3, 4], True))
+        # the last page, exactly limit messages long
+        self.assertEqual(page(store, 3, 2), ([4, 5], False))
+        self.assertEqual(page(store, 4, 2), ([5], False))
+
+    def test_empty_pages(self):
+        self.assertEqual(ConversationStore().read(), ([], False))
+        store = filled_store(5)
+        self.assertEqual(store.read(5), ([], False))
+        self.assertEqual(store.read(100), ([], False))
+        self.assertEqual(store.read(0, peer=1), ([], False))
+
+    def test_peer_pages(self):
+        store = filled_store(6)
+        self.assertEqual(page(store, 0, 2, peer=2), ([2, 4], True))
+        self.assertEqual(page(store, 4, 2, peer=2), ([6], False))
+
+    def test_unpublished_messages(self):
+        store = filled_store(3)
+        store.append(0, "me", "m4", 3)
+        self.assertEqual(ids(store.read()[0]), [1, 2, 3])
+        self.assertEqual(ids(store.read(until=4)[0]), [1, 2, 3, 4])
+        store.publish()
+        self.assertEqual(ids(store.read(3)[0]), [4])
+
+    def test_retention(self):
+        store = filled_store(7, retention=2)
+        # peer 0 has messages 1, 3, 5, 7: the ones before the last two are skipped, trimmed or not
+        self.assertEqual(ids(store.read(0, peer=0)[0]), [5, 7])
+        self.assertEqual(ids(store.read(0)[0]), [4, 5, 6, 7])
+        self.assertEqual(ids(store.read(5)[0]), [6, 7])
+
+    def test_round_trip(self):
+        store = ConversationStore.from_dict(filled_store(5, retention=2).to_dict())
+        self.assertEqual(store.last_id, 5)
+        self.assertEqual(ids(store.read(0)[0]), [2, 3, 4, 5])
+        store.append(0, "me", "m6", 5)
+        store.publish()
+        self.assertEqual(ids(store.read(5)[0]), [6])
+
+    def test_wait_for(self):
+        store = filled_store(2)
+        self.assertTrue(store.wait_for(1, 0.01))
+        self.assertFalse(store.wait_for(2, 0.01))
+
+        def publish():
+            time.sleep(0.05)
+            store.append(0, "me", "m3", 2)
+            store.publish()
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        self.assertTrue(store.wait_for(2, 5))
+        thread.join()
+
+
+class ConversationsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        # node 1, whose messages with nodes 0 and 2 are committed by the tests
+        self.state, self.public_keys = build_state([10**5] * NODE_NUM, CAPACITY)
+        self.nonces = [0] * NODE_NUM
+        app = create_app(node_settings(1, NODE_NUM, CAPACITY, 5000))
+        app.config["my_state"] = self.state
+        self.client = app.test_client()
+
+    def commit_messages(self, count):
+        transactions = []
+        for number in range(count):
+            sender_id, receiver_id = [(0, 1), (1, 2), (2, 1)][number % 3]
+            transactions.append(
+                transaction(self.public_keys, sender_id, receiver_id, self.nonces[sender_id])
+            )
+            self.nonces[sender_id] += 1
+        apply_block(self.state, transactions)
+
+    def get(self, **params):
+        response = self.client.get("/conversations", query_string=params)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_pages(self):
+        for _ in range(3):
+            self.commit_messages(CAPACITY)
+        seen = []
+        since = 0
+        while True:
+            result = self.get(since=since, limit=4)
+            seen.extend(ids(result["messages"]))
+            since = result["last_id"]
+            if not result["has_more"]:
+                break
+        self.assertEqual(seen, list(range(1, 3 * CAPACITY + 1)))
+
+        # an empty page keeps the cursor at the last message
+        result = self.get(since=since)
+        self.assertEqual((result["messages"], result["last_id"], result["has_more"]), ([], since, False))
+        self.assertEqual(self.get(since=1000)["last_id"], 1000)
+        self.assertEqual(ids(self.get(since=0, peer=2, limit=2)["messages"]), [2, 3])
+
+    def test_invalid_parameters(self):
+        for params in ({"since": "x"}, {"limit": 0}, {"peer": "x"}, {"wait": "x"}):
+            self.assertEqual(self.client.get("/conversations", query_string=params).status_code, 400)
+
+    def test_paging_while_blocks_commit(self):
+        blocks = 40
+        done = threading.Event()
+
+        def commit():
+            for _ in range(blocks):
+                self.commit_messages(CAPACITY)
+                time.sleep(0.001)
+            done.set()
+
+        writer = threading.Thread(target=commit)
+        writer.start()
+        seen = []
+        since = 0
+        while True:
+            finished = done.is_set()
+            result = self.get(since=since, limit=3)
+            seen.extend(ids(result["messages"]))
+            since = result["last_id"]
+            if finished and not result["has_more"]:
+                break
+        writer.join()
+        # every message once, in id order, without gaps
+        self.assertEqual(seen, list(range(1, blocks * CAPACITY + 1)))
+
+    def test_long_poll(self):
+        self.commit_messages(1)
+        writer = threading.Timer(0.05, self.commit_messages, (2,))
+        writer.start()
+        result = self.get(since=1, wait=5)
+        writer.join()
+        self.assertEqual(ids(result["messages"]), [2, 3])
+        self.assertEqual(self.get(since=3, wait=0.01)["messages"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
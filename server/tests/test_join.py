@@ -0,0 +1,220 @@
+# Welcome transactions of nodes joining a running cluster, paid by the bootstrap, and the
+# initialization of such a node from the snapshot of the head and the log tail.
+# Run from the server directory: python -m unittest discover tests
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+from app import create_app
+from cluster import node_settings
+from models.block import Block
+from models.block_store import BlockStore
+from models.blockchain import Blockchain
+from models.state import State
+from models.transaction import Transaction
+from models.wallet import PublicWallet
+from utils.init_stream import init_lines, receive_init_stream
+
+import support
+
+NODE_NUM = 3
+CAPACITY = 3
+
+
+def build_state(bootstrap_amount):
+    public_keys = [[hex(2**2047 + i), hex(65537)] for i in range(NODE_NUM + 2)]
+    amounts = [bootstrap_amount] + [1000] * (NODE_NUM - 1)
+    wallets = [
+        PublicWallet(i, f"127.0.0.1:{3000 + i}", public_keys[i], amounts[i])
+        for i in range(NODE_NUM)
+    ]
+    blockchain = Blockchain([Block(0, time.time(), [], 0, 1)], CAPACITY)
+    my_wallet = SimpleNamespace(node_id=1, public_key=public_keys[1], node_address="127.0.0.1:3001")
+    state = State(blockchain, wallets, NODE_NUM, my_wallet)
+    state.init_transactions_pending = False
+    # blocks are minted by the tests
+    state.waiting_for_block = -1
+    return state, public_keys
+
+
+def join(state, public_keys, node_id, nonce):
+    # what /talkToBootstrap and /addPeer do for a node joining after the genesis
+    state.add_wallet(PublicWallet(node_id, f"127.0.0.1:{3000 + node_id}", public_keys[node_id], 0))
+    transaction = Transaction(public_keys[0], public_keys[node_id], "coins", 1000, "welcome", nonce)
+    transaction.is_init = 1
+    return transaction
+
+
+def admit(state, transaction):
+    with state.mempool_lock:
+        return state.validate_transaction(transaction, check_signature=False)[0]
+
+
+def apply_block(state, transactions):
+    last_block = state.blockchain.block_list[-1]
+    block = Block(
+        last_block.index + 1,
+        time.time(),
+        transactions,
+        state.wallets[1].public_key,
+        last_block.current_hash,
+    )
+    state.add_block(block)
+    state.update_state(block)
+    return block
+
+
+class WelcomeTransactionTest(unittest.TestCase):
+    def test_bootstrap_pays_the_new_node(self):
+        state, public_keys = build_state(1500)
+        welcome = join(state, public_keys, NODE_NUM, 1)
+        self.assertTrue(admit(state, welcome))
+        self.assertEqual(state.wallets[0].soft_amount, 500)
+        self.assertEqual(state.wallets[NODE_NUM].soft_amount, 1000)
+
+        apply_block(state, state.mint_block().transactions)
+        self.assertTrue(state.is_lottery_member(NODE_NUM))
+        self.assertEqual(state.wallets[0].hard_amount, 500)
+        self.assertEqual(state.wallets[NODE_NUM].hard_amount, 1000)
+
+    def test_bootstrap_cannot_afford_a_join(self):
+        state, public_keys = build_state(500)
+        welcome = join(state, public_keys, NODE_NUM, 1)
+        self.assertFalse(admit(state, welcome))
+        self.assertNotIn((0, 1), state.blockchain.transaction_inbox)
+        self.assertEqual(state.wallets[0].soft_amount, 500)
+        self.assertEqual(state.wallets[NODE_NUM].soft_amount, 0)
+
+    def test_second_join_is_not_paid_twice(self):
+        state, public_keys = build_state(1500)
+        self.assertTrue(admit(state, join(state, public_keys, NODE_NUM, 1)))
+        # the soft amount of the bootstrap already pays the first welcome transaction
+        self.assertFalse(admit(state, join(state, public_keys, NODE_NUM + 1, 2)))
+
+        apply_block(state, state.mint_block().transactions)
+        self.assertFalse(state.is_lottery_member(NODE_NUM + 1))
+        self.assertGreaterEqual(state.wallets[0].hard_amount, 0)
+
+    def test_block_with_an_unpaid_welcome_transaction(self):
+        # a block of another validator holding a welcome transaction the bootstrap cannot pay
+        state, public_keys = build_state(500)
+        welcome = join(state, public_keys, NODE_NUM, 1)
+        self.assertFalse(state.block_budget()(state.resolve_ids(welcome)))
+
+        apply_block(state, [welcome])
+        self.assertFalse(state.is_lottery_member(NODE_NUM))
+        self.assertEqual(state.wallets[0].hard_amount, 500)
+        self.assertEqual(state.wallets[NODE_NUM].hard_amount, 0)
+        self.assertTrue(state.is_committed((0, 1)))
+
+
+class MidRunJoinTest(unittest.TestCase):
+    def setUp(self):
+        # the bootstrap of a cluster that already committed a few blocks
+        self.bootstrap, self.public_keys = support.build_state([5000, 1000, 1000], CAPACITY, my_id=0)
+        for nonce in range(3):
+            support.apply_block(
+                self.bootstrap,
+                [
+                    support.transaction(self.public_keys, 1, 2, nonce, 10, "coins"),
+                    support.transaction(self.public_keys, 2, 1, nonce),
+                ],
+            )
+        self.bootstrap.add_wallet(
+            PublicWallet(NODE_NUM, f"127.0.0.1:{3000 + NODE_NUM}", self.public_keys[NODE_NUM], 0)
+        )
+        welcome = Transaction(
+            self.public_keys[0], self.public_keys[NODE_NUM], "coins", 1000, "welcome", 0
+        )
+        welcome.is_init = 1
+        self.assertTrue(support.admit(self.bootstrap, welcome))
+        self.assertTrue(
+            support.admit(self.bootstrap, support.transaction(self.public_keys, 1, NODE_NUM, 3))
+        )
+        self.my_wallet = SimpleNamespace(
+            node_id=None,
+            public_key=self.public_keys[NODE_NUM],
+            node_address=f"127.0.0.1:{3000 + NODE_NUM}",
+        )
+
+    def test_snapshot_and_log_tail(self):
+        lines = init_lines(self.bootstrap)
+        snapshot = next(lines)
+        snapshot_block = next(lines)
+        # committed while the stream is written: the welcome and the message to the new node
+        support.apply_block(self.bootstrap, list(self.bootstrap.blockchain.transaction_inbox.values()))
+        self.assertTrue(
+            support.admit(self.bootstrap, support.transaction(self.public_keys, 2, 1, 3))
+        )
+        lines = [snapshot, snapshot_block] + list(lines)
+
+        # the block of the snapshot and the one after it, not the chain from the genesis
+        self.assertEqual([line["block"]["index"] for line in lines if line["type"] == "block"], [3, 4])
+        node = receive_init_stream(iter(lines), NODE_NUM, self.my_wallet)
+
+        self.assertEqual(self.my_wallet.node_id, NODE_NUM)
+        self.assertEqual(
+            node.blockchain.block_list[-1].current_hash,
+            self.bootstrap.blockchain.block_list[-1].current_hash,
+        )
+        self.assertEqual(list(node.ledger.hard_amount), list(self.bootstrap.ledger.hard_amount))
+        self.assertEqual(list(node.ledger.soft_amount), list(self.bootstrap.ledger.soft_amount))
+        self.assertEqual(list(node.stakes), list(self.bootstrap.stakes))
+        self.assertTrue(node.is_lottery_member(NODE_NUM))
+        self.assertEqual(
+            list(node.blockchain.transaction_inbox), list(self.bootstrap.blockchain.transaction_inbox)
+        )
+        # the message to the node in the log tail
+        messages, _ = node.conversations.read()
+        self.assertEqual([(m["peer"], m["block_index"]) for m in messages], [(1, 4)])
+        # the blocks before the snapshot are not kept, but their transactions are not replayed
+        self.assertIsNone(node.view.get_block(0))
+        self.assertIsNotNone(node.view.get_block(3))
+        self.assertFalse(support.admit(node, support.transaction(self.public_keys, 1, 2, 0, 10, "coins")))
+
+        # the node follows the chain from there
+        transactions = list(self.bootstrap.blockchain.transaction_inbox.values())
+        block = support.apply_block(self.bootstrap, transactions)
+        with node.chain_lock, node.mempool_lock:
+            node.add_block(block)
+            node.update_state(block)
+        self.assertEqual(list(node.ledger.hard_amount), list(self.bootstrap.ledger.hard_amount))
+        self.assertEqual(node.view.block_index, 5)
+
+    def test_block_store_from_the_snapshot_on(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        block_store = BlockStore(directory)
+        node = receive_init_stream(init_lines(self.bootstrap), NODE_NUM, self.my_wallet, block_store)
+        support.apply_block(node, [])
+        block_store.close()
+
+        block_store = BlockStore(directory)
+        self.addCleanup(block_store.close)
+        self.assertEqual(block_store.first_index, 3)
+        self.assertEqual([block_dict["index"] for block_dict in block_store.iter_block_dicts()], [3, 4])
+        blockchain = Blockchain.from_block_store(block_store, CAPACITY)
+        self.assertEqual([block.index for block in blockchain.block_list], [3, 4])
+
+    def test_stream_cut_short(self):
+        lines = list(init_lines(self.bootstrap))
+        with self.assertRaises(ValueError):
+            receive_init_stream(iter(lines[:-1]), NODE_NUM, self.my_wallet)
+        with self.assertRaises(ValueError):
+            # a block that is not the one of the snapshot
+            receive_init_stream(iter([lines[0]] + lines[2:]), NODE_NUM, self.my_wallet)
+
+    def test_peers_get_503_until_the_node_is_initialized(self):
+        app = create_app(node_settings(NODE_NUM, NODE_NUM, CAPACITY, 5000))
+        client = app.test_client()
+        self.assertEqual(client.post("/validateBlock", json={}).status_code, 503)
+        self.assertEqual(client.post("/validateTransaction", json={}).status_code, 503)
+        self.assertEqual(client.get("/blocks?from=0&to=1").status_code, 503)
+        self.assertEqual(client.get("/").status_code, 503)
+        self.assertEqual(client.get("/metrics").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# Ledger.apply_transfers in Python and with NumPy must give the same balances.
+# Run from the server directory: python -m unittest discover tests
+import math
+import random
+import unittest
+
+from models import ledger as ledger_module
+from models.ledger import Ledger
+
+
+def random_transfers(generator, node_num, count):
+    senders, receivers, totals, fees = Ledger.transfer_columns()
+    for _ in range(count):
+        senders.append(generator.randrange(node_num))
+        receivers.append(generator.randrange(node_num))
+        if generator.random() < 0.5:
+            amount = generator.randint(1, 100)
+            fee = 0.3 * amount
+            totals.append(math.ceil(amount + fee))
+        else:
+            fee = generator.randint(1, 20)
+            totals.append(fee)
+        fees.append(fee)
+    return senders, receivers, totals, fees
+
+
+def apply(transfers_list, node_num, use_numpy):
+    ledger = Ledger(node_num)
+    for node_id in range(node_num):
+        ledger.hard_amount[node_id] = 1000.5
+    saved = ledger_module.NUMPY_MIN_TRANSFERS
+    ledger_module.NUMPY_MIN_TRANSFERS = 0 if use_numpy else float("inf")
+    try:
+        for validator_id, transfers in transfers_list:
+            ledger.apply_transfers(*transfers, validator_id)
+    finally:
+        ledger_module.NUMPY_MIN_TRANSFERS = saved
+    return list(ledger.hard_amount)
+
+
+class LedgerTest(unittest.TestCase):
+    def test_transfers_move_the_amounts(self):
+        ledger = Ledger(3)
+        ledger.hard_amount[0] = 100
+        senders, receivers, totals, fees = Ledger.transfer_columns()
+        for sender_id, receiver_id, total, fee in ((0, 1, 13, 3.0), (1, 2, 5, 5)):
+            senders.append(sender_id)
+            receivers.append(receiver_id)
+            totals.append(total)
+            fees.append(fee)
+        ledger.apply_transfers(senders, receivers, totals, fees, 2)
+        self.assertEqual(list(ledger.hard_amount), [87, 5, 8])
+
+    @unittest.skipIf(ledger_module.numpy is None, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        generator = random.Random(7)
+        for node_num, block_size in ((3, 1), (10, 64), (100, 1000), (1000, 300)):
+            transfers_list = [
+                (generator.randrange(node_num), random_transfers(generator, node_num, block_size))
+                for _ in range(20)
+            ]
+            self.assertEqual(
+                apply(transfers_list, node_num, use_numpy=True),
+                apply(transfers_list, node_num, use_numpy=False),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
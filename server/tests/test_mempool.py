@@ -0,0 +1,172 @@
+# Order of the transactions Mempool.select takes into a block, and mint_block on the hard
+# amounts (State.block_budget).
+# Run from the server directory: python -m unittest discover tests
+import random
+import unittest
+from types import SimpleNamespace
+
+from models.mempool import Mempool, priority
+
+from support import admit, apply_block, build_state, transaction
+
+
+def pending(fees, is_init=0):
+    return SimpleNamespace(fees=fees, is_init=is_init)
+
+
+def reference_select(entries, capacity, fits):
+    # the best head of the chains, one transaction at a time: (priority, seq) order among the
+    # lowest pending nonce of every sender. A transaction that does not fit blocks its sender
+    chains = {}
+    for (sender_id, nonce), (transaction, seq) in sorted(entries.items()):
+        chains.setdefault(sender_id, []).append((priority(transaction), seq, nonce, transaction))
+    selected = []
+    while len(selected) < capacity and chains:
+        sender_id = min(chains, key=lambda sender_id: chains[sender_id][0][:2])
+        transaction = chains[sender_id].pop(0)[3]
+        if not fits(transaction):
+            del chains[sender_id]
+            continue
+        selected.append(transaction)
+        if not chains[sender_id]:
+            del chains[sender_id]
+    return selected
+
+
+class MempoolTest(unittest.TestCase):
+    def test_fee_priority_across_senders(self):
+        mempool = Mempool()
+        low, high, welcome = pending(1), pending(9), pending(0, is_init=1)
+        mempool.add((0, 0), low, 1)
+        mempool.add((1, 0), high, 2)
+        mempool.add((2, 0), welcome, 3)
+        self.assertEqual(mempool.select(3, lambda transaction: True), [welcome, high, low])
+        # ties are taken in arrival order
+        mempool = Mempool()
+        first, second = pending(5), pending(5)
+        mempool.add((1, 0), second, 2)
+        mempool.add((0, 0), first, 1)
+        self.assertEqual(mempool.select(2, lambda transaction: True), [first, second])
+
+    def test_nonces_of_a_sender_stay_in_order(self):
+        # a later nonce with higher fees waits for the earlier ones of its sender
+        mempool = Mempool()
+        cheap, expensive, other = pending(1), pending(50), pending(10)
+        mempool.add((0, 1), expensive, 2)
+        mempool.add((0, 0), cheap, 1)
+        mempool.add((1, 0), other, 3)
+        self.assertEqual(mempool.select(3, lambda transaction: True), [other, cheap, expensive])
+        self.assertEqual(mempool.select(2, lambda transaction: True), [other, cheap])
+
+    def test_a_transaction_that_does_not_fit_holds_back_its_chain(self):
+        mempool = Mempool()
+        too_big, after, other = pending(8), pending(7), pending(1)
+        mempool.add((0, 0), too_big, 1)
+        mempool.add((0, 1), after, 2)
+        mempool.add((1, 0), other, 3)
+        self.assertEqual(mempool.select(3, lambda transaction: transaction is not too_big), [other])
+        # nothing was taken out of the mempool
+        self.assertEqual(len(mempool), 3)
+        self.assertEqual(mempool.select(3, lambda transaction: True), [too_big, after, other])
+
+    def test_random_against_reference(self):
+        generator = random.Random(4)
+        for _ in range(200):
+            mempool = Mempool()
+            entries = {}
+            nonces = {}
+            seq = 0
+            for _ in range(generator.randint(0, 40)):
+                seq += 1
+                sender_id = generator.randrange(6)
+                # mostly in order, sometimes an earlier nonce that arrives late
+                nonce = nonces.get(sender_id, 0) + generator.randint(0, 2)
+                nonces[sender_id] = nonce + 1
+                if (sender_id, nonce) in entries:
+                    continue
+                transaction = pending(generator.randint(0, 5), is_init=int(generator.random() < 0.05))
+                entries[(sender_id, nonce)] = (transaction, seq)
+                mempool.add((sender_id, nonce), transaction, seq)
+            for key in generator.sample(sorted(entries), len(entries) // 4):
+                del entries[key]
+                mempool.remove(key)
+            rejected = {id(transaction) for transaction, _ in entries.values() if generator.random() < 0.1}
+            fits = lambda transaction: id(transaction) not in rejected
+            capacity = generator.randint(1, 12)
+            self.assertEqual(mempool.select(capacity, fits), reference_select(entries, capacity, fits))
+
+
+class BlockBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.state, self.public_keys = build_state([9, 100, 100], 4)
+
+    def test_credit_of_the_same_block_is_spent_after_it(self):
+        state, public_keys = self.state, self.public_keys
+        credit = transaction(public_keys, 1, 0, 0, 10, "coins")
+        spend = transaction(public_keys, 0, 2, 0, 5, "coins")
+        self.assertTrue(admit(state, credit))
+        self.assertTrue(admit(state, spend))
+        self.assertEqual(state.mint_block().transactions, [credit, spend])
+
+    def test_credit_from_a_later_block_is_not_spent(self):
+        state, public_keys = self.state, self.public_keys
+        # 0 spends the coins 1 sends it, with higher fees than the transfer that pays it
+        credit = transaction(public_keys, 1, 0, 0, 10, "coins")
+        spend = transaction(public_keys, 0, 2, 0, 11, "coins")
+        self.assertTrue(admit(state, credit))
+        self.assertTrue(admit(state, spend))
+        self.assertGreater(spend.fees, credit.fees)
+
+        block = state.mint_block()
+        # spend comes first by fees, but does not fit on the 9 coins of 0
+        self.assertEqual(block.transactions, [credit])
+        apply_block(state, block.transactions)
+        self.assertEqual(state.mint_block().transactions, [spend])
+
+    def test_underfunded_sender_is_held_back_with_its_chain(self):
+        state, public_keys = self.state, self.public_keys
+        credit = transaction(public_keys, 1, 0, 0, 10, "coins")
+        # the later transfers of 0 would fit on its 9 coins, but come after the first one
+        spends = [transaction(public_keys, 0, 2, 0, 11, "coins")]
+        spends += [transaction(public_keys, 0, 2, nonce, 1, "coins") for nonce in (1, 2)]
+        message = transaction(public_keys, 2, 1, 0, message="a long message")
+        for pending_transaction in [credit] + spends + [message]:
+            self.assertTrue(admit(state, pending_transaction))
+
+        block = state.mint_block()
+        self.assertEqual(block.transactions, [message, credit])
+        apply_block(state, block.transactions)
+        self.assertEqual(state.mint_block().transactions, spends)
+
+    def test_block_that_overdraws_the_inbox(self):
+        # a block of another validator spends the coins the pending chain of node 1 counted on
+        state, public_keys = self.state, self.public_keys
+        chain = [transaction(public_keys, 1, 0, nonce, 30, "coins") for nonce in range(2)]
+        follow = transaction(public_keys, 0, 2, 0, 40, "coins")
+        for pending_transaction in chain + [follow]:
+            self.assertTrue(admit(state, pending_transaction))
+        unseen = transaction(public_keys, 1, 2, 2, 40, "coins")
+        apply_block(state, [unseen], validator_id=2)
+
+        # 1 keeps 48 coins: its first transfer (39) still fits, the second does not, and
+        # the transfer of node 0 that relied on both is dropped with it
+        inbox = state.blockchain.transaction_inbox
+        self.assertEqual(list(inbox), [(1, 0)])
+        self.assertEqual(len(state.mempool), 1)
+        self.assertEqual(state.mempool.stats()["senders"], 1)
+        self.assertEqual(state.ledger.soft_amount[1], 48 - 39)
+        self.assertEqual(state.ledger.soft_amount[0], 9 + 30)
+        self.assertEqual(state.mint_block().transactions, [chain[0]])
+
+    def test_budget_overflow_falls_back_to_arrival_order(self):
+        # nothing fits on the hard amounts: mint_block takes the inbox in arrival order
+        state, public_keys = self.state, self.public_keys
+        spend = transaction(public_keys, 0, 2, 0, 10, "coins")
+        with state.mempool_lock:
+            state.add_to_inbox(state.transaction_unique_id(spend), spend)
+        self.assertEqual(state.mempool.select(4, state.block_budget()), [])
+        self.assertEqual(state.mint_block().transactions, [spend])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# Merkle roots and inclusion proofs of the transactions of a block.
+# Run from the server directory: python -m unittest discover tests
+import time
+import unittest
+from hashlib import sha256
+
+from app import create_app
+from cluster import node_settings
+from models.block import Block
+from utils.merkle import (
+    header_hash,
+    merkle_levels,
+    merkle_proof,
+    merkle_root,
+    node_hash,
+    verify_merkle_proof,
+)
+
+from support import apply_block, build_state, make_keys, transaction
+
+
+def leaves(count):
+    return [sha256(str(number).encode("utf-8")).digest() for number in range(count)]
+
+
+class MerkleTest(unittest.TestCase):
+    def test_every_proof_verifies(self):
+        for count in range(1, 18):
+            levels = merkle_levels(leaves(count))
+            root = levels[-1][0].hex()
+            for position, leaf in enumerate(leaves(count)):
+                with self.subTest(count=count, position=position):
+                    proof = merkle_proof(levels, position)
+                    self.assertTrue(verify_merkle_proof(leaf, proof, root))
+                    self.assertLessEqual(len(proof), max(1, count - 1).bit_length())
+                    # not the proof of another leaf
+                    other = leaves(count + 1)[count]
+                    self.assertFalse(verify_merkle_proof(other, proof, root))
+
+    def test_trailing_duplicates_change_the_root(self):
+        for count in range(1, 9):
+            with self.subTest(count=count):
+                base = leaves(count)
+                self.assertNotEqual(merkle_root(base), merkle_root(base + base[-1:]))
+        a, b, c = leaves(3)
+        self.assertNotEqual(merkle_root([a, b, c]), merkle_root([a, b, c, c]))
+        self.assertNotEqual(merkle_root([a, b, c, c]), merkle_root([a, b, c, a, b, c, c]))
+
+    def test_inner_node_is_not_a_leaf(self):
+        # the two children of the root, passed as the leaves of a tree of their own, and an
+        # inner node proved as a leaf with the proof of its level
+        levels = merkle_levels(leaves(4))
+        root = levels[-1][0]
+        self.assertNotEqual(merkle_root(levels[1]), root)
+        self.assertEqual(node_hash(levels[1][0], levels[1][1]), root)
+        proof = [{"hash": levels[1][1].hex(), "side": "right"}]
+        self.assertFalse(verify_merkle_proof(levels[1][0], proof, root.hex()))
+
+    def test_tampered_proof(self):
+        levels = merkle_levels(leaves(5))
+        root = levels[-1][0].hex()
+        proof = merkle_proof(levels, 2)
+        flipped = [dict(step, side="left" if step["side"] == "right" else "right") for step in proof]
+        self.assertFalse(verify_merkle_proof(leaves(5)[2], flipped, root))
+        self.assertFalse(verify_merkle_proof(leaves(5)[2], proof[:-1], root))
+
+    def test_block_proofs(self):
+        public_keys = make_keys(3)
+        transactions = [transaction(public_keys, number % 3, (number + 1) % 3, number) for number in range(5)]
+        block = Block(1, time.time(), transactions, public_keys[1], "0" * 64)
+        header = block.header_to_dict()
+        for position, committed in enumerate(transactions):
+            proof = block.get_merkle_proof(position)
+            self.assertTrue(verify_merkle_proof(committed.digest(), proof, header["merkle_root"]))
+        # the same transactions with the last one twice give another block hash
+        doubled = Block(1, block.timestamp, transactions + transactions[-1:], public_keys[1], "0" * 64)
+        self.assertNotEqual(doubled.current_hash, block.current_hash)
+
+
+class ProofEndpointTest(unittest.TestCase):
+    def test_proofs_check_as_in_the_cli(self):
+        state, public_keys = build_state([1000] * 3, 7)
+        transactions = [transaction(public_keys, number % 3, (number + 1) % 3, number // 3) for number in range(7)]
+        apply_block(state, transactions)
+        app = create_app(node_settings(1, 3, 7, 5000))
+        app.config["my_state"] = state
+        client = app.test_client()
+
+        for committed in transactions:
+            sender_id, nonce = state.transaction_unique_id(committed)
+            response = client.get("/proof", query_string={"sender_id": sender_id, "nonce": nonce})
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            block = body["block"]
+            self.assertTrue(verify_merkle_proof(committed.digest(), body["proof"], block["merkle_root"]))
+            self.assertEqual(
+                header_hash(block["index"], block["timestamp"], block["merkle_root"], block["validator"]),
+                block["current_hash"],
+            )
+        response = client.get("/proof", query_string={"sender_id": 0, "nonce": 10})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Committed nonces per sender, as a watermark and a bitmap of the nonces above it.
+# Run from the server directory: python -m unittest discover tests
+import json
+import random
+import unittest
+
+from models.nonce_watermarks import NonceWatermarks
+
+
+class NonceWatermarksTest(unittest.TestCase):
+    def test_in_order_commits_move_the_watermark(self):
+        watermarks = NonceWatermarks()
+        for nonce in range(100):
+            self.assertTrue(watermarks.mark(0, nonce))
+        self.assertEqual(watermarks.senders[0], (99, 0))
+        self.assertTrue(watermarks.contains(0, 50))
+        self.assertFalse(watermarks.contains(0, 100))
+        self.assertFalse(watermarks.contains(1, 0))
+
+    def test_out_of_order_commits(self):
+        watermarks = NonceWatermarks()
+        for nonce in (3, 1, 4):
+            self.assertTrue(watermarks.mark(0, nonce))
+        self.assertEqual(watermarks.senders[0][0], -1)
+        self.assertFalse(watermarks.contains(0, 0))
+        self.assertFalse(watermarks.contains(0, 2))
+        self.assertTrue(watermarks.contains(0, 3))
+        # the gaps fill: the watermark passes every contiguous nonce
+        self.assertTrue(watermarks.mark(0, 0))
+        self.assertEqual(watermarks.senders[0], (1, 0b110))
+        self.assertTrue(watermarks.mark(0, 2))
+        self.assertEqual(watermarks.senders[0], (4, 0))
+
+    def test_duplicates(self):
+        watermarks = NonceWatermarks()
+        for nonce in (0, 1, 2, 5):
+            watermarks.mark(0, nonce)
+        # below the watermark, and in the bitmap above it
+        self.assertFalse(watermarks.mark(0, 1))
+        self.assertFalse(watermarks.mark(0, 5))
+        self.assertEqual(watermarks.senders[0], (2, 0b100))
+
+    def test_window_slide(self):
+        watermarks = NonceWatermarks(window=8)
+        watermarks.mark(0, 0)
+        watermarks.mark(0, 3)
+        # 20 is more than 8 above the watermark 0: the window slides to end at 20
+        self.assertTrue(watermarks.mark(0, 20))
+        watermark, bitmap = watermarks.senders[0]
+        self.assertEqual(watermark, 12)
+        self.assertEqual(bitmap, 1 << 7)
+        # the nonces the slide skipped count as used, the ones above it do not
+        self.assertTrue(watermarks.contains(0, 7))
+        self.assertFalse(watermarks.mark(0, 12))
+        self.assertFalse(watermarks.contains(0, 13))
+        self.assertTrue(watermarks.mark(0, 13))
+        self.assertTrue(watermarks.contains(0, 20))
+
+    def test_bitmap_stays_within_the_window(self):
+        generator = random.Random(5)
+        watermarks = NonceWatermarks(window=64)
+        committed = set()
+        for _ in range(5000):
+            nonce = generator.randint(0, 3000)
+            used = watermarks.contains(0, nonce)
+            if nonce in committed:
+                self.assertTrue(used)
+            self.assertEqual(watermarks.mark(0, nonce), not used)
+            committed.add(nonce)
+            watermark, bitmap = watermarks.senders[0]
+            self.assertLessEqual(bitmap.bit_length(), 64)
+            # the bit right above the watermark is never set, it would be part of it
+            self.assertEqual(bitmap & 1, 0)
+            self.assertTrue(all(watermarks.contains(0, nonce) for nonce in committed))
+
+    def test_to_dict_round_trip(self):
+        generator = random.Random(6)
+        watermarks = NonceWatermarks(window=128)
+        for _ in range(2000):
+            watermarks.mark(generator.randrange(5), generator.randint(0, 600))
+        restored = NonceWatermarks.from_dict(json.loads(json.dumps(watermarks.to_dict())))
+        self.assertEqual(restored.window, 128)
+        self.assertEqual(restored.senders, watermarks.senders)
+        for sender_id in range(6):
+            for nonce in range(700):
+                self.assertEqual(restored.contains(sender_id, nonce), watermarks.contains(sender_id, nonce))
+
+
+if __name__ == "__main__":
+    unittest.main()
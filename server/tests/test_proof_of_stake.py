@@ -0,0 +1,74 @@
+# Validator selection of StakeIndex against the linear lottery it replaced: the same seed and
+# stakes must give the same validator on every node.
+# Run from the server directory: python -m unittest discover tests
+import random
+import unittest
+
+from utils.proof_of_stake import StakeIndex
+
+
+def linear_lottery(stakes, node_ids, seed):
+    # node i owns the numbers (sum of stakes[:i], sum of stakes[:i + 1]] of the lottery
+    generator = random.Random(seed)
+    total = sum(stakes)
+    if total == 0:
+        return node_ids[generator.randint(0, len(stakes) - 1)]
+    number = generator.randint(1, total)
+    upper = 0
+    for position, stake in enumerate(stakes):
+        upper += stake
+        if number <= upper:
+            return node_ids[position]
+
+
+class StakeIndexTest(unittest.TestCase):
+    def assert_same_validators(self, index, stakes, node_ids, seeds):
+        for seed in seeds:
+            self.assertEqual(index.select(seed), linear_lottery(stakes, node_ids, seed), seed)
+
+    def test_random_stakes(self):
+        generator = random.Random(1)
+        for size in (1, 2, 3, 7, 8, 9, 64, 100):
+            stakes = [generator.choice([0, 0, 1, generator.randint(1, 500)]) for _ in range(size)]
+            index = StakeIndex(stakes)
+            self.assert_same_validators(index, stakes, list(range(size)), range(200))
+
+    def test_stake_updates(self):
+        generator = random.Random(2)
+        stakes = [generator.randint(0, 50) for _ in range(20)]
+        index = StakeIndex(stakes)
+        for round in range(100):
+            node_id = generator.randrange(20)
+            stakes[node_id] = generator.randint(0, 50)
+            index.set(node_id, stakes[node_id])
+            self.assertEqual(index.total(), sum(stakes))
+            self.assert_same_validators(index, stakes, list(range(20)), range(round * 10, round * 10 + 10))
+
+    def test_new_members(self):
+        # nodes that joined after the genesis enter the lottery in the order they joined
+        generator = random.Random(3)
+        node_ids = [0, 1, 2]
+        stakes = [10, 0, 5]
+        index = StakeIndex(stakes, node_ids)
+        for node_id in (7, 4, 9, 5, 6, 3, 8):
+            stake = generator.randint(0, 30)
+            index.append(node_id, stake)
+            node_ids.append(node_id)
+            stakes.append(stake)
+            changed = generator.randrange(len(node_ids))
+            stakes[changed] = generator.randint(0, 30)
+            index.set(node_ids[changed], stakes[changed])
+            self.assert_same_validators(index, stakes, node_ids, range(100))
+
+    def test_non_members_are_ignored(self):
+        index = StakeIndex([10, 10], [0, 1])
+        index.set(5, 100)
+        self.assertEqual(index.total(), 20)
+
+    def test_all_stakes_zero(self):
+        stakes = [0] * 5
+        self.assert_same_validators(StakeIndex(stakes), stakes, list(range(5)), range(50))
+
+
+if __name__ == "__main__":
+    unittest.main()
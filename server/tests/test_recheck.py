@@ -0,0 +1,83 @@
+# The incremental re-check of the inbox after a block (State.recheck_inbox) against a full
+# revalidation of the inbox, on random transactions and blocks.
+# Run from the server directory: python -m unittest discover tests
+import random
+import unittest
+
+from models.state import State
+
+from support import admit, apply_block, build_state, transaction
+
+NODE_NUM = 5
+CAPACITY = 4
+SEEDS = 300
+BLOCKS = 12
+
+
+class FullRecheckState(State):
+    """Revalidates the whole inbox in arrival order after every block"""
+
+    def recheck_inbox(self, recheck_until, soft_deltas):
+        ledger = self.ledger
+        ledger.soft_amount[:] = ledger.hard_amount
+        ledger.soft_stake[:] = ledger.hard_stake
+        for transaction_key, transaction in list(self.blockchain.transaction_inbox.items()):
+            if not self.has_enough_amount(transaction, transaction_key[0]):
+                self.remove_from_inbox(transaction_key)
+                continue
+            self.apply_soft_debit(transaction, transaction_key[0])
+            if transaction.type != "stake":
+                self.apply_soft_credit(transaction, self.receiver_id(transaction))
+
+
+def random_transaction(generator, public_keys, nonces):
+    sender_id = generator.randrange(NODE_NUM)
+    receiver_id = generator.choice([i for i in range(NODE_NUM) if i != sender_id])
+    kind = generator.choices(["coins", "message", "stake"], [6, 3, 1])[0]
+    amount = generator.randint(1, 40)
+    message = "x" * generator.randint(1, 12)
+    nonce = nonces[sender_id]
+    nonces[sender_id] += 1
+    return transaction(public_keys, sender_id, receiver_id, nonce, amount, kind, message)
+
+
+def run(state_class, seed):
+    generator = random.Random(seed)
+    state, public_keys = build_state([60] * NODE_NUM, CAPACITY)
+    state.__class__ = state_class
+    nonces = [0] * NODE_NUM
+    history = []
+    for _ in range(BLOCKS):
+        for _ in range(generator.randint(0, 8)):
+            admit(state, random_transaction(generator, public_keys, nonces))
+        inbox = list(state.blockchain.transaction_inbox.values())
+        # the next block holds some of the inbox, and transactions of other nodes that this
+        # node never saw, which may spend coins its inbox already counted on
+        block = generator.sample(inbox, min(len(inbox), generator.randint(0, CAPACITY)))
+        block.sort(key=lambda transaction: transaction.nonce)
+        for _ in range(generator.randint(0, 2)):
+            sender_id = generator.randrange(NODE_NUM)
+            if sender_id not in [state.resolve_ids(t).sender_id for t in block]:
+                block.append(random_transaction(generator, public_keys, nonces))
+        block = [t for t in block if state.has_enough_amount(t, state.resolve_ids(t).sender_id)]
+        apply_block(state, block)
+        history.append(
+            (
+                list(state.blockchain.transaction_inbox),
+                list(state.ledger.soft_amount),
+                list(state.ledger.soft_stake),
+                list(state.ledger.hard_amount),
+            )
+        )
+    return history
+
+
+class RecheckTest(unittest.TestCase):
+    def test_incremental_recheck_matches_a_full_revalidation(self):
+        for seed in range(SEEDS):
+            with self.subTest(seed=seed):
+                self.assertEqual(run(State, seed), run(FullRecheckState, seed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# Restart of a node from its snapshot, the location log and the blocks after the snapshot.
+# Run from the server directory: python -m unittest discover tests
+import os
+import shutil
+import tempfile
+import unittest
+
+from models.block_store import BlockStore
+from models.wallet import PrivateWallet
+from utils.init_utils import restore_node
+
+from support import admit, apply_block, build_state, transaction
+
+NODE_NUM = 4
+CAPACITY = 3
+
+
+class RestartTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = BlockStore(self.directory)
+        my_wallet = PrivateWallet(1, "127.0.0.1:3001")
+        self.state, public_keys = build_state([10**6] * NODE_NUM, CAPACITY, self.store, my_wallet=my_wallet)
+        my_wallet.public_key = public_keys[1]
+        self.state.wallets[1].public_key = public_keys[1]
+        self.state.snapshot_interval = 10
+        nonces = [0] * NODE_NUM
+        for block in range(25):
+            for i in range(CAPACITY):
+                sender_id = (block + i) % NODE_NUM
+                admit(self.state, transaction(public_keys, sender_id, (sender_id + 1) % NODE_NUM, nonces[sender_id]))
+                nonces[sender_id] += 1
+            apply_block(self.state, list(self.state.blockchain.transaction_inbox.values()))
+        self.store.close()
+
+    def assert_same_indexes(self, restored):
+        blockchain = self.state.blockchain
+        self.assertEqual(restored.indexed_height, blockchain.indexed_height)
+        self.assertEqual(restored.transaction_locations, blockchain.transaction_locations)
+        self.assertEqual(restored.sent_locations, blockchain.sent_locations)
+        self.assertEqual(restored.received_locations, blockchain.received_locations)
+        self.assertEqual(restored.block_indices, blockchain.block_indices)
+        self.assertEqual(restored.committed_nonces.senders, blockchain.committed_nonces.senders)
+
+    def test_restore_reads_the_location_log(self):
+        state = restore_node(BlockStore(self.directory), CAPACITY)
+        self.assert_same_indexes(state.blockchain)
+        self.assertEqual(list(state.ledger.hard_amount), list(self.state.ledger.hard_amount))
+
+    def test_snapshot_does_not_hold_the_locations(self):
+        snapshot = BlockStore(self.directory).load_snapshot()
+        self.assertEqual(snapshot["block_index"], 20)
+        self.assertNotIn("transaction_locations", snapshot["indexes"])
+
+    def test_private_key_is_kept_out_of_the_snapshot(self):
+        store = BlockStore(self.directory)
+        self.assertNotIn("my_wallet", store.load_snapshot())
+        self.assertEqual(os.stat(store.wallet_path()).st_mode & 0o777, 0o600)
+        state = restore_node(store, CAPACITY)
+        store.close()
+        self.assertEqual(state.my_wallet.to_dict(), self.state.my_wallet.to_dict())
+
+    def test_snapshot_with_the_wallet(self):
+        # saved before the wallet had a file of its own
+        store = BlockStore(self.directory)
+        snapshot = store.load_snapshot()
+        snapshot["my_wallet"] = store.load_wallet()
+        os.remove(store.wallet_path())
+        store.save_snapshot(snapshot)
+        state = restore_node(store, CAPACITY)
+        self.assertEqual(state.my_wallet.to_dict(), self.state.my_wallet.to_dict())
+
+        state.save_snapshot()
+        store.close()
+        self.assertNotIn("my_wallet", store.load_snapshot())
+        self.assertEqual(store.load_wallet(), self.state.my_wallet.to_dict())
+
+    def test_second_restart(self):
+        # the records of the replayed blocks are dropped from the log and appended again
+        store = BlockStore(self.directory)
+        restore_node(store, CAPACITY)
+        store.close()
+        size = os.path.getsize(store.locations_path())
+        store = BlockStore(self.directory)
+        state = restore_node(store, CAPACITY)
+        store.close()
+        self.assert_same_indexes(state.blockchain)
+        self.assertEqual(os.path.getsize(store.locations_path()), size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# Readers of State.view while admissions and blocks publish new views: every view they get
+# must be one state of the node, never a block half applied.
+# Run from the server directory: python -m unittest discover tests
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from app import create_app
+from cluster import node_settings
+from models.block_store import BlockStore
+
+from support import admit, apply_block, build_state, transaction
+
+NODE_NUM = 6
+CAPACITY = 5
+READERS = 3
+DURATION = 1.0
+
+
+class StateViewTest(unittest.TestCase):
+    def test_readers_never_see_a_torn_view(self):
+        state, public_keys = build_state([10**5] * NODE_NUM, CAPACITY)
+        expected_total = sum(state.ledger.hard_amount) + sum(state.ledger.hard_stake)
+        # block index -> hard amounts and stakes once it was applied
+        applied = {0: (list(state.ledger.hard_amount), list(state.ledger.hard_stake))}
+        nonces = [0] * NODE_NUM
+        nonce_lock = threading.Lock()
+        stop = threading.Event()
+        samples = [[] for _ in range(READERS)]
+        errors = []
+
+        def next_transaction(number):
+            sender_id = number % NODE_NUM
+            with nonce_lock:
+                nonce = nonces[sender_id]
+                nonces[sender_id] += 1
+            receiver_id = (sender_id + 1 + number % (NODE_NUM - 1)) % NODE_NUM
+            if number % 7 == 0:
+                return transaction(public_keys, sender_id, receiver_id, nonce, number % 50, "stake")
+            if number % 2:
+                return transaction(public_keys, sender_id, receiver_id, nonce, message=f"message {number}")
+            return transaction(public_keys, sender_id, receiver_id, nonce, number % 30 + 1, "coins")
+
+        def admit_transactions(first):
+            number = first
+            while not stop.is_set():
+                admit(state, next_transaction(number))
+                number += 2
+
+        def apply_blocks():
+            while not stop.is_set():
+                with state.chain_lock, state.mempool_lock:
+                    block = apply_block(state, state.mint_block().transactions, validator_id=len(applied) % NODE_NUM)
+                    applied[block.index] = (list(state.ledger.hard_amount), list(state.ledger.hard_stake))
+                time.sleep(0.001)
+
+        def read(reader_id):
+            while not stop.is_set():
+                view = state.view
+                try:
+                    last_block = view.last_block
+                    self.assertEqual(last_block["index"], view.block_index)
+                    self.assertEqual(view.get_block(view.block_index).current_hash, last_block["current_hash"])
+                    self.assertIsNone(view.get_block(view.block_index + 1))
+                    self.assertEqual(len(view.wallets), NODE_NUM)
+                    hard_amounts = [wallet["hard_amount"] for wallet in view.wallets]
+                    hard_stakes = [wallet["hard_stake"] for wallet in view.wallets]
+                    self.assertAlmostEqual(sum(hard_amounts) + sum(hard_stakes), expected_total, places=6)
+                    messages, _ = view.get_conversations(limit=10**6)
+                    self.assertTrue(all(message["block_index"] <= view.block_index for message in messages))
+                    samples[reader_id].append((view.block_index, hard_amounts, hard_stakes))
+                except AssertionError as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=admit_transactions, args=(first,)) for first in (0, 1)]
+        threads.append(threading.Thread(target=apply_blocks))
+        threads += [threading.Thread(target=read, args=(reader_id,)) for reader_id in range(READERS)]
+        for thread in threads:
+            thread.start()
+        time.sleep(DURATION)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertGreater(len(applied), 10)
+        heights = set()
+        for reader_samples in samples:
+            self.assertGreater(len(reader_samples), 0)
+            for block_index, hard_amounts, hard_stakes in reader_samples:
+                # the balances of the view are those of its block
+                self.assertEqual((hard_amounts, hard_stakes), applied[block_index])
+                heights.add(block_index)
+        self.assertGreater(len(heights), 1)
+
+    def test_blocks_range_without_the_chain_lock(self):
+        # /blocks reads the view, partly from the block store, while a block is being applied
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        state, public_keys = build_state([10**5] * NODE_NUM, CAPACITY, BlockStore(directory))
+        state.blockchain.cache_size = 5
+        for nonce in range(30):
+            admit(state, transaction(public_keys, 0, 1, nonce, message=f"message {nonce}"))
+            apply_block(state, list(state.blockchain.transaction_inbox.values()))
+        app = create_app(node_settings(1, NODE_NUM, CAPACITY, 5000))
+        app.config["my_state"] = state
+
+        with state.chain_lock:
+            # held by this thread: a request that takes it would wait forever
+            result = {}
+            thread = threading.Thread(
+                target=lambda: result.update(response=app.test_client().get("/blocks?from=2&to=40"))
+            )
+            thread.start()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        blocks = result["response"].get_json()["blocks"]
+        self.assertEqual([block["index"] for block in blocks], list(range(2, 31)))
+        self.assertEqual(blocks[0]["transactions"][0]["message"], "message 1")
+        self.assertEqual(state.view.get_blocks_range(29, 35)[-1].index, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
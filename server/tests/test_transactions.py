@@ -0,0 +1,196 @@
+# Paging of the committed transactions of a node by (block index, position) cursor, in
+# StateView.account_transactions and on /transactions, also while blocks are committed.
+# Run from the server directory: python -m unittest discover tests
+import threading
+import time
+import unittest
+
+from app import create_app
+from cluster import node_settings
+
+from support import apply_block, build_state, transaction
+
+NODE_NUM = 4
+CAPACITY = 4
+# the node whose history is paged
+NODE_ID = 2
+# (sender, receiver) of the transactions of the blocks, None for a stake
+PAIRS = [(2, 1), (0, 2), (1, 3), (2, 2), (3, 2), (2, None), (0, 1), (2, 0)]
+
+
+def locations(entries):
+    return [(entry["block_index"], entry["position"], entry["role"]) for entry in entries]
+
+
+class HistoryFixture:
+    def setUp(self):
+        self.state, self.public_keys = build_state([10**5] * NODE_NUM, CAPACITY)
+        self.nonces = [0] * NODE_NUM
+        # (block index, position, role) of the transactions of NODE_ID, in chain order
+        self.history = {"sent": [], "received": [], "all": []}
+        self.pair = 0
+
+    def commit_block(self, count=CAPACITY):
+        block_index = self.state.blockchain.block_list[-1].index + 1
+        transactions = []
+        for position in range(count):
+            sender_id, receiver_id = PAIRS[self.pair % len(PAIRS)]
+            self.pair += 1
+            nonce = self.nonces[sender_id]
+            self.nonces[sender_id] += 1
+            if receiver_id is None:
+                transactions.append(transaction(self.public_keys, sender_id, 0, nonce, 10, "stake"))
+            else:
+                transactions.append(transaction(self.public_keys, sender_id, receiver_id, nonce))
+            if sender_id == NODE_ID:
+                self.history["sent"].append((block_index, position, "sent"))
+            if receiver_id == NODE_ID:
+                self.history["received"].append((block_index, position, "received"))
+            # a transaction of the node to itself is listed once, as sent
+            if NODE_ID in (sender_id, receiver_id):
+                role = "sent" if sender_id == NODE_ID else "received"
+                self.history["all"].append((block_index, position, role))
+        apply_block(self.state, transactions)
+
+    def walk(self, view, role, limit, after=None):
+        # every page after the cursor, checking their sizes and cursors
+        pages = []
+        while True:
+            entries, next_cursor = view.account_transactions(NODE_ID, role, after, limit)
+            pages.append(locations(entries))
+            if next_cursor is None:
+                return pages
+            self.assertEqual(len(entries), limit)
+            self.assertEqual(next_cursor, pages[-1][-1][:2])
+            after = next_cursor
+
+
+class AccountTransactionsTest(HistoryFixture, unittest.TestCase):
+    def test_pages_cover_the_history(self):
+        for _ in range(6):
+            self.commit_block()
+        view = self.state.view
+        for role, expected in self.history.items():
+            for limit in (1, 2, 3, len(expected), 100):
+                with self.subTest(role=role, limit=limit):
+                    pages = self.walk(view, role, limit)
+                    self.assertEqual([entry for page in pages for entry in page], expected)
+                    # no empty page after a last page of exactly limit entries
+                    self.assertTrue(pages[-1])
+                    self.assertLessEqual(len(pages[-1]), limit)
+
+    def test_cursor_inside_a_block(self):
+        for _ in range(3):
+            self.commit_block()
+        expected = self.history["all"]
+        for cut in range(len(expected)):
+            block_index, position, _ = expected[cut]
+            with self.subTest(after=(block_index, position)):
+                pages = self.walk(self.state.view, "all", 2, (block_index, position))
+                self.assertEqual([entry for page in pages for entry in page], expected[cut + 1 :])
+        # a cursor between two entries of the node
+        pages = self.walk(self.state.view, "all", 100, (1, 1))
+        self.assertEqual(pages, [[entry for entry in expected if entry[:2] > (1, 1)]])
+
+    def test_empty_pages(self):
+        view = self.state.view
+        self.assertEqual(view.account_transactions(NODE_ID), ([], None))
+        self.commit_block()
+        view = self.state.view
+        self.assertEqual(view.account_transactions(NODE_NUM + 5), ([], None))
+        self.assertEqual(view.account_transactions(NODE_ID, "all", (1, CAPACITY)), ([], None))
+        self.assertEqual(view.account_transactions(NODE_ID, "all", (100, 0)), ([], None))
+
+    def test_view_is_bounded_by_its_block(self):
+        self.commit_block()
+        old_view = self.state.view
+        expected = list(self.history["all"])
+        self.commit_block()
+        self.assertEqual(self.walk(old_view, "all", 100), [expected])
+        self.assertEqual(self.walk(self.state.view, "all", 100), [self.history["all"]])
+
+
+class TransactionsEndpointTest(HistoryFixture, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        app = create_app(node_settings(1, NODE_NUM, CAPACITY, 5000))
+        app.config["my_state"] = self.state
+        self.client = app.test_client()
+
+    def get(self, path, **params):
+        response = self.client.get(path, query_string=params)
+        return response.status_code, response.get_json()
+
+    def test_pages(self):
+        for _ in range(4):
+            self.commit_block()
+        seen = []
+        params = {"node_id": NODE_ID, "limit": 3}
+        while True:
+            status, result = self.get("/transactions", **params)
+            self.assertEqual(status, 200)
+            seen.extend(locations(result["transactions"]))
+            if result["next"] is None:
+                break
+            params["after"] = result["next"]
+        self.assertEqual(seen, self.history["all"])
+
+        status, result = self.get("/transactions", node_id=NODE_ID, after="100:0")
+        self.assertEqual((status, result["transactions"], result["next"]), (200, [], None))
+
+    def test_invalid_parameters(self):
+        for params in (
+            {},
+            {"node_id": "x"},
+            {"node_id": NODE_ID, "role": "other"},
+            {"node_id": NODE_ID, "limit": 0},
+            {"node_id": NODE_ID, "after": "1"},
+            {"node_id": NODE_ID, "after": "a:b"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get("/transactions", **params)[0], 400)
+
+    def test_transaction(self):
+        self.commit_block()
+        status, result = self.get("/transaction", sender_id=0, nonce=0)
+        self.assertEqual((status, result["block_index"], result["position"]), (200, 1, 1))
+        self.assertEqual(self.get("/transaction", sender_id=0, nonce=5)[0], 404)
+        self.assertEqual(self.get("/transaction", sender_id=0)[0], 400)
+
+    def test_paging_while_blocks_commit(self):
+        blocks = 40
+        done = threading.Event()
+
+        def commit():
+            for _ in range(blocks):
+                self.commit_block()
+                time.sleep(0.001)
+            done.set()
+
+        writer = threading.Thread(target=commit)
+        writer.start()
+        seen = []
+        after = None
+        while True:
+            finished = done.is_set()
+            params = {"node_id": NODE_ID, "limit": 3}
+            if after is not None:
+                params["after"] = after
+            status, result = self.get("/transactions", **params)
+            self.assertEqual(status, 200)
+            entries = result["transactions"]
+            seen.extend(locations(entries))
+            if entries:
+                # the last page has no next cursor: the client goes on from its last entry
+                after = f"{entries[-1]['block_index']}:{entries[-1]['position']}"
+                if result["next"] is not None:
+                    self.assertEqual(result["next"], after)
+            if finished and result["next"] is None:
+                break
+        writer.join()
+        # every transaction once, in chain order
+        self.assertEqual(seen, self.history["all"])
+
+
+if __name__ == "__main__":
+    unittest.main()
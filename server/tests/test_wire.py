@@ -0,0 +1,139 @@
+# Binary encoding of transactions and blocks: round trips, and malformed payloads that must
+# fail with WireError (400 on the endpoints), never with another exception.
+# Run from the server directory: python -m unittest discover tests
+import random
+import time
+import unittest
+
+from app import create_app
+from cluster import node_settings
+from models.block import Block
+from utils.wire import (
+    CONTENT_TYPE,
+    UnknownNodeError,
+    WireError,
+    decode_block,
+    decode_blocks,
+    decode_transactions,
+    encode_block,
+    encode_blocks,
+    encode_transactions,
+)
+
+from support import build_state, make_keys, transaction
+
+NODE_NUM = 3
+
+
+def sample_transactions(public_keys):
+    coins = transaction(public_keys, 0, 1, 5, 30, "coins")
+    coins.signature = hex(2**2040 + 12345)
+    message = transaction(public_keys, 1, 2, 0, message="héllo, wörld \n")
+    message.signature = hex(7)
+    stake = transaction(public_keys, 2, None, 2**40, 15, "stake")
+    welcome = transaction(public_keys, 0, 2, 1, 1000, "coins")
+    welcome.is_init = 1
+    # the key of a node this side does not know goes as hex
+    unknown = transaction(public_keys, NODE_NUM, 0, 0, message="")
+    return [coins, message, stake, welcome, unknown]
+
+
+class WireTest(unittest.TestCase):
+    def setUp(self):
+        self.state, self.public_keys = build_state([1000] * NODE_NUM, 3)
+        self.key_to_node_id = self.state.public_key_to_node_id
+        self.wallets = self.state.wallets
+
+    def assert_same_transactions(self, decoded, transactions):
+        self.assertEqual([t.to_dict() for t in decoded], [t.to_dict() for t in transactions])
+        self.assertEqual([t.digest() for t in decoded], [t.digest() for t in transactions])
+
+    def assert_same_blocks(self, decoded, blocks):
+        self.assertEqual([b.to_dict() for b in decoded], [b.to_dict() for b in blocks])
+        for block in decoded:
+            self.assertEqual(block.create_block_hash(), block.current_hash)
+
+    def sample_blocks(self):
+        genesis = self.state.blockchain.block_list[0]
+        block = Block(1, time.time(), sample_transactions(self.public_keys), self.public_keys[1], genesis.current_hash)
+        empty = Block(2, time.time(), [], self.public_keys[2], block.current_hash)
+        return [genesis, block, empty]
+
+    def test_transactions_round_trip(self):
+        transactions = sample_transactions(self.public_keys)
+        for count in (0, 1, len(transactions)):
+            data = encode_transactions(transactions[:count], self.key_to_node_id)
+            self.assert_same_transactions(decode_transactions(data, self.wallets), transactions[:count])
+
+    def test_blocks_round_trip(self):
+        blocks = self.sample_blocks()
+        for block in blocks:
+            self.assert_same_blocks([decode_block(encode_block(block, self.key_to_node_id), self.wallets)], [block])
+        data = encode_blocks(blocks, self.key_to_node_id)
+        self.assert_same_blocks(decode_blocks(data, self.wallets), blocks)
+
+    def test_keys_are_sent_as_node_ids(self):
+        transactions = sample_transactions(self.public_keys)[:1]
+        with_ids = encode_transactions(transactions, self.key_to_node_id)
+        self.assertLess(len(with_ids), len(encode_transactions(transactions, {})) - 500)
+        # a node that does not know the sender
+        with self.assertRaises(UnknownNodeError):
+            decode_transactions(with_ids, self.wallets[:0])
+
+    def test_cut_short_payloads(self):
+        data = encode_blocks(self.sample_blocks(), self.key_to_node_id)
+        for length in range(len(data)):
+            with self.assertRaises(WireError, msg=length):
+                decode_blocks(data[:length], self.wallets)
+
+    def test_malformed_payloads(self):
+        transactions = encode_transactions(sample_transactions(self.public_keys), self.key_to_node_id)
+        block = encode_block(self.sample_blocks()[1], self.key_to_node_id)
+        cases = {
+            "empty": (decode_transactions, b""),
+            "another kind": (decode_transactions, block),
+            "bad magic": (decode_block, b"XX" + block[2:]),
+            "trailing bytes": (decode_block, block + b"\x00"),
+            "unknown transaction type": (decode_transactions, transactions[:8] + b"\x00" * 8 + b"\x09" + transactions[17:]),
+            # the tag of the signature of the last transaction, None
+            "unknown value tag": (decode_transactions, transactions[:-1] + b"\x09"),
+        }
+        for name, (decode, data) in cases.items():
+            with self.subTest(name), self.assertRaises(WireError):
+                decode(data, self.wallets)
+
+    def test_corrupted_payloads(self):
+        generator = random.Random(8)
+        data = encode_blocks(self.sample_blocks(), self.key_to_node_id)
+        for _ in range(3000):
+            corrupted = bytearray(data)
+            for _ in range(generator.randint(1, 4)):
+                corrupted[generator.randrange(4, len(data))] = generator.randrange(256)
+            try:
+                decode_blocks(bytes(corrupted), self.wallets)
+            except WireError:
+                pass
+
+
+class ValidateTransactionEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(node_settings(1, NODE_NUM, 3, 5000))
+        self.app.config["my_state"], self.public_keys = build_state([1000] * NODE_NUM, 3)
+        self.client = self.app.test_client()
+
+    def post(self, data):
+        return self.client.post("/validateTransaction", data=data, content_type=CONTENT_TYPE)
+
+    def test_empty_body(self):
+        self.assertEqual(self.post(b"").status_code, 400)
+
+    def test_no_transaction(self):
+        self.assertEqual(self.post(encode_transactions([], {})).status_code, 400)
+
+    def test_cut_short(self):
+        data = encode_transactions(sample_transactions(self.public_keys)[:1], {})
+        self.assertEqual(self.post(data[:-3]).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,153 @@
-from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import requests
+import threading
 import time
 from models.wallet import PublicWallet
+from utils.transport import LocalAdapter, is_local
+from utils.metrics import Counter, Histogram
+
+# Broadcast settings, overridden by configure_broadcast from the node config
+broadcast_config = {
+    "timeout": 0.05,  # seconds per request
+    "retries": 0,  # extra attempts after the first one fails
+    "backoff": 0.01,  # seconds before the first retry, doubled on every retry
+    "workers": 16,  # threads sending requests in parallel
+}
+
+BROADCAST_SECONDS = Histogram(
+    "blockchat_broadcast_seconds",
+    "Time to send a request to a peer, retries included",
+    ["peer", "endpoint"],
+)
+BROADCAST_FAILURES = Counter(
+    "blockchat_broadcast_failures_total", "Requests to a peer that failed after their retries", ["peer", "endpoint"]
+)
+
+_executor = None
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def configure_broadcast(timeout=None, retries=None, backoff=None, workers=None):
+    global _executor
+    for key, value in (
+        ("timeout", timeout),
+        ("retries", retries),
+        ("backoff", backoff),
+        ("workers", workers),
+    ):
+        if value is not None:
+            broadcast_config[key] = value
+    if _executor is not None and workers is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def get_executor():
+    global _executor
+    with _sessions_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=broadcast_config["workers"],
+                thread_name_prefix="broadcast",
+            )
+        return _executor
+
+
+def get_session(address):
+    # one keep-alive session per peer, shared by all broadcasts
+    with _sessions_lock:
+        session = _sessions.get(address)
+        if session is None:
+            session = requests.Session()
+            if is_local():
+                adapter = LocalAdapter()
+            else:
+                adapter = HTTPAdapter(pool_maxsize=broadcast_config["workers"])
+            session.mount("http://", adapter)
+            _sessions[address] = session
+        return session
+
+
+class PeerResult:
+    def __init__(self, node_id, success, attempts, status_code=None, error=None, response=None):
+        self.node_id = node_id
+        self.success = success
+        self.attempts = attempts
+        self.status_code = status_code
+        self.error = error
+        self.response = response
+
+    def to_dict(self):
+        return {
+            "node_id": self.node_id,
+            "success": self.success,
+            "attempts": self.attempts,
+            "status_code": self.status_code,
+            "error": self.error,
+        }
+
+
+class BroadcastResult:
+    def __init__(self, peers: dict[int, PeerResult]):
+        self.peers = peers
+
+    @property
+    def success(self):
+        return all(peer.success for peer in self.peers.values())
+
+    def failed_nodes(self):
+        return [node_id for node_id, peer in self.peers.items() if not peer.success]
+
+    def __bool__(self):
+        return self.success
+
+    def to_dict(self):
+        return {node_id: peer.to_dict() for node_id, peer in self.peers.items()}
+
+
+def post_to_peer(wallet, url, payload, timeout, retries, backoff, verbose=False, **kwargs):
+    start = time.perf_counter()
+    result = send_to_peer(wallet, url, payload, timeout, retries, backoff, verbose, **kwargs)
+    endpoint = url.rsplit("/", 1)[-1]
+    BROADCAST_SECONDS.observe(time.perf_counter() - start, wallet.node_id, endpoint)
+    if not result.success:
+        BROADCAST_FAILURES.inc(wallet.node_id, endpoint)
+    return result
+
+
+def send_to_peer(wallet, url, payload, timeout, retries, backoff, verbose=False, **kwargs):
+    session = get_session(wallet.node_address)
+    node_id = wallet.node_id
+    attempts = 0
+    status_code = None
+    error = None
+
+    while True:
+        attempts += 1
+        try:
+            if payload is not None:
+                kwargs["json"] = payload
+            response = session.post(url, timeout=timeout, **kwargs)
+            status_code = response.status_code
+            if status_code == 200:
+                if verbose:
+                    print(f"Broadcasted successfully to node {node_id}.")
+                return PeerResult(node_id, True, attempts, status_code, response=response)
+            error = f"status code {status_code}"
+            if verbose:
+                print(f"Broadcast to node {node_id} failed with status code: {status_code}")
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+            if verbose:
+                print(f"Error making the request: {e}")
+
+        if attempts > retries:
+            if verbose:
+                print(f"Max retries reached. Unable to broadcast to node {node_id}.")
+            return PeerResult(node_id, False, attempts, status_code, error)
+        time.sleep(backoff * 2 ** (attempts - 1))
 
 
 def broadcast(
@@ -10,50 +156,43 @@ def broadcast(
     wallets: list[PublicWallet],
     my_address: str,
     verbose: bool = False,
-) -> bool:
-    success = True
+    timeout: float = None,
+    retries: int = None,
+    **kwargs,
+) -> BroadcastResult:
+    """
+    Sends the payload to every other node in parallel and waits for all of them, so the
+    broadcast takes as long as the slowest peer. Extra keyword arguments are passed to
+    requests (e.g. data and headers for a non-JSON body, with payload=None).
+    """
+    if timeout is None:
+        timeout = broadcast_config["timeout"]
+    if retries is None:
+        retries = broadcast_config["retries"]
+    backoff = broadcast_config["backoff"]
+    endpoint = endpoint.lstrip("/")
 
+    executor = get_executor()
+    futures = {}
     for wallet in wallets:
-        address = wallet.node_address
-        is_receiver_self = address == my_address
-        if not is_receiver_self:
-            node_id = wallet.node_id
-            retries = 1
-            delay_between_retries = 0
-
-            while retries > 0:
-                try:
-                    success = True
-                    response = requests.post(
-                        f"http://{address}/{endpoint}", json=payload, timeout=0.05
-                    )
-                    if response.status_code == 200:
-                        if verbose:
-                            print(f"Broadcasted successfully to node {node_id}.")
-                        break
-                    else:
-                        success = False
-                        if verbose:
-                            print(
-                                f"Broadcast to node {node_id} failed with status code: {response.status_code}"
-                            )
-
-                except requests.exceptions.RequestException as e:
-                    success = False
-                    if verbose:
-                        print(f"Error making the request: {e}")
-                        print(f"Retries remaining {retries}")
-
-                time.sleep(delay_between_retries)
-                retries -= 1
-
-                if retries == 0:
-                    if verbose:
-                        print(
-                            f"Max retries reached. Unable to broadcast to node {node_id}."
-                        )
-
-    if success and verbose:
+        if wallet.node_address != my_address:
+            futures[wallet.node_id] = executor.submit(
+                post_to_peer,
+                wallet,
+                f"http://{wallet.node_address}/{endpoint}",
+                payload,
+                timeout,
+                retries,
+                backoff,
+                verbose,
+                **kwargs,
+            )
+
+    result = BroadcastResult(
+        {node_id: future.result() for node_id, future in futures.items()}
+    )
+
+    if result.success and verbose:
         print(f"Successfully broadcasted Blockchat to every node!")
 
-    return success
+    return result
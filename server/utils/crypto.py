@@ -1,36 +1,170 @@
 from Crypto.PublicKey import RSA
 from hashlib import sha256
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+
+class PrivateKey:
+    # RSA private key with its integers parsed once. When the primes are known,
+    # signing uses the Chinese Remainder Theorem (two half-size exponentiations)
+    def __init__(self, n, d, p=None, q=None):
+        self.n = n
+        self.d = d
+        self.p = p
+        self.q = q
+        if p is not None and q is not None:
+            self.dP = d % (p - 1)
+            self.dQ = d % (q - 1)
+            self.qInv = pow(q, -1, p)
+
+    @classmethod
+    def from_list(cls, private_key):
+        return cls(int(private_key[0], 16), int(private_key[1], 16))
+
+    def to_list(self):
+        return [hex(self.n), hex(self.d)]
+
+    def to_dict(self):
+        return {
+            "n": hex(self.n),
+            "d": hex(self.d),
+            "p": hex(self.p) if self.p is not None else None,
+            "q": hex(self.q) if self.q is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, key_dict):
+        p, q = key_dict["p"], key_dict["q"]
+        return cls(
+            int(key_dict["n"], 16),
+            int(key_dict["d"], 16),
+            int(p, 16) if p is not None else None,
+            int(q, 16) if q is not None else None,
+        )
+
+    def sign_int(self, message_hash):
+        if self.p is None:
+            return pow(message_hash, self.d, self.n)
+        m1 = pow(message_hash, self.dP, self.p)
+        m2 = pow(message_hash, self.dQ, self.q)
+        h = (self.qInv * (m1 - m2)) % self.p
+        return m2 + h * self.q
 
 
 def generate_key_pairs():
     keyPair = RSA.generate(bits=2048)
     public_key = [hex(keyPair.n), hex(keyPair.e)]
-    private_key = [hex(keyPair.n), hex(keyPair.d)]
+    private_key = PrivateKey(keyPair.n, keyPair.d, keyPair.p, keyPair.q)
     return public_key, private_key
 
 
-def sign_message(message, private_key):
-    message_hash = int.from_bytes(
-        sha256(message.encode("utf-8")).digest(), byteorder="big"
-    )
-    signature = pow(message_hash, int(private_key[1], 16), int(private_key[0], 16))
+@lru_cache(maxsize=4096)
+def parse_public_key(n, e):
+    # public keys travel as hex strings; every wallet's key is parsed only once
+    return int(n, 16), int(e, 16)
+
+
+def hash_message(message):
+    return sha256(message.encode("utf-8")).digest()
+
+
+def sign_digest(digest, private_key):
+    if not isinstance(private_key, PrivateKey):
+        private_key = PrivateKey.from_list(private_key)
+    signature = private_key.sign_int(int.from_bytes(digest, byteorder="big"))
     return hex(signature)
 
 
+def verify_digest(signature, public_key, digest):
+    n, e = parse_public_key(public_key[0], public_key[1])
+    hash_from_signature = pow(int(signature, 16), e, n)
+    return int.from_bytes(digest, byteorder="big") == hash_from_signature
+
+
+def sign_message(message, private_key):
+    return sign_digest(hash_message(message), private_key)
+
+
 def verify_signature(signature, public_key, message):
-    hash = int.from_bytes(sha256(message.encode("utf-8")).digest(), byteorder="big")
-    hash_from_signature = pow(
-        int(signature, 16), int(public_key[1], 16), int(public_key[0], 16)
-    )
-    return hash == hash_from_signature
+    return verify_digest(signature, public_key, hash_message(message))
+
+
+_verification_pool = None
+_verification_workers = 0
+
+
+def start_verification_pool(workers):
+    # signatures are checked on a pool of processes, so that they use every core
+    global _verification_pool, _verification_workers
+    if workers > 0 and _verification_pool is None:
+        _verification_pool = ProcessPoolExecutor(max_workers=workers)
+        _verification_workers = workers
+        # the first task forks every worker, so call this before the node starts its threads:
+        # a fork copies the locks those threads hold (see app.py and cluster.LocalCluster)
+        _verification_pool.submit(int).result()
+
+
+def verify_digest_args(args):
+    return verify_digest(*args)
+
+
+def verify_signatures(items):
+    """Verifies a list of (signature, public_key, digest) tuples, in parallel if the pool is running"""
+    if _verification_pool is None or not items:
+        return [verify_digest_args(item) for item in items]
+    chunksize = max(1, len(items) // (4 * _verification_workers))
+    return list(_verification_pool.map(verify_digest_args, items, chunksize=chunksize))
+
+
+def sign_digest_chunk(digests, private_key):
+    return [sign_digest(digest, private_key) for digest in digests]
+
+
+def sign_digests(digests, private_key):
+    """Signs a list of digests with one key, in chunks on the verification pool if it is running"""
+    if _verification_pool is None or len(digests) < 2:
+        return sign_digest_chunk(digests, private_key)
+    # one chunk per worker, so the key is sent to each worker once
+    size = -(-len(digests) // _verification_workers)
+    chunks = [digests[i : i + size] for i in range(0, len(digests), size)]
+    futures = [_verification_pool.submit(sign_digest_chunk, chunk, private_key) for chunk in chunks]
+    return [signature for future in futures for signature in future.result()]
 
 
 if __name__ == "__main__":
+    import time
+
     public_key, private_key = generate_key_pairs()
     message = "Hello World!!!"
     signature = sign_message(message, private_key)
 
-    print("private key: " + str(private_key))
+    print("private key: " + str(private_key.to_list()))
     print("public key:  " + str(public_key))
     print("signature: " + str(signature))
     print("verify signature: " + str(verify_signature(signature, public_key, message)))
+
+    # micro-benchmark against the previous implementation, which re-parsed the hex keys
+    # and did a full-size exponentiation on every call
+    def sign_message_plain(message, private_key):
+        message_hash = int.from_bytes(hash_message(message), byteorder="big")
+        signature = pow(message_hash, int(private_key[1], 16), int(private_key[0], 16))
+        return hex(signature)
+
+    def verify_signature_plain(signature, public_key, message):
+        hash_from_signature = pow(
+            int(signature, 16), int(public_key[1], 16), int(public_key[0], 16)
+        )
+        return int.from_bytes(hash_message(message), byteorder="big") == hash_from_signature
+
+    def rate(function, *args, runs=200):
+        start = time.perf_counter()
+        for _ in range(runs):
+            function(*args)
+        return runs / (time.perf_counter() - start)
+
+    private_key_list = private_key.to_list()
+    assert sign_message_plain(message, private_key_list) == signature
+    print(f"sign   before: {rate(sign_message_plain, message, private_key_list):8.0f}/s"
+          f"  after: {rate(sign_message, message, private_key):8.0f}/s")
+    print(f"verify before: {rate(verify_signature_plain, signature, public_key, message, runs=5000):8.0f}/s"
+          f"  after: {rate(verify_signature, signature, public_key, message, runs=5000):8.0f}/s")
@@ -0,0 +1,88 @@
+import threading
+
+from utils.broadcast import broadcast
+from utils.wire import use_binary, binary_request, encode_transactions
+
+
+class TransactionGossip:
+    """
+    Buffers the transactions created by this node and broadcasts them to the other nodes
+    in batches, as one /validateTransactions request per peer. A batch is sent when it
+    reaches batch_size transactions or batch_window seconds after its first transaction.
+    With batch_size <= 1 every transaction is sent on its own to /validateTransaction.
+    """
+
+    def __init__(self, batch_size=1, batch_window=0.01):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.buffer = []
+        self.state = None
+        self.timer = None
+        self.buffer_lock = threading.Lock()
+        # batches are sent one at a time so that peers receive them in order
+        self.send_lock = threading.Lock()
+
+    @property
+    def is_batched(self):
+        return self.batch_size > 1
+
+    def submit(self, transaction, state):
+        """Returns the broadcast result if the transaction was sent right away, else None"""
+        if not self.is_batched:
+            return self.send("validateTransaction", [transaction], state)
+
+        with self.buffer_lock:
+            self.state = state
+            self.buffer.append(transaction)
+            is_full = len(self.buffer) >= self.batch_size
+            if not is_full and self.timer is None:
+                self.timer = threading.Timer(self.batch_window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+        if is_full:
+            return self.flush()
+        return None
+
+    def submit_many(self, transactions, state):
+        """
+        Sends transactions created together (see /send_transactions) as one batch, after the
+        ones already buffered. Returns the broadcast result
+        """
+        if len(transactions) == 1 and not self.is_batched:
+            return self.submit(transactions[0], state)
+        if self.is_batched:
+            self.flush()
+        with self.send_lock:
+            return self.send("validateTransactions", transactions, state)
+
+    def flush(self):
+        with self.send_lock:
+            with self.buffer_lock:
+                transactions = self.buffer
+                self.buffer = []
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                state = self.state
+
+            if not transactions:
+                return None
+
+            return self.send("validateTransactions", transactions, state)
+
+    def send(self, endpoint, transactions, state):
+        if use_binary():
+            data = encode_transactions(transactions, state.public_key_to_node_id)
+            return broadcast(
+                endpoint,
+                None,
+                state.wallets,
+                state.my_wallet.node_address,
+                **binary_request(data),
+            )
+        if endpoint == "validateTransaction":
+            payload = {"transaction": transactions[0].to_dict()}
+        else:
+            payload = {"transactions": [transaction.to_dict() for transaction in transactions]}
+        return broadcast(endpoint, payload, state.wallets, state.my_wallet.node_address)
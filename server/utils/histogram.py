@@ -0,0 +1,95 @@
+import math
+
+# Latency histogram with logarithmic buckets: bucket i holds the values in
+# [MIN_VALUE * GROWTH**(i-1), MIN_VALUE * GROWTH**i), so every percentile is known within 5%
+# whatever the scale, in a few hundred counters. Histograms of several nodes are merged by
+# adding their counters.
+MIN_VALUE = 1e-4  # seconds, everything below falls in bucket 0
+GROWTH = 1.05
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = {}  # bucket -> count
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket_of(value):
+        if value < MIN_VALUE:
+            return 0
+        return int(math.log(value / MIN_VALUE) / math.log(GROWTH)) + 1
+
+    @staticmethod
+    def bucket_upper(bucket):
+        return MIN_VALUE * GROWTH**bucket
+
+    def record(self, value):
+        bucket = self.bucket_of(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (p in 0..100), capped at max"""
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.bucket_upper(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+    def rows(self):
+        """(bucket lower bound, bucket upper bound, count) for every non-empty bucket"""
+        return [
+            (self.bucket_upper(bucket - 1) if bucket else 0.0, self.bucket_upper(bucket), count)
+            for bucket, count in sorted(self.buckets.items())
+        ]
+
+    def to_dict(self):
+        return {
+            "buckets": {str(bucket): count for bucket, count in self.buckets.items()},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, histogram_dict):
+        histogram = cls()
+        histogram.buckets = {int(bucket): count for bucket, count in histogram_dict["buckets"].items()}
+        histogram.count = histogram_dict["count"]
+        histogram.total = histogram_dict["total"]
+        histogram.min = histogram_dict["min"]
+        histogram.max = histogram_dict["max"]
+        return histogram
@@ -0,0 +1,163 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from models.block import Block
+from models.blockchain import Blockchain
+from models.nonce_watermarks import NonceWatermarks
+from models.state import State
+from models.transaction import Transaction
+from utils.broadcast import get_session
+
+# Streaming initialization of the nodes by the bootstrap, as newline delimited JSON:
+#   {"type": "snapshot", ...}      the State at the head of the chain (State.chain_snapshot)
+#   {"type": "block", "block": {...}}           the block of the snapshot, then the log tail:
+#                                               the blocks committed after it, in order
+#   {"type": "transaction", "transaction": {...}}   one line per inbox transaction
+#   {"type": "end"}
+# The size of the stream depends on the number of nodes and the inbox, not on the length of
+# the chain: a node keeps the blocks from the snapshot on, and fetches nothing before it.
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+CHUNK_SIZE = 64 * 1024
+# seconds to connect, and between two chunks of the stream
+INIT_TIMEOUT = (5, 120)
+# a node joining a running cluster starts its server after it registers
+CONNECT_ATTEMPTS = 20
+CONNECT_BACKOFF = 0.5
+
+
+def init_lines(state):
+    with state.chain_lock, state.mempool_lock:
+        snapshot = state.chain_snapshot()
+        snapshot["type"] = "snapshot"
+        snapshot["init_transactions_pending"] = state.init_transactions_pending
+        head = state.blockchain.block_list[-1]
+    yield snapshot
+    yield {"type": "block", "block": head.to_dict()}
+
+    # the blocks committed since the snapshot, read from the view. The inbox is taken with
+    # the view, under mempool_lock, so it refers to the last block sent
+    with state.mempool_lock:
+        view = state.view
+        transactions = list(state.blockchain.transaction_inbox.values())
+    for block in view.get_blocks_range(head.index + 1, view.block_index):
+        yield {"type": "block", "block": block.to_dict()}
+    for transaction in transactions:
+        yield {"type": "transaction", "transaction": transaction.to_dict()}
+    yield {"type": "end"}
+
+
+def encode_stream(lines):
+    # groups the lines in chunks of about CHUNK_SIZE bytes
+    buffer = []
+    size = 0
+    for line in lines:
+        data = json.dumps(line).encode("utf-8") + b"\n"
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_lines(stream):
+    pending = b""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line:
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+def post_init_stream(state, wallet):
+    for attempt in range(CONNECT_ATTEMPTS):
+        try:
+            response = get_session(wallet.node_address).post(
+                f"http://{wallet.node_address}/receiveInitFromBootstrap",
+                data=encode_stream(init_lines(state)),
+                headers={"Content-Type": NDJSON_CONTENT_TYPE},
+                timeout=INIT_TIMEOUT,
+            )
+            if response.status_code != 200:
+                print(f"Initialization of node {wallet.node_id} failed with status code {response.status_code}")
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(CONNECT_BACKOFF)
+        except requests.exceptions.RequestException as e:
+            print(f"Initialization of node {wallet.node_id} failed: {e}")
+            return
+    print(f"Initialization of node {wallet.node_id} failed: node unreachable")
+
+
+def send_init_stream(state):
+    """Streams the initialization to every other node, each with its own reader of the chain"""
+    my_address = state.my_wallet.node_address
+    peers = [wallet for wallet in state.wallets if wallet.node_address != my_address]
+    with ThreadPoolExecutor(max_workers=max(1, len(peers)), thread_name_prefix="init-stream") as executor:
+        for wallet in peers:
+            executor.submit(post_init_stream, state, wallet)
+
+
+def receive_init_stream(lines, node_num, my_wallet, block_store=None):
+    """Builds the State of a node from the lines of an initialization stream"""
+    snapshot = next(lines)
+    if snapshot["type"] != "snapshot":
+        raise ValueError("The initialization stream must start with a snapshot")
+    wallets = State.wallets_deserialization(snapshot["wallets"])
+    blockchain = Blockchain([], snapshot["capacity"], block_store)
+    state = None
+    transactions = []
+    ended = False
+
+    for line in lines:
+        if line["type"] == "block":
+            block = Block.from_dict(line["block"])
+            if block.create_block_hash() != block.current_hash:
+                raise ValueError(f"Block with index {block.index} does not match its hash")
+            if state is None:
+                if block.current_hash != snapshot["head_hash"]:
+                    raise ValueError("The first block of the stream must be the block of the snapshot")
+                blockchain.add_block(block)
+                # a node joining a running cluster knows more nodes than the genesis had
+                state = State(blockchain, wallets, max(node_num, len(wallets)), my_wallet)
+                if my_wallet.node_id is None:
+                    # the response of /talkToBootstrap with the id has not arrived yet
+                    my_wallet.node_id = state.public_key_to_node_id[tuple(my_wallet.public_key)]
+                state.set_stakes(snapshot["stakes"], snapshot["lottery_members"])
+                state.validation_count = snapshot["validation_count"]
+                state.init_transactions_pending = snapshot["init_transactions_pending"]
+                # replays of the transactions before the snapshot are rejected with the nonces
+                # of the whole chain. The locations are indexed from the block of the snapshot on
+                blockchain.committed_nonces = NonceWatermarks.from_dict(
+                    snapshot["indexes"]["committed_nonces"]
+                )
+                state.index_block(block)
+            else:
+                if block.previous_hash != blockchain.block_list[-1].current_hash:
+                    raise ValueError(f"Block with index {block.index} does not follow the chain")
+                state.add_block(block)
+                state.replay_block(block)
+        elif line["type"] == "transaction":
+            transactions.append(Transaction.from_dict(line["transaction"]))
+        elif line["type"] == "end":
+            ended = True
+            break
+
+    if state is None or not ended:
+        raise ValueError("The initialization stream ended early")
+
+    # validated once the stakes and the lottery members are known
+    state.load_inbox(transactions)
+    state.publish_view()
+    return state
@@ -6,9 +6,10 @@ from models.blockchain import Blockchain
 from models.transaction import Transaction
 from models.wallet import PublicWallet, PrivateWallet
 from models.state import State
+from utils.broadcast import get_session
 
 
-def init_bootstrap(url, port, node_num, capacity):
+def init_bootstrap(url, port, node_num, capacity, block_store=None):
     # Create a wallet for the bootsrap
     node_id = 0
     node_address = url + ":" + port
@@ -20,7 +21,7 @@ def init_bootstrap(url, port, node_num, capacity):
     )
 
     # Initiate the blockchain
-    my_blockchain = Blockchain([], capacity)
+    my_blockchain = Blockchain([], capacity, block_store)
 
     # Create genesis_block
     index = 0
@@ -43,22 +44,58 @@ def init_bootstrap(url, port, node_num, capacity):
     # TODO add a stake
     my_state = State(my_blockchain, [my_wallet_for_state], node_num, my_wallet)
     my_state.my_nonce += 1
+    my_state.index_block(genesis_block)
+    my_state.save_snapshot()
 
     return my_state
 
 
-def init_node(url, port, bootstrap):
+def restore_node(block_store, capacity):
+    # rebuilds the State of a restarted node from the last snapshot and the blocks after it
+    snapshot = block_store.load_snapshot()
+    if snapshot is None or block_store.last_index is None:
+        return None
+
+    blockchain = Blockchain.from_block_store(block_store, capacity)
+    wallet_dict = block_store.load_wallet()
+    if wallet_dict is None:
+        # a snapshot saved with the wallet in it. The next one is saved without it
+        wallet_dict = snapshot["my_wallet"]
+    my_state = State.from_snapshot(snapshot, blockchain, PrivateWallet.from_dict(wallet_dict))
+    if "indexes" not in snapshot:
+        # a snapshot saved without the indexes: the blocks before it are indexed from the log,
+        # into an empty location log
+        block_store.load_locations(-1)
+        for block_dict in block_store.iter_block_dicts():
+            if block_dict["index"] > snapshot["block_index"]:
+                break
+            my_state.index_block(Block.from_dict(block_dict))
+    # only the blocks after the snapshot are applied again
+    for index in range(snapshot["block_index"] + 1, block_store.last_index + 1):
+        my_state.replay_block(block_store.get_block(index))
+
+    print(
+        f"Restored node {my_state.my_wallet.node_id} at block {block_store.last_index} "
+        f"from the snapshot of block {snapshot['block_index']}"
+    )
+    return my_state
+
+
+def create_node_wallet(url, port):
     # Create a wallet for the node
     node_address = url + ":" + port
+    return PrivateWallet(None, node_address)
+
 
-    my_wallet = PrivateWallet(None, node_address)
+def init_node(my_wallet, bootstrap):
+    node_address = my_wallet.node_address
 
     # send a request to the bootsrap, giving him your public key and receive your unique node_id
     try:
         payload = {"address": node_address, "public_key": my_wallet.public_key}
 
         # send to bootstrap my public key
-        response = requests.post(f"http://{bootstrap}/talkToBootstrap", json=payload)
+        response = get_session(bootstrap).post(f"http://{bootstrap}/talkToBootstrap", json=payload)
         if response.status_code == 200:
             response_json = response.json()
 
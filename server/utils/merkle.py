@@ -0,0 +1,72 @@
+from hashlib import sha256
+
+
+# prefixes of the hashes of the leaves and of the inner nodes (as in RFC 6962), so that an
+# inner node cannot be passed off as a leaf
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(leaf):
+    return sha256(LEAF_PREFIX + leaf).digest()
+
+
+def node_hash(left, right):
+    return sha256(NODE_PREFIX + left + right).digest()
+
+
+def merkle_levels(leaves):
+    """
+    Builds the levels of a Merkle tree over a list of 32-byte digests, from the hashes of the
+    leaves up to the root. The last node of a level with an odd number of nodes moves up to
+    the next level as it is: pairing it with itself would give [a, b, c] and [a, b, c, c]
+    the same root (CVE-2012-2459).
+    """
+    if not leaves:
+        return [[sha256(b"").digest()]]
+    levels = [[leaf_hash(leaf) for leaf in leaves]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        next_level = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        levels.append(next_level)
+    return levels
+
+
+def merkle_root(leaves):
+    return merkle_levels(leaves)[-1][0]
+
+
+def merkle_proof(levels, position):
+    """
+    Inclusion proof of the leaf at position: the sibling of the node on the path to the root
+    at every level where it has one, with the side it is on. Its size and cost are O(log n).
+    """
+    proof = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({"hash": level[sibling].hex(), "side": "left" if sibling < position else "right"})
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    node = leaf_hash(leaf)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        if step["side"] == "left":
+            node = node_hash(sibling, node)
+        else:
+            node = node_hash(node, sibling)
+    return node.hex() == root
+
+
+def header_hash(index, timestamp, merkle_root, validator):
+    """
+    The hash of a block (see Block.create_block_hash): its header fields, with the transactions
+    through their Merkle root. Also used by the CLI to check a block header it fetched
+    """
+    block_string = str(index) + str(timestamp) + merkle_root + str(validator)
+    return sha256(block_string.encode("utf-8")).hexdigest()
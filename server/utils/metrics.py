@@ -0,0 +1,222 @@
+import threading
+import time
+from functools import wraps
+from threading import RLock
+
+from flask import g, request
+
+from utils.histogram import LatencyHistogram
+
+# Process wide metrics, served on /metrics in the Prometheus text format. Recording a value
+# costs a logarithm and a short lock, so the metrics are always on. The nodes of a cluster run
+# in one process (see cluster.py) share them.
+
+# Histograms are LatencyHistograms, like the latencies of the load tests (see utils/run_exp.py).
+# Every EXPOSED_STEP-th of their buckets is exposed as a Prometheus bucket, each bound about
+# twice the one before, up to 10 seconds, so the exposed counts are exact
+EXPOSED_STEP = 14
+EXPOSED_BUCKETS = tuple(range(0, LatencyHistogram.bucket_of(10.0) + EXPOSED_STEP, EXPOSED_STEP))
+
+_metrics = []
+_metrics_lock = threading.Lock()
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> value
+        with _metrics_lock:
+            _metrics.append(self)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            series = list(self.series.items())
+        for label_values, value in sorted(series):
+            lines += self.expose_series(label_values, value)
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def expose_series(self, label_values, value):
+        return [f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}"]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.series[label_values] = value
+
+    def expose_series(self, label_values, value):
+        return [f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            histogram = self.series.get(label_values)
+            if histogram is None:
+                histogram = self.series[label_values] = LatencyHistogram()
+            histogram.record(value)
+
+    def time(self, *label_values):
+        return Timer(self, label_values)
+
+    def expose_series(self, label_values, histogram):
+        with self.lock:
+            buckets = sorted(histogram.buckets.items())
+            count = histogram.count
+            total = histogram.total
+        lines = []
+        cumulative = 0
+        position = 0
+        for exposed in EXPOSED_BUCKETS:
+            while position < len(buckets) and buckets[position][0] <= exposed:
+                cumulative += buckets[position][1]
+                position += 1
+            bound = format_value(LatencyHistogram.bucket_upper(exposed))
+            labels = format_labels(self.label_names, label_values, [("le", bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.label_names, label_values, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = format_labels(self.label_names, label_values)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+def timed(histogram, *label_values):
+    """Decorator observing the duration of every call of the function"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *label_values)
+        return wrapper
+    return decorator
+
+
+LOCK_WAIT_SECONDS = Histogram(
+    "blockchat_lock_wait_seconds", "Time spent waiting for a State lock", ["lock"]
+)
+LOCK_HOLD_SECONDS = Histogram(
+    "blockchat_lock_hold_seconds", "Time a State lock is held, from first acquire to last release", ["lock"]
+)
+
+
+class TimedLock:
+    """
+    A reentrant lock that records how long threads wait for it and hold it. Only the outermost
+    acquire of the owning thread is timed.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = RLock()
+        self.depth = 0  # changed only by the owner
+        self.acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        if self.depth == 0:
+            self.acquired_at = time.perf_counter()
+            LOCK_WAIT_SECONDS.observe(self.acquired_at - start, self.name)
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            LOCK_HOLD_SECONDS.observe(time.perf_counter() - self.acquired_at, self.name)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+REQUEST_SECONDS = Histogram(
+    "blockchat_http_request_duration_seconds", "Time to serve a request", ["endpoint", "method"]
+)
+REQUESTS_TOTAL = Counter(
+    "blockchat_http_requests_total", "Requests served", ["endpoint", "method", "status"]
+)
+
+
+def instrument_app(app):
+    """Times every request of the Flask app, labelled with its route"""
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, request.method)
+            REQUESTS_TOTAL.inc(endpoint, request.method, response.status_code)
+        return response
+
+
+def expose():
+    """The text of /metrics"""
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines += metric.expose()
+    return "\n".join(lines) + "\n"
@@ -1,31 +1,84 @@
 import random
 
+from utils.metrics import Histogram, timed
 
-def proof_of_stake(stakes, seed):
-
-    node_num = len(stakes)
-    all_stakes_zero = True
-    lottary = []
-    lottary.append((1, stakes[0]))
-    for i in range(1, len(stakes)):
-        if stakes[i] > 0:
-            all_stakes_zero = False
-        lottary.append((lottary[i - 1][1] + 1, lottary[i - 1][1] + stakes[i]))
-
-    total_stakes = lottary[len(stakes) - 1][1]
-    validator = 0
-    if not all_stakes_zero:
-        random.seed(seed)
-        random_number = random.randint(1, total_stakes)
-        for i in range(0, len(lottary)):
-            if random_number >= lottary[i][0] and random_number <= lottary[i][1]:
-                validator = i
-                break
-
-    # If all stakes are zero, select randomly a node id. This id is the validator of the block
-    else:
-        random.seed(seed)
-        random_number = random.randint(0, node_num - 1)
-        validator = random_number
-
-    return validator
+PROOF_OF_STAKE_SECONDS = Histogram(
+    "blockchat_proof_of_stake_seconds", "Time to select the validator of a block"
+)
+
+
+class StakeIndex:
+    """
+    Cumulative stakes of the nodes in a Fenwick tree, updated when a stake changes, so that
+    selecting the validator costs O(log N) instead of rebuilding the ranges of every node.
+    The member at position i owns the numbers (sum of stakes[:i], sum of stakes[:i + 1]] of
+    the lottery. Members are the node ids in node_ids, in the order they joined the lottery
+    (0..N-1 for the nodes of the genesis).
+    """
+
+    def __init__(self, stakes, node_ids=None):
+        self.size = len(stakes)
+        self.stakes = list(stakes)
+        self.node_ids = list(node_ids) if node_ids is not None else list(range(self.size))
+        self.positions = {node_id: position for position, node_id in enumerate(self.node_ids)}
+        self.tree = [0] * (self.size + 1)
+        # O(N) construction: every node passes its partial sum to its parent
+        for i in range(1, self.size + 1):
+            self.tree[i] += self.stakes[i - 1]
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.top_step = 1 << self.size.bit_length() if self.size else 0
+
+    def set(self, node_id, stake):
+        position = self.positions.get(node_id)
+        if position is None:
+            return  # not a member of the lottery yet
+        delta = stake - self.stakes[position]
+        self.stakes[position] = stake
+        i = position + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, node_id, stake=0):
+        # a new member: its node of the tree covers itself and the nodes below it
+        self.size += 1
+        self.stakes.append(stake)
+        self.positions[node_id] = len(self.node_ids)
+        self.node_ids.append(node_id)
+        i = self.size
+        self.tree.append(stake + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+        self.top_step = 1 << self.size.bit_length()
+
+    def prefix(self, i):
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.prefix(self.size)
+
+    def find(self, number):
+        # the first node whose cumulative stake reaches number
+        position = 0
+        step = self.top_step
+        while step:
+            next_position = position + step
+            if next_position <= self.size and self.tree[next_position] < number:
+                position = next_position
+                number -= self.tree[next_position]
+            step >>= 1
+        return position
+
+    @timed(PROOF_OF_STAKE_SECONDS)
+    def select(self, seed):
+        # a private generator: the global random module is shared by the request threads
+        generator = random.Random(seed)
+        total = self.total()
+        if total <= 0:
+            # If all stakes are zero, select randomly a node id. This id is the validator of the block
+            return self.node_ids[generator.randint(0, self.size - 1)]
+        return self.node_ids[self.find(generator.randint(1, total))]
@@ -0,0 +1,66 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+class BlockPropagator:
+    """
+    Sends the blocks this node mints to the other nodes from a dedicated thread. The block
+    is queued while the State locks are held and broadcast after the lock is released, so the
+    request thread that filled the block does not wait for the network. Blocks are sent
+    one at a time, in the order they were minted. The status of the last history blocks
+    is kept for /propagation.
+    """
+
+    def __init__(self, history=100):
+        self.queue = queue.Queue()
+        self.history = history
+        self.status = OrderedDict()  # block index -> status dict
+        self.status_lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, block, state):
+        with self.status_lock:
+            self.status[block.index] = {"status": "queued", "queued_at": time.time()}
+            while len(self.status) > self.history:
+                self.status.popitem(last=False)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="block-propagation", daemon=True
+                )
+                self.thread.start()
+        self.queue.put((block, state))
+
+    def run(self):
+        while True:
+            block, state = self.queue.get()
+            self.set_status(block.index, status="sending")
+            try:
+                result = state.broadcast_block(block)
+                if result:
+                    self.set_status(block.index, status="sent", sent_at=time.time())
+                else:
+                    failed_nodes = result.failed_nodes()
+                    print(f"Broadcast of block with index {block.index} failed for nodes {failed_nodes}")
+                    self.set_status(
+                        block.index, status="failed", sent_at=time.time(), failed_nodes=failed_nodes
+                    )
+            except Exception as e:
+                print(f"Broadcast of block with index {block.index} failed: {e}")
+                self.set_status(block.index, status="failed", error=str(e))
+            finally:
+                self.queue.task_done()
+
+    def set_status(self, index, **fields):
+        with self.status_lock:
+            if index in self.status:
+                self.status[index].update(fields)
+
+    def get_status(self):
+        with self.status_lock:
+            return {index: dict(status) for index, status in self.status.items()}
+
+    def join(self):
+        # waits until every queued block has been sent
+        self.queue.join()
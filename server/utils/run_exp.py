@@ -1,32 +1,432 @@
-from utils.send_http_request import send_http_request
+import csv
+import json
+import os
+import random
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.broadcast import get_session
+from utils.histogram import LatencyHistogram
+from utils.send_http_request import send_http_request
+from utils.submit import build_transaction, admit_transaction, submit_transactions
+
+# Load test run by every node on /runExp, started from the bootstrap on /exp_signal.
+#   closed loop: `concurrency` workers, each sends its next transaction (or `batch` of them, as
+#                /send_transactions does) once the last one was admitted
+#   open loop:   transactions are due at `rate` per second (evenly spaced, or with Poisson
+#                arrivals) whatever the responses, and sent by a pool of `concurrency` workers.
+#                Their latency counts from the time they were due, so a node that falls behind
+#                shows it in the latency instead of slowing the load down
+# A node sends `count` transactions, or as many as fit in `duration` seconds, drawn from `mix`.
+# Messages come from ../input_{node_num}/trans{node_id}.txt when it exists. Every transaction
+# is timed from its submission to the application of the block that commits it.
+exp_defaults = {
+    "mode": "closed",  # closed or open
+    "rate": 20.0,  # transactions per second of each node, open loop
+    "arrival": "uniform",  # uniform or poisson, open loop
+    "concurrency": 1,
+    "batch": 1,  # transactions per submission, closed loop (as /send_transactions)
+    "count": 100,  # transactions per node
+    "duration": None,  # seconds, replaces count when set
+    "mix": {"message": 1.0},  # share of each transaction type
+    "coins_amount": 1,
+    "stake_amount": 10,
+    "drain_timeout": 30.0,  # seconds to wait for the last transactions to be committed
+    "name": None,  # results file name, in ../runs
+}
+
+RUNS_FOLDER = "../runs"
+
+
+def parse_mix(mix):
+    # "message:0.6,coins:0.3,stake:0.1" or a dict
+    if isinstance(mix, str):
+        mix = dict(part.split(":") for part in mix.split(",") if part)
+    mix = {type: float(share) for type, share in mix.items()}
+    unknown = set(mix) - {"message", "coins", "stake"}
+    if unknown or not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Invalid transaction mix {mix}")
+    return mix
+
+
+def parse_exp_config(params):
+    """Experiment settings from the request parameters (strings from the CLI), over the defaults"""
+    config = dict(exp_defaults)
+    for key, value in params.items():
+        if key not in exp_defaults:
+            raise ValueError(f"Unknown experiment setting {key}")
+        config[key] = value
+    config["mode"] = str(config["mode"])
+    if config["mode"] not in ("closed", "open"):
+        raise ValueError(f"Unknown load mode {config['mode']}")
+    if config["arrival"] not in ("uniform", "poisson"):
+        raise ValueError(f"Unknown arrival process {config['arrival']}")
+    for key in ("rate", "drain_timeout"):
+        config[key] = float(config[key])
+    for key in ("concurrency", "batch", "count", "coins_amount", "stake_amount"):
+        config[key] = int(config[key])
+    if config["duration"] is not None:
+        config["duration"] = float(config["duration"])
+    config["mix"] = parse_mix(config["mix"])
+    return config
+
+
+def read_input(node_num, node_id):
+    # (recipient_id, message) of the lines of the input file of the node, if there is one
+    lines = []
+    try:
+        with open(f"../input_{node_num}/trans{node_id}.txt", "r") as file:
+            for line in file:
+                match = re.match(r"id(\d+)\s(.+)", line)
+                if match:
+                    lines.append((int(match.group(1)), match.group(2).strip()))
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+def plan_transactions(config, node_id, node_ids, input_lines):
+    """Endless (type, body, recipient_id) of the transactions a node sends, the same on every run"""
+    rng = random.Random(node_id)
+    types = list(config["mix"])
+    weights = [config["mix"][type] for type in types]
+    others = [other for other in node_ids if other != node_id] or [node_id]
+    position = 0
+    while True:
+        type = rng.choices(types, weights)[0]
+        if type == "message":
+            if input_lines:
+                recipient_id, message = input_lines[position % len(input_lines)]
+                position += 1
+                if recipient_id not in node_ids:
+                    recipient_id = rng.choice(others)
+            else:
+                recipient_id, message = rng.choice(others), f"load test message {position}"
+                position += 1
+            yield type, message, recipient_id
+        elif type == "coins":
+            yield type, config["coins_amount"], rng.choice(others)
+        else:
+            yield type, config["stake_amount"], 0
+
+
+class CommitTracker:
+    """
+    Times the transactions of this node from their submission to the application of their
+    block. State.update_state calls on_block for every block while it is set on the state.
+    """
+
+    def __init__(self, public_key):
+        self.public_key = public_key
+        self.lock = threading.Lock()
+        self.pending = {}  # nonce -> submission time
+        self.early = {}  # nonce -> commit time, for blocks applied before start returned
+        self.commit_latency = LatencyHistogram()
+        self.admission_latency = LatencyHistogram()
+        self.submitted = 0
+        self.admitted = 0
+        self.committed = 0
+        self.submits_per_second = {}
+        self.commits_per_second = {}
+        self.last_commit = None
+        self.drained = threading.Event()
+
+    def start(self, nonce, submit_time):
+        with self.lock:
+            self.submitted += 1
+            second = int(submit_time)
+            self.submits_per_second[second] = self.submits_per_second.get(second, 0) + 1
+            if nonce in self.early:
+                self.commit(self.early.pop(nonce), submit_time)
+            else:
+                self.pending[nonce] = submit_time
+                self.drained.clear()
+
+    def admission(self, nonce, submit_time, admitted):
+        with self.lock:
+            if admitted:
+                self.admitted += 1
+                self.admission_latency.record(time.time() - submit_time)
+            else:
+                self.pending.pop(nonce, None)
+                if not self.pending:
+                    self.drained.set()
+
+    def commit(self, commit_time, submit_time):
+        # called with the lock held
+        self.committed += 1
+        self.commit_latency.record(commit_time - submit_time)
+        second = int(commit_time)
+        self.commits_per_second[second] = self.commits_per_second.get(second, 0) + 1
+        self.last_commit = commit_time
+
+    def on_block(self, block):
+        now = time.time()
+        with self.lock:
+            for transaction in block.transactions:
+                if transaction.is_init or transaction.sender_public_key != self.public_key:
+                    continue
+                submit_time = self.pending.pop(transaction.nonce, None)
+                if submit_time is None:
+                    self.early[transaction.nonce] = now
+                else:
+                    self.commit(now, submit_time)
+            if not self.pending:
+                self.drained.set()
+
+    def wait(self, timeout):
+        return self.drained.wait(timeout)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "admitted": self.admitted,
+                "committed": self.committed,
+                "last_commit": self.last_commit,
+                "commit_latency": self.commit_latency.to_dict(),
+                "admission_latency": self.admission_latency.to_dict(),
+                "submits_per_second": {str(second): n for second, n in self.submits_per_second.items()},
+                "commits_per_second": {str(second): n for second, n in self.commits_per_second.items()},
+            }
+
+
+class LoadGenerator:
+    def __init__(self, state, transaction_gossip, config, node_num):
+        self.state = state
+        self.transaction_gossip = transaction_gossip
+        self.config = config
+        node_id = state.my_wallet.node_id
+        self.plan = plan_transactions(
+            config,
+            node_id,
+            [wallet.node_id for wallet in state.wallets],
+            read_input(node_num, node_id),
+        )
+        self.plan_lock = threading.Lock()
+        self.tracker = CommitTracker(state.my_wallet.public_key)
+        self.start_time = None
 
-def run_exp_backend(node_id, node_address, bootstrap_addr, node_num):
-    start_time = time.time()
-
-    with open(f"../input_{node_num}/trans{node_id}.txt", 'r') as file:
-        for line in file:
-            match = re.match(r'id(\d+)\s(.+)', line)
-            if match:
-                recipient_id = match.group(1)
-                message_body = match.group(2).strip()
-
-                payload = {
-                    "type": "message",
-                    "body": message_body,
-                    "recipient_id": int(recipient_id)
-                }
-
-                # TODO : may a thread is needed here
-                response = send_http_request("POST", node_address, "send_transaction", payload)
-    
-    end_time = time.time()
-    time_taken = end_time - start_time
-
-    payload = {
-        "time": time_taken,
-        "node_id": node_id
+    def next_transaction(self, index):
+        # None once the node sent all its transactions
+        if self.config["duration"] is None:
+            if index >= self.config["count"]:
+                return None
+        elif time.time() - self.start_time >= self.config["duration"]:
+            return None
+        return next(self.plan)
+
+    def send(self, planned, submit_time):
+        transaction = build_transaction(self.state, *planned)
+        self.tracker.start(transaction.nonce, submit_time)
+        admitted, _ = admit_transaction(self.state, self.transaction_gossip, transaction)
+        self.tracker.admission(transaction.nonce, submit_time, admitted)
+
+    def send_batch(self, batch, submit_time):
+        items = [
+            {"type": type, "body": body, "recipient_id": recipient_id}
+            for type, body, recipient_id in batch
+        ]
+        _, results = submit_transactions(self.state, self.transaction_gossip, items)
+        for result in results:
+            if "nonce" in result:
+                self.tracker.start(result["nonce"], submit_time)
+                self.tracker.admission(result["nonce"], submit_time, result["status"] == "success")
+
+    def run_closed(self):
+        counter = iter(range(10**12))
+
+        def worker():
+            while True:
+                with self.plan_lock:
+                    batch = []
+                    while len(batch) < self.config["batch"]:
+                        planned = self.next_transaction(next(counter))
+                        if planned is None:
+                            break
+                        batch.append(planned)
+                if not batch:
+                    return
+                if len(batch) == 1:
+                    self.send(batch[0], time.time())
+                else:
+                    self.send_batch(batch, time.time())
+
+        workers = [threading.Thread(target=worker) for _ in range(self.config["concurrency"])]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    def run_open(self):
+        rng = random.Random(self.state.my_wallet.node_id)
+        interval = 1 / self.config["rate"]
+        due = self.start_time
+        with ThreadPoolExecutor(max_workers=self.config["concurrency"]) as executor:
+            index = 0
+            while True:
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                planned = self.next_transaction(index)
+                if planned is None:
+                    break
+                executor.submit(self.send, planned, due)
+                index += 1
+                due += rng.expovariate(self.config["rate"]) if self.config["arrival"] == "poisson" else interval
+
+    def run(self):
+        self.start_time = time.time()
+        self.state.commit_tracker = self.tracker
+        try:
+            if self.config["mode"] == "open":
+                self.run_open()
+            else:
+                self.run_closed()
+            submit_end = time.time()
+            self.tracker.wait(self.config["drain_timeout"])
+        finally:
+            self.state.commit_tracker = None
+
+        result = self.tracker.to_dict()
+        result.update(
+            node_id=self.state.my_wallet.node_id,
+            start=self.start_time,
+            submit_elapsed=submit_end - self.start_time,
+        )
+        return result
+
+
+def run_exp_backend(state, transaction_gossip, config, node_num, bootstrap_addr):
+    result = LoadGenerator(state, transaction_gossip, config, node_num).run()
+    send_http_request("POST", bootstrap_addr, "endExp", result, session=get_session(bootstrap_addr))
+
+
+def steady_rate(per_second):
+    """
+    Mean rate over the seconds of the run without its first and last tenth (at least a second
+    each when there are enough), where the load ramps up and the last blocks wait to fill up
+    """
+    if not per_second:
+        return 0.0
+    first, last = min(per_second), max(per_second)
+    counts = [per_second.get(second, 0) for second in range(first, last + 1)]
+    trim = max(1, len(counts) // 10) if len(counts) >= 5 else 0
+    steady = counts[trim : len(counts) - trim]
+    return sum(steady) / len(steady)
+
+
+def summarize(results, config, exp):
+    """Merges the results of the nodes into the summary written to the runs folder"""
+    commit_latency = LatencyHistogram()
+    admission_latency = LatencyHistogram()
+    submits_per_second = {}
+    commits_per_second = {}
+    nodes = []
+    for result in sorted(results, key=lambda result: result["node_id"]):
+        node_latency = LatencyHistogram.from_dict(result["commit_latency"])
+        commit_latency.merge(node_latency)
+        admission_latency.merge(LatencyHistogram.from_dict(result["admission_latency"]))
+        for totals, key in ((submits_per_second, "submits_per_second"), (commits_per_second, "commits_per_second")):
+            for second, count in result[key].items():
+                totals[int(second)] = totals.get(int(second), 0) + count
+        node_end = result["last_commit"] or (result["start"] + result["submit_elapsed"])
+        node_elapsed = node_end - result["start"]
+        nodes.append(
+            {
+                "node_id": result["node_id"],
+                "submitted": result["submitted"],
+                "admitted": result["admitted"],
+                "committed": result["committed"],
+                "elapsed": node_elapsed,
+                "throughput": result["committed"] / node_elapsed if node_elapsed > 0 else 0.0,
+                "validated_blocks": exp["validation_count"][result["node_id"]],
+                "latency_p50": node_latency.percentile(50),
+                "latency_p99": node_latency.percentile(99),
+            }
+        )
+
+    last_commits = [result["last_commit"] for result in results if result["last_commit"]]
+    end_time = max(last_commits) if last_commits else time.time()
+    elapsed = end_time - exp["start_time"]
+    committed = sum(node["committed"] for node in nodes)
+    blocks = exp["blocks"]
+    start_second = min(list(submits_per_second) + list(commits_per_second), default=int(exp["start_time"]))
+    end_second = max(list(submits_per_second) + list(commits_per_second), default=start_second)
+
+    return {
+        "name": exp["name"],
+        "node_num": exp["node_num"],
+        "capacity": exp["capacity"],
+        "config": config,
+        "elapsed": elapsed,
+        "submitted": sum(node["submitted"] for node in nodes),
+        "admitted": sum(node["admitted"] for node in nodes),
+        "committed": committed,
+        "throughput": committed / elapsed if elapsed > 0 else 0.0,
+        "sustained_tps": steady_rate(commits_per_second),
+        "blocks": blocks,
+        "block_time": elapsed / blocks if blocks else None,
+        "commit_latency": commit_latency.summary(),
+        "admission_latency": admission_latency.summary(),
+        "commit_latency_histogram": commit_latency.rows(),
+        "timeline": [
+            (
+                second - start_second,
+                submits_per_second.get(second, 0),
+                commits_per_second.get(second, 0),
+            )
+            for second in range(start_second, end_second + 1)
+        ],
+        "nodes": nodes,
     }
 
-    send_http_request("POST", bootstrap_addr, "endExp", payload)
+
+def write_results(summary, folder_path=RUNS_FOLDER):
+    """Writes <name>.txt as before, <name>.json, <name>.csv (per second) and <name>.latency.csv"""
+    os.makedirs(folder_path, exist_ok=True)
+    base_path = os.path.join(folder_path, summary["name"])
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    latency = summary["commit_latency"]
+    with open(base_path + ".txt", "w") as f:
+        f.write(f"Elapsed time: {summary['elapsed']} seconds\n")
+        f.write(f"Throughput: {summary['throughput']} transactions/second\n")
+        f.write(f"Sustained throughput: {summary['sustained_tps']} transactions/second\n")
+        if summary["block_time"] is not None:
+            f.write(f"Block time: {summary['block_time']} seconds/block\n")
+        f.write(
+            f"Committed: {summary['committed']} of {summary['submitted']} transactions"
+            f" ({summary['admitted']} admitted)\n"
+        )
+        f.write(
+            f"Commit latency: p50 {ms(latency['p50'])}, p90 {ms(latency['p90'])},"
+            f" p99 {ms(latency['p99'])}, max {ms(latency['max'])}\n\n"
+        )
+        for node in summary["nodes"]:
+            f.write(f"Node {node['node_id']} elapsed time: {node['elapsed']} seconds\n")
+            f.write(f"Node {node['node_id']} throughput: {node['throughput']} transactions/second\n")
+            f.write(
+                f"Node {node['node_id']} commit latency: p50 {ms(node['latency_p50'])},"
+                f" p99 {ms(node['latency_p99'])}\n"
+            )
+            f.write(f"Node {node['node_id']} validated {node['validated_blocks']} blocks\n\n")
+
+    with open(base_path + ".json", "w") as f:
+        json.dump(summary, f, indent=2)
+
+    with open(base_path + ".csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["second", "submitted", "committed"])
+        writer.writerows(summary["timeline"])
+
+    with open(base_path + ".latency.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["latency_from_s", "latency_to_s", "count"])
+        writer.writerows(summary["commit_latency_histogram"])
+
+    return base_path
@@ -1,17 +1,19 @@
 import requests
 
 
-def send_http_request(method, address, endpoint, payload=None):
+def send_http_request(method, address, endpoint, payload=None, session=None):
+    # nodes pass the session of the address from utils/broadcast.get_session
+    http = requests if session is None else session
     try:
         url = f"http://{address}/{endpoint}"
         if method == "GET":
-            response = requests.get(url, params=payload)
+            response = http.get(url, params=payload)
         elif method == "POST":
-            response = requests.post(url, json=payload)
+            response = http.post(url, json=payload)
         elif method == "PUT":
-            response = requests.put(url, json=payload)
+            response = http.put(url, json=payload)
         elif method == "DELETE":
-            response = requests.delete(url)
+            response = http.delete(url)
 
         if response.status_code == 200:
             try:
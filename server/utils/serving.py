@@ -0,0 +1,70 @@
+from werkzeug.serving import make_server
+
+# How the node serves HTTP, overridden by configure_serving from the node config.
+# "dev" is Flask's development server (a new thread per request). "waitress" is a
+# production WSGI server with a fixed pool of threads and keep-alive connections, which
+# suits the gossip traffic between nodes. The State lives in the process, so there is a
+# single process in every mode.
+serving_config = {
+    "mode": "dev",
+    "threads": 16,  # waitress: threads handling requests
+    "connection_limit": 1000,  # waitress: open connections
+    "keepalive": 120,  # waitress: seconds an idle keep-alive connection stays open
+    "backlog": 1024,  # waitress: pending connections in the listen queue
+}
+
+
+def configure_serving(mode=None, threads=None, connection_limit=None, keepalive=None, backlog=None):
+    for key, value in (
+        ("mode", mode),
+        ("threads", threads),
+        ("connection_limit", connection_limit),
+        ("keepalive", keepalive),
+        ("backlog", backlog),
+    ):
+        if value is not None:
+            serving_config[key] = value
+
+
+class DevServer:
+    def __init__(self, app, host, port):
+        self.server = make_server(host, int(port), app, threaded=True)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def create_server(app, host, port):
+    """Returns a server with run() and close() for the configured mode"""
+    if serving_config["mode"] == "waitress":
+        try:
+            import waitress
+        except ImportError:
+            print("SERVER_MODE=waitress needs the waitress package, using the development server")
+        else:
+            return waitress.create_server(
+                app,
+                host=host,
+                port=int(port),
+                threads=serving_config["threads"],
+                connection_limit=serving_config["connection_limit"],
+                channel_timeout=serving_config["keepalive"],
+                backlog=serving_config["backlog"],
+                ident="Blockchat",
+            )
+    elif serving_config["mode"] != "dev":
+        raise ValueError(f"Unknown SERVER_MODE {serving_config['mode']}")
+    return DevServer(app, host, port)
+
+
+def serve(app, host, port):
+    server = create_server(app, host, port)
+    print(f"Serving on {host}:{port} ({serving_config['mode']})")
+    try:
+        server.run()
+    finally:
+        server.close()
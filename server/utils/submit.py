@@ -0,0 +1,99 @@
+def transaction_fields(state, type, body, recipient_id):
+    # (receiver_public_key, type, amount, message) of a transaction of this node
+    if type == "message":
+        return state.wallets[recipient_id].public_key, type, 0, body
+    elif type == "coins":
+        return state.wallets[recipient_id].public_key, type, int(body), ""
+    elif type == "stake":
+        return 0, type, int(body), ""
+    raise ValueError(f"unknown type {type}")
+
+
+def build_transaction(state, type, body, recipient_id):
+    recipient_public_key, type, amount, message = transaction_fields(state, type, body, recipient_id)
+
+    return state.my_wallet.create_transaction(
+        state.my_wallet.public_key,
+        recipient_public_key,
+        type,
+        amount,
+        message,
+        state.get_my_nonce(),
+    )
+
+
+def admit_transaction(state, transaction_gossip, new_transaction):
+    """Admits a transaction of this node and gossips it. Returns whether it was admitted and a status text"""
+    with state.mempool_lock:
+        # signed by this node, no need to verify the signature
+        validated, response = state.validate_transaction(new_transaction, check_signature=False)
+    state.finish_admission()
+
+    if validated:
+        result = transaction_gossip.submit(new_transaction, state)
+        if result is None:
+            response += "\nQueued for broadcast"
+        elif result:
+            response += "\nSent to all nodes"
+        else:
+            response += f"\nBroadcast of transaction failed for nodes {result.failed_nodes()}"
+    else:
+        response += "\nTransaction was not broadcasted"
+
+    return validated, response
+
+
+def submit_transaction(state, transaction_gossip, type, body, recipient_id):
+    """Creates a transaction of this node, admits it and gossips it, as /send_transaction does"""
+    new_transaction = build_transaction(state, type, body, recipient_id)
+    validated, response = admit_transaction(state, transaction_gossip, new_transaction)
+    return new_transaction, validated, response
+
+
+def submit_transactions(state, transaction_gossip, items):
+    """
+    Batched submit_transaction for /send_transactions, with {type, body, recipient_id} items: the
+    nonces are reserved at once, the transactions signed as a batch, admitted under one lock
+    acquisition and gossiped as one batch. Returns the created transactions and one result
+    per item.
+    """
+    results = [None] * len(items)
+    fields = []
+    positions = []
+    for position, item in enumerate(items):
+        try:
+            fields.append(
+                transaction_fields(state, item["type"], item["body"], int(item["recipient_id"]))
+            )
+            positions.append(position)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            results[position] = {"status": "failed", "response": f"Invalid transaction: {e!r}"}
+
+    first_nonce = state.reserve_nonces(len(fields))
+    transactions = state.my_wallet.create_transactions(
+        [field + (first_nonce + i,) for i, field in enumerate(fields)]
+    )
+
+    admitted = []
+    with state.mempool_lock:
+        for position, transaction in zip(positions, transactions):
+            # signed by this node, no need to verify the signature
+            validated, response = state.validate_transaction(transaction, check_signature=False)
+            results[position] = {
+                "nonce": transaction.nonce,
+                "status": "success" if validated else "failed",
+                "response": response,
+            }
+            if validated:
+                admitted.append(transaction)
+    state.finish_admission()
+
+    if admitted:
+        result = transaction_gossip.submit_many(admitted, state)
+        if result is not None and not result:
+            failed_nodes = result.failed_nodes()
+            for position, transaction in zip(positions, transactions):
+                if results[position]["status"] == "success":
+                    results[position]["response"] += f"\nBroadcast failed for nodes {failed_nodes}"
+
+    return transactions, results
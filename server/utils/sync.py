@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from models.block import Block
+from utils.broadcast import get_session
+from utils.wire import CONTENT_TYPE, decode_blocks
+
+# Catch-up settings, overridden by configure_sync from the node config
+sync_config = {
+    "batch_size": 200,  # blocks asked for in one /blocks request
+    "timeout": 2.0,  # seconds per /blocks request
+}
+
+
+def configure_sync(batch_size=None, timeout=None):
+    for key, value in (("batch_size", batch_size), ("timeout", timeout)):
+        if value is not None:
+            sync_config[key] = value
+
+
+def fetch_peers(state):
+    """
+    Adds the wallets of the nodes that joined after the last one this node knows, as the
+    bootstrap has them. Called without the State locks, when a request refers to a node this
+    node never heard of (its /addPeer announcement was lost)
+    """
+    bootstrap = state.wallets[0]
+    try:
+        response = get_session(bootstrap.node_address).get(
+            f"http://{bootstrap.node_address}/peers",
+            params={"after": len(state.wallets) - 1},
+            timeout=sync_config["timeout"],
+        )
+        if response.status_code != 200:
+            raise requests.exceptions.RequestException(f"status code {response.status_code}")
+        peers = response.json()["peers"]
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Fetching the peers from the bootstrap failed: {e}")
+        return
+    state.add_peers(peers)
+
+
+class BlockSync:
+    """
+    Fetches the blocks a node is missing from its peers, in ranges of batch_size blocks on
+    /blocks, from a dedicated thread. It is started when a block arrives ahead of the chain
+    (see State.validate_block). The first range is asked from every peer at once and the
+    first answer wins; the next ones go to the peer with the lowest average latency, until
+    it fails. The fetched blocks are applied in order, then the waiting room is drained.
+    """
+
+    def __init__(self):
+        self.target_index = -1
+        self.state = None
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.latencies = {}  # node_id -> average seconds per /blocks request
+        self.executor = None
+
+    def request(self, state, target_index):
+        with self.lock:
+            self.state = state
+            self.target_index = max(self.target_index, target_index)
+            if self.thread is None:
+                self.executor = ThreadPoolExecutor(thread_name_prefix="block-sync-fetch")
+                self.thread = threading.Thread(target=self.run, name="block-sync", daemon=True)
+                self.thread.start()
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            try:
+                self.catch_up()
+            except Exception as e:
+                print(f"Block sync failed: {e}")
+
+    def catch_up(self):
+        state = self.state
+        while True:
+            next_index = state.blockchain.block_list[-1].index + 1
+            with self.lock:
+                target_index = self.target_index
+            if next_index > target_index:
+                return
+            to_index = min(target_index, next_index + sync_config["batch_size"] - 1)
+            blocks = self.fetch(state, next_index, to_index)
+            if not blocks:
+                print(f"Block sync: no peer served blocks {next_index}..{to_index}")
+                return
+            applied = self.apply(state, blocks)
+            last_index = state.blockchain.block_list[-1].index
+            print(f"Block sync: applied {applied} blocks, the chain is at index {last_index}")
+            if last_index < next_index:
+                return  # a block of the range was rejected
+
+    def peers(self, state):
+        my_address = state.my_wallet.node_address
+        return [wallet for wallet in list(state.wallets) if wallet.node_address != my_address]
+
+    def fetch_from(self, state, wallet, from_index, to_index):
+        start = time.perf_counter()
+        try:
+            response = get_session(wallet.node_address).get(
+                f"http://{wallet.node_address}/blocks",
+                params={"from": from_index, "to": to_index},
+                headers={"Accept": CONTENT_TYPE},
+                timeout=sync_config["timeout"],
+            )
+            if response.status_code != 200:
+                raise requests.exceptions.RequestException(f"status code {response.status_code}")
+            if response.headers.get("Content-Type", "").startswith(CONTENT_TYPE):
+                blocks = state.decode_from_peer(decode_blocks, response.content)
+            else:
+                blocks = [Block.from_dict(block_dict) for block_dict in response.json()["blocks"]]
+        except (requests.exceptions.RequestException, ValueError):
+            self.latencies[wallet.node_id] = float("inf")
+            return None
+        latency = time.perf_counter() - start
+        last_latency = self.latencies.get(wallet.node_id)
+        if last_latency is None or last_latency == float("inf"):
+            self.latencies[wallet.node_id] = latency
+        else:
+            self.latencies[wallet.node_id] = 0.8 * last_latency + 0.2 * latency
+        return blocks
+
+    def fetch(self, state, from_index, to_index):
+        peers = self.peers(state)
+        known = [
+            wallet for wallet in peers if self.latencies.get(wallet.node_id, float("inf")) < float("inf")
+        ]
+        if known:
+            fastest = min(known, key=lambda wallet: self.latencies[wallet.node_id])
+            blocks = self.fetch_from(state, fastest, from_index, to_index)
+            if blocks:
+                return blocks
+
+        # ask every peer and keep the first answer that has blocks
+        futures = [
+            self.executor.submit(self.fetch_from, state, wallet, from_index, to_index)
+            for wallet in peers
+        ]
+        for future in as_completed(futures):
+            blocks = future.result()
+            if blocks:
+                return blocks
+        return None
+
+    def apply(self, state, blocks):
+        transactions = [transaction for block in blocks for transaction in block.transactions]
+        state.learn_peers(transactions)
+        verified = state.verify_transactions(transactions)
+        position = 0
+        applied = 0
+        with state.chain_lock:
+            for block in blocks:
+                block_verified = all(verified[position : position + len(block.transactions)])
+                position += len(block.transactions)
+                if block.index <= state.blockchain.block_list[-1].index:
+                    continue  # applied meanwhile from /validateBlock
+                if not block_verified or not state.validate_block(block, from_sync=True):
+                    break
+                applied += 1
+            state.drain_waiting_room()
+        return applied
@@ -0,0 +1,59 @@
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# In-memory transport for clusters of nodes running in one process (see cluster.py). The
+# requests between nodes all go through the sessions of utils/broadcast.get_session; with the
+# local transport these sessions hand every request to the WSGI app registered for its
+# address, in the calling thread, instead of opening a connection. Timeouts do not apply.
+_local_apps = {}  # address -> Flask app
+
+
+def register_local_node(address, app):
+    _local_apps[address] = app
+
+
+def unregister_local_node(address):
+    _local_apps.pop(address, None)
+
+
+def is_local():
+    return bool(_local_apps)
+
+
+class LocalAdapter(BaseAdapter):
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        app = _local_apps.get(url.netloc)
+        if app is None:
+            raise requests.exceptions.ConnectionError(f"No local node at {url.netloc}", request=request)
+
+        body = request.body
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = b"".join(body)  # a streamed body, e.g. the initialization stream
+        headers = dict(request.headers)
+        headers.pop("Transfer-Encoding", None)
+
+        with app.test_client() as client:
+            app_response = client.open(
+                url.path or "/",
+                method=request.method,
+                query_string=url.query,
+                headers=headers,
+                data=body,
+            )
+
+        response = requests.Response()
+        response.status_code = app_response.status_code
+        response.headers = CaseInsensitiveDict(app_response.headers)
+        response._content = app_response.get_data()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = app_response.status.split(" ", 1)[-1]
+        return response
+
+    def close(self):
+        pass
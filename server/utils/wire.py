@@ -0,0 +1,324 @@
+import json
+import struct
+
+from models.block import Block
+from models.transaction import Transaction
+
+# Compact binary encoding of transactions and blocks, used instead of JSON when the node
+# runs with WIRE_FORMAT=binary. Requests carry it with the content type below and the
+# receiving endpoints pick the decoder from the content type, so both formats are accepted.
+# Public keys of registered wallets are sent as node ids instead of two long hex strings.
+CONTENT_TYPE = "application/x-blockchat"
+
+wire_config = {"format": "json"}
+
+MAGIC = b"BC1"
+KIND_TRANSACTIONS = 1
+KIND_BLOCK = 2
+# 3 was the initialization of a node, now an NDJSON stream (see utils/init_stream.py)
+KIND_BLOCKS = 4
+
+TRANSACTION_TYPES = ["coins", "message", "stake"]
+
+# tags of the generic values
+VALUE_NONE = 0
+VALUE_HEX = 1  # an int written by hex(), e.g. key parts and signatures
+VALUE_DIGEST = 2  # a 64 character hex digest, e.g. block hashes
+VALUE_JSON = 3  # anything else
+VALUE_NODE_ID = 4  # public key of a registered wallet
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+U64 = struct.Struct(">Q")
+I64 = struct.Struct(">q")
+F64 = struct.Struct(">d")
+# nonce, type, is_init and amount of a transaction
+TRANSACTION_HEADER = struct.Struct(">QBBq")
+NODE_ID_REF = struct.Struct(">BI")
+HEX_DIGITS = set("0123456789abcdef")
+
+
+def configure_wire(format):
+    wire_config["format"] = format
+
+
+def use_binary():
+    return wire_config["format"] == "binary"
+
+
+class Writer:
+    def __init__(self, key_to_node_id=None):
+        self.parts = []
+        self.key_to_node_id = key_to_node_id or {}
+
+    def u8(self, value):
+        self.parts.append(U8.pack(value))
+
+    def u32(self, value):
+        self.parts.append(U32.pack(value))
+
+    def u64(self, value):
+        self.parts.append(U64.pack(value))
+
+    def i64(self, value):
+        self.parts.append(I64.pack(value))
+
+    def f64(self, value):
+        self.parts.append(F64.pack(value))
+
+    def raw(self, data):
+        self.parts.append(U32.pack(len(data)))
+        self.parts.append(data)
+
+    def text(self, value):
+        self.raw(value.encode("utf-8"))
+
+    def value(self, value):
+        if value is None:
+            self.u8(VALUE_NONE)
+        elif isinstance(value, str) and value.startswith("0x") and value == hex(int(value, 16)):
+            data = int(value, 16).to_bytes((len(value) - 2 + 1) // 2, "big")
+            self.u8(VALUE_HEX)
+            self.parts.append(U16.pack(len(data)))
+            self.parts.append(data)
+        elif isinstance(value, str) and len(value) == 64 and set(value) <= HEX_DIGITS:
+            self.u8(VALUE_DIGEST)
+            self.parts.append(bytes.fromhex(value))
+        else:
+            self.u8(VALUE_JSON)
+            self.text(json.dumps(value))
+
+    def public_key(self, public_key):
+        node_id = None
+        if isinstance(public_key, list):
+            node_id = self.key_to_node_id.get(tuple(public_key))
+        if node_id is not None:
+            self.parts.append(NODE_ID_REF.pack(VALUE_NODE_ID, node_id))
+        elif isinstance(public_key, list) and len(public_key) == 2:
+            self.u8(VALUE_HEX)
+            self.value(public_key[0])
+            self.value(public_key[1])
+        else:
+            self.value(public_key)
+
+    def transaction(self, transaction):
+        self.parts.append(
+            TRANSACTION_HEADER.pack(
+                transaction.nonce,
+                TRANSACTION_TYPES.index(transaction.type),
+                transaction.is_init,
+                transaction.amount,
+            )
+        )
+        self.public_key(transaction.sender_public_key)
+        self.public_key(transaction.receiver_public_key)
+        self.text(transaction.message)
+        self.value(transaction.signature)
+
+    def block(self, block):
+        self.u64(block.index)
+        self.f64(block.timestamp)
+        self.public_key(block.validator)
+        self.value(block.previous_hash)
+        self.value(block.current_hash)
+        self.u32(len(block.transactions))
+        for transaction in block.transactions:
+            self.transaction(transaction)
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class WireError(ValueError):
+    """A binary payload that cannot be decoded. The endpoints answer it with 400"""
+
+
+class UnknownNodeError(WireError):
+    """A public key sent as the node id of a wallet this node does not have"""
+
+
+class Reader:
+    def __init__(self, data, node_id_to_key=None):
+        self.data = memoryview(data)
+        self.size = len(self.data)
+        self.offset = 0
+        # node ids are resolved by key_lookup
+        self.node_id_to_key = node_id_to_key if node_id_to_key is not None else key_lookup([])
+
+    def take(self, length):
+        # slices past the end are cut short instead of failing like unpack_from
+        offset = self.offset
+        end = offset + length
+        if end > self.size:
+            raise WireError("The payload is cut short")
+        self.offset = end
+        return self.data[offset:end]
+
+    def unpack(self, fmt):
+        (value,) = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return value
+
+    def u8(self):
+        return self.unpack(U8)
+
+    def u32(self):
+        return self.unpack(U32)
+
+    def u64(self):
+        return self.unpack(U64)
+
+    def i64(self):
+        return self.unpack(I64)
+
+    def f64(self):
+        return self.unpack(F64)
+
+    def raw(self):
+        return bytes(self.take(self.u32()))
+
+    def text(self):
+        return str(self.take(self.u32()), "utf-8")
+
+    def value(self, tag=None):
+        if tag is None:
+            tag = self.data[self.offset]
+            self.offset += 1
+        if tag == VALUE_HEX:
+            # what hex() wrote, without going through an int: the bytes have no leading zero
+            # byte, so at most one leading zero digit is stripped
+            return "0x" + (self.take(self.unpack(U16)).hex().lstrip("0") or "0")
+        if tag == VALUE_NONE:
+            return None
+        if tag == VALUE_DIGEST:
+            return self.take(32).hex()
+        if tag == VALUE_JSON:
+            return json.loads(self.text())
+        raise WireError(f"Unknown value tag {tag}")
+
+    def public_key(self):
+        tag = self.data[self.offset]
+        if tag == VALUE_NODE_ID:
+            _, node_id = NODE_ID_REF.unpack_from(self.data, self.offset)
+            self.offset += NODE_ID_REF.size
+            return self.node_id_to_key(node_id)
+        self.offset += 1
+        if tag == VALUE_HEX:
+            return [self.value(), self.value()]
+        return self.value(tag)
+
+    def transaction(self):
+        nonce, type, is_init, amount = TRANSACTION_HEADER.unpack_from(self.data, self.offset)
+        self.offset += TRANSACTION_HEADER.size
+        if type >= len(TRANSACTION_TYPES):
+            raise WireError(f"Unknown transaction type {type}")
+        sender_public_key = self.public_key()
+        receiver_public_key = self.public_key()
+        message = self.text()
+        signature = self.value()
+        return Transaction(
+            sender_public_key,
+            receiver_public_key,
+            TRANSACTION_TYPES[type],
+            amount,
+            message,
+            nonce,
+            signature,
+            is_init,
+        )
+
+    def block(self):
+        index = self.u64()
+        timestamp = self.f64()
+        validator = self.public_key()
+        previous_hash = self.value()
+        current_hash = self.value()
+        transactions = [self.transaction() for _ in range(self.u32())]
+        return Block(index, timestamp, transactions, validator, previous_hash, current_hash)
+
+
+def key_lookup(wallets):
+    def node_id_to_key(node_id):
+        if node_id >= len(wallets):
+            raise UnknownNodeError(f"Unknown node id {node_id}")
+        return wallets[node_id].public_key
+
+    return node_id_to_key
+
+
+def check_header(reader, kind):
+    if reader.size < 4 or bytes(reader.data[:3]) != MAGIC or reader.data[3] != kind:
+        raise WireError("Not a Blockchat binary payload of the expected kind")
+    reader.offset = 4
+
+
+def decode(data, kind, read, node_id_to_key=None):
+    reader = Reader(data, node_id_to_key)
+    check_header(reader, kind)
+    try:
+        result = read(reader)
+    except (struct.error, IndexError) as e:
+        raise WireError("The payload is cut short") from e
+    except UnicodeDecodeError as e:
+        raise WireError(f"Invalid text: {e}") from e
+    except WireError:
+        raise
+    except ValueError as e:  # JSON values
+        raise WireError(f"Invalid value: {e}") from e
+    if reader.offset != reader.size:
+        raise WireError("Unexpected bytes after the payload")
+    return result
+
+
+def encode_transactions(transactions, key_to_node_id):
+    writer = Writer(key_to_node_id)
+    writer.parts.append(MAGIC + U8.pack(KIND_TRANSACTIONS))
+    writer.u32(len(transactions))
+    for transaction in transactions:
+        writer.transaction(transaction)
+    return writer.getvalue()
+
+
+def decode_transactions(data, wallets):
+    return decode(
+        data,
+        KIND_TRANSACTIONS,
+        lambda reader: [reader.transaction() for _ in range(reader.u32())],
+        key_lookup(wallets),
+    )
+
+
+def encode_block(block, key_to_node_id):
+    writer = Writer(key_to_node_id)
+    writer.parts.append(MAGIC + U8.pack(KIND_BLOCK))
+    writer.block(block)
+    return writer.getvalue()
+
+
+def decode_block(data, wallets):
+    return decode(data, KIND_BLOCK, Reader.block, key_lookup(wallets))
+
+
+def encode_blocks(blocks, key_to_node_id):
+    # a range of blocks, as served by /blocks
+    writer = Writer(key_to_node_id)
+    writer.parts.append(MAGIC + U8.pack(KIND_BLOCKS))
+    writer.u32(len(blocks))
+    for block in blocks:
+        writer.block(block)
+    return writer.getvalue()
+
+
+def decode_blocks(data, wallets):
+    return decode(
+        data,
+        KIND_BLOCKS,
+        lambda reader: [reader.block() for _ in range(reader.u32())],
+        key_lookup(wallets),
+    )
+
+
+def binary_request(data):
+    # keyword arguments of broadcast / requests for a binary body
+    return {"data": data, "headers": {"Content-Type": CONTENT_TYPE}}